@@ -0,0 +1,159 @@
+"""Load test of the control API against a fake EarTrumpet on loopback.
+
+Starts `swap.py --background` in a sandbox (see sandbox.py) with api_port and
+api_token set, then has --clients threads send --requests requests each, mixing
+every endpoint. Prints the latency per endpoint as seen by the client and by the
+server (elapsed_ms), the status codes and the throughput, and checks that
+requests without the right token, and requests a web page could send (an Origin
+header, a foreign Host header, a POST that is not JSON), are refused.
+
+    python bench/api_load.py
+    python bench/api_load.py --clients 32 --requests 100 --workers 8 --devices 500
+
+Exits with 1 if any answer is neither 200 nor 503, or one of those requests is accepted.
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sandbox import Sandbox, summarize
+
+TOKEN = "bench-token"
+APPS = ['chrome', 'Spotify', 'obs64', 'Discord']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_profiles(count, devices):
+    return {f"Profile-{i}": {'rules': [{'app_name': app, 'device': f"Device {(i + j) * 2 % devices:05d}"}
+                                       for j, app in enumerate(APPS)]}
+            for i in range(count)}
+
+
+def call(port, method, path, body=None, token=TOKEN, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+    if token is not None:
+        headers['Authorization'] = f"Bearer {token}"
+    t0 = time.perf_counter()
+    try:
+        data = body if isinstance(body, str) or body is None else json.dumps(body)
+        conn.request(method, path, data, headers)
+        response = conn.getresponse()
+        data = response.read()
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - t0
+    try:
+        server_ms = json.loads(data).get('elapsed_ms')
+    except ValueError:
+        server_ms = None
+    return response.status, elapsed, server_ms
+
+
+def wait_for_port(port, proc, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--requests', type=int, default=50, help="requests per client")
+    parser.add_argument('--workers', type=int, default=4, help="api_workers of the server")
+    parser.add_argument('--profiles', type=int, default=20, help="profiles in audio_profiles.json")
+    parser.add_argument('--devices', type=int, default=64, help="devices listed by the fake EarTrumpet")
+    parser.add_argument('--set-delay', type=float, default=0.01, help="seconds per fake --set call")
+    args = parser.parse_args()
+
+    port = free_port()
+    env = {'FAKE_DEVICES': str(args.devices), 'FAKE_APPS': ';'.join(APPS), 'FAKE_SET_DELAY': str(args.set_delay)}
+    settings = {'api_port': port, 'api_token': TOKEN, 'api_workers': args.workers, 'device_poll_interval': 5}
+    with Sandbox(make_profiles(args.profiles, args.devices), settings, env) as box:
+        with open(box.path('swap.log'), 'w') as log:
+            server = box.popen('swap.py', '--background', stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_for_port(port, server):
+                print("The control API did not start; swap.log:")
+                with open(box.path('swap.log')) as f:
+                    print(f.read())
+                return 1
+            return run_load(port, args)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def run_load(port, args):
+    names = [f"Profile-{i}" for i in range(args.profiles)]
+    mix = [('GET', '/profiles', None), ('GET', '/devices', None), ('GET', '/apps', None),
+           ('POST', '/validate', 'profiles'), ('POST', '/activate', 'profile')]
+
+    def client(index):
+        results = []
+        for n in range(args.requests):
+            method, path, field = mix[(index + n) % len(mix)]
+            name = names[(index * args.requests + n) % len(names)]
+            body = None if field is None else ({'profiles': [name]} if field == 'profiles' else {'profile': name})
+            results.append((f"{method} {path}",) + call(port, method, path, body))
+        return results
+
+    # One warm-up request so the first device listing is not counted against the load
+    call(port, 'GET', '/devices')
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = [result for batch in pool.map(client, range(args.clients)) for result in batch]
+    wall = time.perf_counter() - t0
+
+    statuses = Counter(status for _, status, _, _ in results)
+    by_endpoint = defaultdict(list)
+    server_ms = defaultdict(list)
+    for endpoint, status, elapsed, ms in results:
+        if status == 200:
+            by_endpoint[endpoint].append(elapsed)
+            if ms is not None:
+                server_ms[endpoint].append(ms / 1000)
+    print(f"{len(results)} requests from {args.clients} clients in {wall:.2f} s "
+          f"({len(results) / wall:.0f} requests/s), api_workers={args.workers}")
+    print("Status codes: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    for endpoint in sorted(by_endpoint):
+        print(f"{endpoint:16} client {summarize(by_endpoint[endpoint])}")
+        if server_ms[endpoint]:
+            print(f"{'':16} server {summarize(server_ms[endpoint])}")
+
+    refused = [call(port, 'GET', '/profiles', token=None)[0], call(port, 'GET', '/profiles', token='x' * len(TOKEN))[0],
+               call(port, 'GET', '/profiles', token=TOKEN + 'x')[0]]
+    print(f"Requests with a missing or wrong token: {refused} (expected 401)")
+    activate = json.dumps({'profile': names[0]})
+    from_pages = [call(port, 'POST', '/activate', activate, headers={'Content-Type': 'text/plain'})[0],
+                  call(port, 'POST', '/activate', {'profile': names[0]}, headers={'Origin': 'https://example.com'})[0],
+                  call(port, 'GET', '/profiles', headers={'Host': f"rebound.example.com:{port}"})[0]]
+    print(f"Requests a web page could send (text/plain POST, Origin, foreign Host): {from_pages} "
+          "(expected 415, 403, 403)")
+    if (any(status not in (200, 503) for status in statuses) or any(status != 401 for status in refused)
+            or from_pages != [415, 403, 403]):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""How long the SWAP window stops responding during a 100-rule activation.
+
+Opens the window in a sandbox (see sandbox.py) with the fake EarTrumpet, then runs
+one profile of --rules rules (one app each) while a Tk callback re-arms itself
+every millisecond; a gap between two callbacks is time the window could not redraw
+or react. Compares:
+  - background: start_activation, as the Activate button does (executor worker,
+    progress through root.after);
+  - blocking: apply_profile called on the Tk thread, as the button used to do.
+Reports the gaps against the 16 ms frame budget. Needs a display: on a headless
+Linux run it under xvfb-run; without one it is skipped.
+
+    python bench/bench_activation_frames.py
+    xvfb-run python bench/bench_activation_frames.py --rules 300 --set-delay 0.02
+"""
+
+import argparse
+import sys
+import time
+
+from sandbox import Sandbox, has_display, ignore_window_icons, summarize
+
+PROFILE = 'Bench'
+FRAME_BUDGET = 0.016
+
+
+def make_profiles(rules):
+    return {PROFILE: {'rules': [{'app_name': f"app{i:03d}", 'device': 'Device 00000'} for i in range(rules)]}}
+
+
+def measure(app, start, done):
+    """Call `start` from the Tk loop; return (seconds, gaps between ticks) until `done()`."""
+    root = app.root
+    gaps = []
+    state = {}
+
+    def tick():
+        now = time.perf_counter()
+        gaps.append(now - state['last'])
+        state['last'] = now
+        if done():
+            state['end'] = now
+            root.quit()
+        else:
+            root.after(1, tick)
+
+    def begin():
+        state['start'] = state['last'] = time.perf_counter()
+        start()
+        root.after(1, tick)
+
+    root.after_idle(begin)
+    root.mainloop()
+    return state['end'] - state['start'], gaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=100)
+    parser.add_argument('--set-delay', type=float, default=0.01, help="seconds per fake --set call")
+    args = parser.parse_args()
+
+    if not has_display():
+        print("Skipped: no display (run under xvfb-run)")
+        return 0
+    apps = [f"app{i:03d}" for i in range(args.rules)]
+    env = {'FAKE_APPS': ';'.join(apps), 'FAKE_SET_DELAY': str(args.set_delay)}
+    with Sandbox(make_profiles(args.rules), env=env) as box:
+        swap = box.import_module('swap')
+        ignore_window_icons(swap)
+        app = swap.AudioProfileManager()
+        try:
+            app.root.update()
+            # List the apps once, so both runs start from the same app labels
+            app.refresh_app_labels(max_age=0)
+            print(f"{args.rules} rules, {args.set_delay * 1000:g} ms per EarTrumpet call; "
+                  f"frame budget {FRAME_BUDGET * 1000:g} ms")
+            finished = {}
+            runs = (('background', lambda: app.start_activation(PROFILE, reason='benchmark'),
+                     lambda: app.activation_cancel is None),
+                    ('blocking', lambda: finished.update(applied=app.apply_profile(PROFILE)),
+                     lambda: 'applied' in finished))
+            for name, start, done in runs:
+                elapsed, gaps = measure(app, start, done)
+                over = [gap for gap in gaps if gap > FRAME_BUDGET]
+                print(f"{name:10} {elapsed:.2f} s; gaps {summarize(gaps)}")
+                print(f"{'':10} {len(over)} of {len(gaps)} gap(s) over budget, longest {max(gaps) * 1000:.0f} ms")
+        finally:
+            app.history.close()
+            app.root.destroy()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
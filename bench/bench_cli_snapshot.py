@@ -0,0 +1,95 @@
+"""Latency of `swap-cli.py PROFILE` with and without the running GUI's state snapshot.
+
+Publishes swap_state.bin in a sandbox (see sandbox.py) the way a running SWAP does
+(profiles as loaded, the running apps), then times whole swap-cli.py processes:
+  - snapshot: the profile is read from the memory-mapped snapshot and the running
+    apps are taken from it, so neither audio_profiles.json nor the process list is read;
+  - file: swap_state.bin removed, so audio_profiles.json is parsed and the process
+    list walked, as without a running GUI.
+The activated profile routes this process's app for both directions; --profiles pads
+audio_profiles.json with other profiles. Also checks that a profile that is in the
+file but invalid is reported as invalid, with or without the snapshot.
+
+    python bench/bench_cli_snapshot.py
+    python bench/bench_cli_snapshot.py --profiles 10000 --runs 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from sandbox import Sandbox, current_process_name, summarize
+
+PROFILE = 'Bench'
+INVALID = 'Broken'
+
+
+def make_profiles(app, count, rules_per_profile):
+    profiles = {PROFILE: {'rules': [
+        {'app_name': app, 'device': 'Device 00000', 'device_id': 'Fake\\Device\\Device 00000\\Render',
+         'direction': 'Render'},
+        {'app_name': app, 'device': 'Device 00001', 'device_id': 'Fake\\Device\\Device 00001\\Capture',
+         'direction': 'Capture'}]},
+        INVALID: {'rules': 'not a list'}}
+    for p in range(count):
+        profiles[f"Other-{p:05d}"] = {'rules': [{'app_name': f"app{r:03d}.exe", 'device': f"Device {r % 4:05d}"}
+                                                for r in range(rules_per_profile)]}
+    return profiles
+
+
+def publish_snapshot(box, app):
+    swap_common = box.import_module('swap_common')
+    path = box.path('audio_profiles.json')
+    config, _ = swap_common.load_profiles_config(path)
+    st = os.stat(path)
+    swap_common.write_state_snapshot(swap_common.STATE_FILE, config['profiles'], [], {app.lower()},
+                                     (st.st_mtime_ns, st.st_size), 3600, config.get('soundvolumeview_path', ''))
+
+
+def time_activations(box, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = box.run_cli(PROFILE)
+        samples.append(time.perf_counter() - t0)
+        if result.returncode != 0:
+            raise RuntimeError(f"swap-cli.py {PROFILE} exited with {result.returncode}:\n{result.stdout}{result.stderr}")
+    return samples
+
+
+def check_invalid(box):
+    result = box.run_cli(INVALID)
+    if result.returncode != 1 or "is invalid" not in result.stdout:
+        raise RuntimeError(f"swap-cli.py {INVALID} did not report an invalid profile:\n{result.stdout}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1000, help="profiles besides the activated one")
+    parser.add_argument('--rules-per-profile', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    app = current_process_name()
+    with Sandbox(make_profiles(app, args.profiles, args.rules_per_profile), env={'FAKE_APPS': app}) as box:
+        print(f"'{PROFILE}' (2 rules) among {args.profiles + 2} profiles; {args.runs} run(s) each")
+        try:
+            publish_snapshot(box, app)
+            check_invalid(box)
+            snapshot = time_activations(box, args.runs)
+            os.remove(box.path('swap_state.bin'))
+            check_invalid(box)
+            from_file = time_activations(box, args.runs)
+        except RuntimeError as e:
+            print(f"FAILED: {e}")
+            return 1
+        print(f"snapshot: {summarize(snapshot)}")
+        print(f"file:     {summarize(from_file)}")
+        print(f"median speedup: {sorted(from_file)[len(from_file) // 2] / sorted(snapshot)[len(snapshot) // 2]:.2f}x")
+        print(f"'{INVALID}' reported as invalid with and without the snapshot")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Benchmark of `swap-cli.py PROFILE` with and without a compiled plan (--compile).
+
+Times whole swap-cli.py processes against the fake SoundVolumeView (see sandbox.py):
+  - normal: reads audio_profiles.json, deduplicates the rules, walks the running
+    processes and sends one /SetAppDefault per rule;
+  - plan: after `swap-cli.py --compile PROFILE`, sends the plan's commands directly;
+    audio_profiles.json is only checked by its size and modification time.
+The activated profile routes this process's app for both directions, plus an app
+that is not running; --other-profiles pads audio_profiles.json with other profiles,
+which only the normal path has to parse. Checks that the plan survives the app that
+is not running, and that it is dropped once a device command fails.
+
+    python bench/bench_compiled_plan.py
+    python bench/bench_compiled_plan.py --other-profiles 10000 --set-delay 0.01 --runs 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from sandbox import Sandbox, current_process_name, summarize
+
+PROFILE = 'Bench'
+CLOSED_APP = 'closed-app.exe'
+
+
+def make_profiles(app, others, rules_per_profile):
+    profiles = {PROFILE: {'rules': [
+        {'app_name': app, 'device': 'Device 00000', 'device_id': 'Fake\\Device\\Device 00000\\Render',
+         'direction': 'Render'},
+        {'app_name': app, 'device': 'Device 00001', 'device_id': 'Fake\\Device\\Device 00001\\Capture',
+         'direction': 'Capture'},
+        {'app_name': CLOSED_APP, 'device': 'Device 00000', 'device_id': 'Fake\\Device\\Device 00000\\Render',
+         'direction': 'Render'}]}}
+    for p in range(others):
+        profiles[f"Other-{p:05d}"] = {'rules': [{'app_name': f"app{r:03d}.exe", 'device': f"Device {r % 4:05d}"}
+                                                for r in range(rules_per_profile)]}
+    return profiles
+
+
+def time_activations(box, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = box.run_cli(PROFILE)
+        samples.append(time.perf_counter() - t0)
+        if result.returncode != 0:
+            raise RuntimeError(f"swap-cli.py {PROFILE} exited with {result.returncode}:\n{result.stdout}{result.stderr}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--other-profiles', type=int, default=1000, help="profiles besides the activated one")
+    parser.add_argument('--rules-per-profile', type=int, default=10)
+    parser.add_argument('--set-delay', type=float, default=0.0, help="seconds per fake routing call")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    app = current_process_name()
+    profiles = make_profiles(app, args.other_profiles, args.rules_per_profile)
+    env = {'FAKE_APPS': app, 'FAKE_SET_DELAY': str(args.set_delay)}
+    with Sandbox(profiles, env=env) as box:
+        print(f"'{PROFILE}' (3 rules, one for an app that is not running) among {len(profiles)} profiles; "
+              f"{args.set_delay * 1000:g} ms per routing call; {args.runs} run(s) each")
+        try:
+            normal = time_activations(box, args.runs)
+            compiled = box.run_cli('--compile', PROFILE)
+            if compiled.returncode != 0:
+                print(f"FAILED: --compile exited with {compiled.returncode}:\n{compiled.stdout}{compiled.stderr}")
+                return 1
+            print(compiled.stdout.strip())
+            plan = time_activations(box, args.runs)
+        except RuntimeError as e:
+            print(f"FAILED: {e}")
+            return 1
+        plan_file = os.path.join(box.path('plans'), f"{PROFILE}.plan.json")
+        if not os.path.exists(plan_file):
+            print("FAILED: the compiled plan was dropped, so the last runs took the normal path")
+            return 1
+        # Without Device 00001 the Capture command fails: the plan must go
+        box.run_cli(PROFILE, env={'FAKE_DEVICES': '1'})
+        if os.path.exists(plan_file):
+            print("FAILED: the compiled plan was kept after a device command failed")
+            return 1
+        print("Plan kept with an app not running, removed after a failed device command")
+        print(f"normal: {summarize(normal)}")
+        print(f"plan:   {summarize(plan)}")
+        print(f"median speedup: {sorted(normal)[len(normal) // 2] / sorted(plan)[len(plan) // 2]:.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
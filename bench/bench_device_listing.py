@@ -0,0 +1,84 @@
+"""Benchmark of the streaming device listing on a synthetic 10k-line EarTrumpet output.
+
+Compares, against the fake EarTrumpet (see sandbox.py) printing --devices lines:
+  - buffered: subprocess.run with capture_output, then splitlines and parse, as SWAP
+    used to do; nothing can be shown before the whole listing is read;
+  - streaming: EarTrumpetBackend.list_devices grouped by iter_batches, as the
+    Devices tab now fills; reports the time to the first batch and to the last;
+  - early exit: stop at the first device line, as the executable check does.
+
+    python bench/bench_device_listing.py
+    python bench/bench_device_listing.py --devices 50000 --line-delay 0.00005 --runs 3
+
+--line-delay makes the fake pause after each line, like a slow audio driver.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+from sandbox import Sandbox, summarize
+
+
+def buffered(swap, exe):
+    t0 = time.perf_counter()
+    result = subprocess.run([exe, '--list-devices'], capture_output=True, text=True, check=False)
+    devices = [device for device in map(swap.parse_device_line, (line.strip() for line in result.stdout.splitlines()))
+               if device]
+    total = time.perf_counter() - t0
+    return total, total, len(devices)
+
+
+def streaming(swap, exe):
+    backend = swap.EarTrumpetBackend(exe)
+    t0 = time.perf_counter()
+    first = None
+    count = 0
+    for batch in swap.iter_batches(backend.list_devices()):
+        if first is None:
+            first = time.perf_counter() - t0
+        count += len(batch)
+    return first, time.perf_counter() - t0, count
+
+
+def early_exit(swap, exe):
+    t0 = time.perf_counter()
+    lines = swap.iter_eartrumpet_lines(exe, '--list-devices')
+    try:
+        for line in lines:
+            if swap.parse_device_line(line):
+                break
+    finally:
+        lines.close()
+    elapsed = time.perf_counter() - t0
+    return elapsed, elapsed, 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=10000, help="device lines printed by the fake EarTrumpet")
+    parser.add_argument('--line-delay', type=float, default=0.0, help="seconds the fake waits after each line")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    env = {'FAKE_DEVICES': str(args.devices)}
+    if args.line_delay:
+        env['FAKE_LINE_DELAY'] = str(args.line_delay)
+    with Sandbox(env=env) as box:
+        swap = box.import_module('swap')
+        swap.COMMAND_TIMEOUTS.update(list_devices=None)
+        print(f"{args.devices} device lines, {args.line_delay * 1000:g} ms per line, {args.runs} run(s) each")
+        for name, method in (('buffered', buffered), ('streaming', streaming), ('early exit', early_exit)):
+            firsts, totals = [], []
+            for _ in range(args.runs):
+                first, total, count = method(swap, box.eartrumpet)
+                firsts.append(first)
+                totals.append(total)
+            print(f"{name:10} first device: {summarize(firsts)}")
+            print(f"{'':10} whole list:   {summarize(totals)} ({count} device(s))")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
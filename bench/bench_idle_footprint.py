@@ -0,0 +1,99 @@
+"""Resident memory and idle CPU of a running SWAP: `swap.py --background`, and the window.
+
+Starts SWAP in a sandbox (see sandbox.py) against the fake EarTrumpet with the default
+device polling, lets it settle, then samples it with psutil over an idle period:
+  - RSS (mean and max of one sample per second) and USS at the end;
+  - CPU time of SWAP itself and of the tools it started (the device polls), as a
+    percentage of one core;
+  - thread count.
+The window (`swap.py` with no argument) is measured too when a display is available
+(e.g. under xvfb-run); otherwise only the background mode is.
+
+    python bench/bench_idle_footprint.py
+    xvfb-run python bench/bench_idle_footprint.py --idle 60 --profiles 1000
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+import psutil
+
+from sandbox import Sandbox, has_display
+
+APPS = ['chrome', 'Spotify', 'obs64', 'Discord']
+
+
+def make_profiles(count, rules_per_profile):
+    return {f"Profile-{p}": {'rules': [{'app_name': f"{APPS[r % len(APPS)]}{r // len(APPS) or ''}",
+                                        'device': f"Device {(p + r) % 8 * 2:05d}"}
+                                       for r in range(rules_per_profile)]}
+            for p in range(count)}
+
+
+def measure(box, args, settle, idle):
+    """Start swap.py with `args`, wait `settle` seconds, then sample it for `idle` seconds."""
+    with open(box.path('swap.log'), 'a') as log:
+        proc = box.popen('swap.py', *args, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        process = psutil.Process(proc.pid)
+        time.sleep(settle)
+        if proc.poll() is not None:
+            raise RuntimeError(f"swap.py {' '.join(args)} exited with {proc.returncode}")
+        cpu_start = process.cpu_times()
+        t0 = time.perf_counter()
+        rss = []
+        while time.perf_counter() - t0 < idle:
+            rss.append(process.memory_info().rss)
+            time.sleep(1.0)
+        cpu_end = process.cpu_times()
+        wall = time.perf_counter() - t0
+        uss = process.memory_full_info().uss
+        threads = process.num_threads()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    own = (cpu_end.user + cpu_end.system) - (cpu_start.user + cpu_start.system)
+    # Children are only counted once reaped, which SWAP does right after each poll
+    tools = ((cpu_end.children_user + cpu_end.children_system)
+             - (cpu_start.children_user + cpu_start.children_system))
+    return {'rss_mean': sum(rss) / len(rss), 'rss_max': max(rss), 'uss': uss, 'threads': threads,
+            'own_cpu': own / wall * 100, 'tools_cpu': tools / wall * 100}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--rules-per-profile', type=int, default=20)
+    parser.add_argument('--settle', type=float, default=5.0, help="seconds after start before sampling")
+    parser.add_argument('--idle', type=float, default=30.0, help="seconds sampled")
+    parser.add_argument('--poll-interval', type=float, default=5.0, help="device_poll_interval of SWAP")
+    args = parser.parse_args()
+
+    modes = [('background', ['--background'])]
+    if has_display():
+        modes.append(('window', []))
+    settings = {'device_poll_interval': args.poll_interval}
+    profiles = make_profiles(args.profiles, args.rules_per_profile)
+    with Sandbox(profiles, settings, {'FAKE_APPS': ';'.join(APPS)}) as box:
+        print(f"{args.profiles * args.rules_per_profile} rules in {args.profiles} profiles; device poll every "
+              f"{args.poll_interval:g} s; {args.idle:g} s idle after {args.settle:g} s")
+        for name, swap_args in modes:
+            try:
+                result = measure(box, swap_args, args.settle, args.idle)
+            except RuntimeError as e:
+                print(f"FAILED: {e}; swap.log:")
+                with open(box.path('swap.log')) as f:
+                    print(f.read())
+                return 1
+            print(f"{name:10} RSS mean {result['rss_mean'] / 2 ** 20:.1f} MiB, max {result['rss_max'] / 2 ** 20:.1f} MiB, "
+                  f"USS {result['uss'] / 2 ** 20:.1f} MiB, {result['threads']} threads")
+            print(f"{'':10} CPU {result['own_cpu']:.2f}% of a core, device polls {result['tools_cpu']:.2f}%")
+        if len(modes) == 1:
+            print("window     skipped: no display (run under xvfb-run to compare)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Cost of matching pattern rules against the running apps, as the pattern count grows.
+
+For each pattern count, builds a profile of glob rules (each with its own literal
+text, e.g. D:\\Games\\Title00042\\*) plus a few regexes, and matches the same set of
+apps (name and process path each) with:
+  - indexed: PatternMatcher, as activations do;
+  - naive: every compiled pattern tried against every name and path.
+The indexed cost per app should stay about flat while the naive one grows with
+the number of patterns.
+
+    python bench/bench_pattern_matching.py
+    python bench/bench_pattern_matching.py --counts 10 100 1000 10000 100000 --apps 500
+"""
+
+import argparse
+import sys
+import time
+
+from sandbox import Sandbox
+
+REGEXES = 5
+
+
+def make_rules(count):
+    rules = [{'app_name': f"D:\\Games\\Title{i:05d}\\*", 'match': 'glob', 'device': f"Device {i % 8}"}
+             for i in range(count - REGEXES)]
+    rules += [{'app_name': rf"(tool|helper){i}\.exe", 'match': 'regex', 'device': 'Device 0'} for i in range(REGEXES)]
+    return rules
+
+
+def make_targets(count):
+    """[(app, [name, path])]: every tenth app is a game some glob matches."""
+    targets = []
+    for j in range(count):
+        name = f"proc{j:04d}.exe"
+        folder = f"D:\\Games\\Title{j * 7:05d}" if j % 10 == 0 else f"C:\\Program Files\\Vendor{j}"
+        targets.append((name, [name, f"{folder}\\{name}"]))
+    return targets
+
+
+def best_of(runs, func):
+    best = float('inf')
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--apps', type=int, default=300, help="running apps to match")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--naive-limit', type=int, default=10000, help="skip the naive matcher above this count")
+    args = parser.parse_args()
+
+    with Sandbox() as box:
+        swap_common = box.import_module('swap_common')
+        targets = make_targets(args.apps)
+        print(f"{args.apps} apps (name and path each), best of {args.runs} run(s); microseconds per app")
+        print(f"{'patterns':>9} {'build ms':>9} {'indexed':>9} {'naive':>9} {'matched':>8}")
+        for count in args.counts:
+            rules = [swap_common.Rule.from_json(rule) for rule in make_rules(count)]
+            build, matcher = best_of(1, lambda: swap_common.PatternMatcher(rules))
+            indexed, found = best_of(args.runs, lambda: matcher.match(targets))
+            naive_text = '-'
+            if count <= args.naive_limit:
+                compiled = [(swap_common.compile_pattern(rule.match, rule.app_name), rule) for rule in rules]
+
+                def naive():
+                    found = {}
+                    for app, texts in targets:
+                        for regex, rule in compiled:
+                            if any(regex.fullmatch(text) for text in texts):
+                                found[(app, rule.get('direction') or 'Render')] = rule
+                    return found
+                naive_time, naive_found = best_of(max(1, args.runs // 2), naive)
+                naive_text = f"{naive_time / args.apps * 1e6:9.1f}"
+                if naive_found != found:
+                    print(f"FAILED: indexed and naive matching disagree for {count} patterns")
+                    return 1
+            print(f"{count:9} {build * 1000:9.1f} {indexed / args.apps * 1e6:9.1f} {naive_text:>9} {len(found):8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
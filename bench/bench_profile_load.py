@@ -0,0 +1,116 @@
+"""Load time and memory of a 100k-rule audio_profiles.json: plain dicts vs. Rule objects.
+
+Writes synthetic profile files whose rules carry the redundant fields older files
+have (device, name, device_name, item_id), then compares:
+  - dicts: json.load, the nested dicts SWAP used to keep;
+  - parse: loads_json alone (orjson when it is installed), the parser the loader uses;
+  - rules: load_profiles_config, the validating loader producing interned Rule objects.
+Two files are loaded: "shared", where profiles reuse the same rules (as sets of similar
+profiles do) and identical rules become one Rule, and "distinct", where every rule
+differs, the loader's worst case. Memory is what stays allocated after loading (and
+the peak while loading), measured with tracemalloc. Finally each file is written back
+and reloaded, and the rules must come back equal.
+
+    python bench/bench_profile_load.py
+    python bench/bench_profile_load.py --profiles 2000 --rules-per-profile 100 --runs 3
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from sandbox import Sandbox, summarize
+
+APPS = 200
+DEVICES = 40
+
+
+def make_profiles(count, rules_per_profile, distinct=False):
+    profiles = {}
+    for p in range(count):
+        rules = []
+        for r in range(rules_per_profile):
+            device = f"Speakers {(p + r) % DEVICES} (Virtual Audio Device)"
+            app = f"app{p:05d}-{r:03d}.exe" if distinct else f"app{(p * 7 + r) % APPS:03d}.exe"
+            rules.append({'app_name': app, 'device': device, 'name': device,
+                          'device_name': device, 'item_id': '', 'direction': 'Render' if r % 4 else 'Capture'})
+        profiles[f"Profile-{p:05d}"] = {'rules': rules}
+    return profiles
+
+
+def measure(load):
+    """(seconds, bytes still allocated, peak bytes) of one call of `load`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    gc.collect()
+    t0 = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - t0
+    # Freed only after the clock stopped
+    del result
+    return elapsed, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1000)
+    parser.add_argument('--rules-per-profile', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    with Sandbox() as box:
+        swap_common = box.import_module('swap_common')
+        path = box.path('audio_profiles.json')
+        print(f"{args.profiles * args.rules_per_profile} rules in {args.profiles} profiles; orjson "
+              f"{'installed' if swap_common.orjson is not None else 'not installed'}")
+
+        def load_dicts():
+            with open(path) as f:
+                return json.load(f)
+
+        def parse():
+            with open(path) as f:
+                return swap_common.loads_json(f.read())
+
+        def load_rules():
+            return swap_common.load_profiles_config(path)
+
+        for dataset in ('shared', 'distinct'):
+            profiles = make_profiles(args.profiles, args.rules_per_profile, distinct=dataset == 'distinct')
+            with open(path, 'w') as f:
+                json.dump({'profiles': profiles}, f, indent=2)
+            del profiles
+            print(f"{dataset} rules, {os.path.getsize(path) / 2 ** 20:.1f} MiB:")
+            for name, load in (('dicts', load_dicts), ('parse', parse), ('rules', load_rules)):
+                samples = []
+                for _ in range(args.runs):
+                    seconds, current, peak = measure(load)
+                    samples.append(seconds)
+                print(f"  {name:5} load: {summarize(samples)}")
+                print(f"  {'':5} memory: {current / 2 ** 20:.1f} MiB kept, {peak / 2 ** 20:.1f} MiB peak")
+
+            config, invalid = load_rules()
+            loaded = config['profiles']
+            swap_common.write_profile_file(path, loaded, list(loaded))
+            again, _ = load_rules()
+            same = all([rule.to_json() for rule in loaded[name]['rules']]
+                       == [rule.to_json() for rule in again['profiles'][name]['rules']] for name in loaded)
+            print(f"  Round trip through write_profile_file: {'identical' if same and not invalid else 'DIFFERENT'}")
+            failed = failed or not same or bool(invalid)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Benchmark of a 100k-rule activation on the in-memory SimulatedBackend.
+
+Runs AudioProfileManager.apply_profile (analysis, grouping per app, batched routing,
+routing state and history) on one synthetic profile, with no audio stack and no
+EarTrumpet processes, so it measures the profile engine itself. Each app gets a
+Render and a Capture rule, so no rule is overridden by another. The simulator
+lists no apps and accepts any name, so the saved app names are used as labels.
+
+    python bench/bench_simulator_activation.py
+    python bench/bench_simulator_activation.py --rules 200000 --latency 0.0001 --runs 1
+"""
+
+import argparse
+import sys
+import time
+
+from sandbox import Sandbox, summarize
+
+DEVICES = 32
+
+
+def make_rules(count):
+    rules = []
+    for i in range(count // 2):
+        app = f"app{i:06d}.exe"
+        rules.append({'app_name': app, 'device': f"Output {i % DEVICES}", 'direction': 'Render'})
+        rules.append({'app_name': app, 'device': f"Input {i % DEVICES}", 'direction': 'Capture'})
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the simulator sleeps per call")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with Sandbox(settings={'backend': 'simulator'}) as box:
+        swap = box.import_module('swap')
+        swap_common = box.import_module('swap_common')
+        rules = make_rules(args.rules)
+        devices = ([{'name': f"Output {i}", 'direction': 'Render'} for i in range(DEVICES)]
+                   + [{'name': f"Input {i}", 'direction': 'Capture'} for i in range(DEVICES)])
+
+        app = swap.AudioProfileManager(headless=True)
+        t0 = time.perf_counter()
+        app.profiles = {'Big': swap_common.decode_profile({'rules': rules})}
+        print(f"{len(rules)} rules over {len(rules) // 2} apps and {len(devices)} devices; "
+              f"decoded in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        durations = []
+        for _ in range(args.runs):
+            backend = swap.SimulatedBackend(devices, latency=args.latency)
+            app.backend = backend
+            app.app_resolver = swap.AppLabelResolver()
+            t0 = time.perf_counter()
+            applied = app.apply_profile('Big')
+            durations.append(time.perf_counter() - t0)
+            print(f"applied {applied} of {len(rules)} rule(s) in {durations[-1]:.2f} s "
+                  f"({applied / durations[-1]:,.0f} rules/s), {backend.calls} backend call(s)")
+            if applied != len(rules):
+                print("FAILED: not every rule was applied")
+                return 1
+        print(f"activation: {summarize(durations)}")
+        app.history.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
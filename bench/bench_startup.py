@@ -0,0 +1,106 @@
+"""Time to the first interactive SWAP window, with and without the device cache.
+
+Starts the window in a fresh Python process per run, in a sandbox (see sandbox.py)
+with a slow fake EarTrumpet, and reports from process start:
+  - window: AudioProfileManager built and the first update_idletasks done, i.e. the
+    window can be drawn and used;
+  - devices: the first devices shown, from device_cache.json when it exists, else
+    from EarTrumpet's listing.
+"cold" runs have no device_cache.json; "cached" runs start from the one the last cold
+run saved. Needs a display: on a headless Linux run it under xvfb-run; without one
+it is skipped.
+
+    python bench/bench_startup.py
+    xvfb-run python bench/bench_startup.py --devices 200 --line-delay 0.02 --runs 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from sandbox import Sandbox, has_display, summarize
+
+# Runs in the child: marks are time.time() values, comparable with the parent's
+DRIVER = '''
+import json, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sandbox import ignore_window_icons
+import swap
+ignore_window_icons(swap)
+marks = {}
+app = swap.AudioProfileManager()
+
+def window_ready():
+    app.root.update_idletasks()
+    marks['window'] = time.time()
+    wait_for_devices()
+
+def wait_for_devices():
+    if app.devices and 'devices' not in marks:
+        marks['devices'] = time.time()
+    # A cold start also waits until the complete list is saved for the next start
+    if 'devices' in marks and os.path.exists(swap.INVENTORY_CACHE_FILE):
+        print(json.dumps(marks), flush=True)
+        os._exit(0)
+    app.root.after(5, wait_for_devices)
+
+# Queued before run() queues the device refresh, so it fires first once the loop is idle
+app.root.after_idle(window_ready)
+app.root.after(60000, lambda: os._exit(1))
+app.run()
+'''
+
+
+def start(box):
+    """One window start: (seconds to the window, seconds to the device list)."""
+    t0 = time.time()
+    result = subprocess.run([sys.executable, box.path('startup_driver.py')], cwd=box.dir, env=box.env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"the window did not start:\n{result.stdout}{result.stderr}")
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return marks['window'] - t0, marks['devices'] - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=50, help="devices listed by the fake EarTrumpet")
+    parser.add_argument('--line-delay', type=float, default=0.01, help="seconds the fake waits after each line")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if not has_display():
+        print("Skipped: no display (run under xvfb-run)")
+        return 0
+    env = {'FAKE_DEVICES': str(args.devices), 'FAKE_LINE_DELAY': str(args.line_delay)}
+    with Sandbox(env=env) as box:
+        with open(box.path('startup_driver.py'), 'w') as f:
+            f.write(DRIVER)
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox.py')) as src, \
+                open(box.path('sandbox.py'), 'w') as f:
+            f.write(src.read())
+        cache = box.path('device_cache.json')
+        print(f"{args.devices} devices, EarTrumpet listing {args.devices * args.line_delay * 1000:g} ms; "
+              f"{args.runs} run(s) each")
+        try:
+            for mode in ('cold', 'cached'):
+                windows, devices = [], []
+                for _ in range(args.runs):
+                    if mode == 'cold' and os.path.exists(cache):
+                        os.remove(cache)
+                    window, listed = start(box)
+                    windows.append(window)
+                    devices.append(listed)
+                print(f"{mode:6} window:  {summarize(windows)}")
+                print(f"{'':6} devices: {summarize(devices)}")
+        except RuntimeError as e:
+            print(f"FAILED: {e}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
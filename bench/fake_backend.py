@@ -0,0 +1,110 @@
+"""Stand-in for EarTrumpet.exe and SoundVolumeView.exe, used by the benchmarks and tests.
+
+Answers the commands SWAP sends (--list-devices, --list-apps, --set, /scomma,
+/SetAppDefault) from its environment instead of an audio stack:
+
+  FAKE_DEVICES     number of devices, alternately Render and Capture (default 4)
+  FAKE_APPS        ';'-separated audio apps (default chrome;Spotify;obs64;Discord)
+  FAKE_LINE_DELAY  seconds slept after each listing line
+  FAKE_SET_DELAY   seconds slept by each routing call
+  FAKE_HANG        sleep forever when this argument is given ('*' for every command)
+  FAKE_PID_FILE    append the process id here before doing anything
+  FAKE_TRACE       append "start|end <pid> <time>" lines for routing calls here, each
+                   followed by the call's arguments, all separated by tabs
+"""
+
+import csv
+import os
+import sys
+import time
+
+FOREVER = 24 * 3600
+
+
+def devices():
+    count = int(os.environ.get('FAKE_DEVICES', '4'))
+    return [(f"Device {i:05d}", 'Render' if i % 2 == 0 else 'Capture') for i in range(count)]
+
+
+def apps():
+    return [app for app in os.environ.get('FAKE_APPS', 'chrome;Spotify;obs64;Discord').split(';') if app]
+
+
+def device_id(name, direction):
+    return f"Fake\\Device\\{name}\\{direction}"
+
+
+def trace(event, args):
+    path = os.environ.get('FAKE_TRACE')
+    if path:
+        # One write per line on an O_APPEND descriptor, so concurrent callers never interleave
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            fields = [event, str(os.getpid()), f"{time.time():.6f}"] + args
+            os.write(fd, ('\t'.join(fields) + '\n').encode('utf-8'))
+        finally:
+            os.close(fd)
+
+
+def set_routes(args, routes, known_devices):
+    """Apply [(app, device)]; exit code 1 if an app or device is unknown, like the real tools."""
+    trace('start', args)
+    if os.environ.get('FAKE_SET_DELAY'):
+        time.sleep(float(os.environ['FAKE_SET_DELAY']))
+    trace('end', args)
+    known_apps = {app.lower() for app in apps()}
+    if any(app.lower() not in known_apps or device.lower() not in known_devices for app, device in routes):
+        return 1
+    return 0
+
+
+def main(args):
+    if os.environ.get('FAKE_PID_FILE'):
+        with open(os.environ['FAKE_PID_FILE'], 'a') as f:
+            f.write(f"{os.getpid()}\n")
+    hang = os.environ.get('FAKE_HANG')
+    if hang and (hang == '*' or hang in args):
+        time.sleep(FOREVER)
+    if not args:
+        return 1
+    delay = float(os.environ.get('FAKE_LINE_DELAY', '0'))
+    command = args[0]
+    if command == '--help':
+        print("Usage: EarTrumpet --list-devices | --list-apps | --set <app> <device> [--set <app> <device> ...]")
+        return 0
+    if command == '--list-devices':
+        for name, direction in devices():
+            print(f"{'[Playback]' if direction == 'Render' else '[Recording]'} {name}", flush=bool(delay))
+            if delay:
+                time.sleep(delay)
+        return 0
+    if command == '--list-apps':
+        for app in apps():
+            print(app, flush=bool(delay))
+            if delay:
+                time.sleep(delay)
+        return 0
+    if command == '--set':
+        if len(args) % 3 or any(flag != '--set' for flag in args[::3]):
+            return 2
+        routes = [(args[i + 1], args[i + 2]) for i in range(0, len(args), 3)]
+        return set_routes(args, routes, {name.lower() for name, _ in devices()})
+    if command == '/scomma':
+        with open(args[1], 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Name', 'Type', 'Direction', 'Device Name', 'Command-Line Friendly ID', 'Process Path'])
+            for name, direction in devices():
+                writer.writerow([name, 'Device', direction, 'Fake', device_id(name, direction), ''])
+            for app in apps():
+                writer.writerow([app, 'Application', 'Render', '', '', f"C:\\Apps\\{app}.exe"])
+        return 0
+    if command == '/SetAppDefault':
+        if len(args) != 4:
+            return 2
+        return set_routes(args, [(args[3], args[1])],
+                          {device_id(name, direction).lower() for name, direction in devices()})
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,135 @@
+"""A throwaway SWAP install for the benchmarks and tests in this folder.
+
+SWAP keeps its settings, profiles, locks and caches next to its scripts, so every
+run copies swap.py, swap-cli.py and swap_common.py into a temporary folder, with
+fake_backend.py standing in for EarTrumpet and SoundVolumeView (see its docstring
+for the FAKE_* variables). Nothing is written into the repository.
+"""
+
+import importlib
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = ('swap.py', 'swap-cli.py', 'swap_common.py')
+
+
+def current_process_name():
+    """Name SWAP sees for this Python process: an 'app' that is always running."""
+    import psutil
+    return psutil.Process().name()
+
+
+def has_display():
+    """True if Tk can open a window here (on a headless Linux, run under xvfb-run)."""
+    import tkinter
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        return False
+    root.destroy()
+    return True
+
+
+def ignore_window_icons(swap):
+    """Make `swap`'s windows skip their .ico icon, which only Tk on Windows can load."""
+    if os.name != 'nt':
+        swap.tk.Wm.iconbitmap = lambda *args, **kwargs: None
+
+
+class Sandbox:
+    """Temporary folder with the SWAP scripts, config.ini, audio_profiles.json and the fake tools."""
+
+    def __init__(self, profiles=None, settings=None, env=None, timeouts=None):
+        self.dir = tempfile.mkdtemp(prefix='swap-bench-')
+        for name in SCRIPTS:
+            shutil.copy(os.path.join(REPO_DIR, name), self.dir)
+        shutil.copy(os.path.join(BENCH_DIR, 'fake_backend.py'), self.dir)
+        self.eartrumpet = self._fake_tool('EarTrumpet')
+        self.soundvolumeview = self._fake_tool('SoundVolumeView')
+        self.env = dict(os.environ, **(env or {}))
+        self.write_settings(settings or {}, timeouts)
+        self.write_profiles(profiles or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _fake_tool(self, name):
+        script = self.path('fake_backend.py')
+        if os.name == 'nt':
+            path = self.path(name + '.cmd')
+            with open(path, 'w') as f:
+                f.write(f'@"{sys.executable}" "{script}" %*\n')
+        else:
+            # A copy with this interpreter as its shebang: one process per call, like the real tool
+            path = self.path(name)
+            with open(script, 'r') as src, open(path, 'w') as f:
+                f.write(f"#!{sys.executable}\n" + src.read())
+            os.chmod(path, 0o755)
+        return path
+
+    def write_settings(self, settings, timeouts=None):
+        """Write config.ini: [App] `settings` over the sandbox defaults, and [Timeouts] if given."""
+        values = {'eartrumpet_path': self.eartrumpet, 'soundvolumeview_path': self.soundvolumeview,
+                  'device_poll_interval': '0'}
+        values.update(settings)
+        with open(self.path('config.ini'), 'w') as f:
+            f.write("[App]\n" + "".join(f"{key} = {value}\n" for key, value in values.items()))
+            if timeouts:
+                f.write("[Timeouts]\n" + "".join(f"{key} = {value}\n" for key, value in timeouts.items()))
+
+    def write_profiles(self, profiles):
+        config = {'eartrumpet_path': self.eartrumpet, 'soundvolumeview_path': self.soundvolumeview,
+                  'profiles': profiles}
+        with open(self.path('audio_profiles.json'), 'w') as f:
+            json.dump(config, f)
+
+    def run_cli(self, *args, env=None, timeout=300):
+        """Run swap-cli.py in the sandbox and return the CompletedProcess."""
+        return subprocess.run([sys.executable, self.path('swap-cli.py'), *args], cwd=self.dir,
+                              env=dict(self.env, **(env or {})), capture_output=True, text=True, timeout=timeout)
+
+    def popen(self, script, *args, env=None, **kwargs):
+        return subprocess.Popen([sys.executable, self.path(script), *args], cwd=self.dir,
+                                env=dict(self.env, **(env or {})), **kwargs)
+
+    def import_module(self, name):
+        """Import one of the sandbox's modules in this process (its files then land in the sandbox)."""
+        if sys.path[0] != self.dir:
+            sys.path.insert(0, self.dir)
+        os.environ.update(self.env)
+        for module_name in ('swap', 'swap_common', name.replace('-', '_')):
+            # Modules imported from an earlier sandbox would keep using its folder
+            module = sys.modules.get(module_name)
+            if module is not None and os.path.dirname(os.path.abspath(module.__file__)) != self.dir:
+                del sys.modules[module_name]
+        if name.replace('-', '_') != name:
+            spec = importlib.util.spec_from_file_location(name.replace('-', '_'), self.path(name + '.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+        return importlib.import_module(name)
+
+
+def summarize(samples):
+    """min/median/p95/max of a list of seconds, as a 'x.xx ms' string."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return (f"min {ordered[0] * 1000:.2f} ms, median {statistics.median(ordered) * 1000:.2f} ms, "
+            f"p95 {p95 * 1000:.2f} ms, max {ordered[-1] * 1000:.2f} ms (n={len(ordered)})")
@@ -0,0 +1,119 @@
+"""Stress test of overlapping activations: many swap-cli.py processes at once.
+
+Starts --processes `swap-cli.py PROFILE` invocations together against the fake
+SoundVolumeView (see sandbox.py), while a thread keeps rewriting
+audio_profiles.json under its lock the way the GUI's save does. Then checks that:
+  - no two routing calls ran at the same time (the activation lock held);
+  - every process either activated its profile (exit 0) or was superseded (exit 4),
+    so none read a half-written profile file;
+  - routing_state.json ends with the route the last routing call set.
+
+    python bench/stress_cli_activations.py
+    python bench/stress_cli_activations.py --processes 100 --set-delay 0.05
+
+Exits with 1 if a check fails.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from sandbox import Sandbox, current_process_name
+
+EXIT_OK = 0
+EXIT_SUPERSEDED = 4
+
+
+def make_profiles(app, count):
+    return {f"Profile-{i}": {'rules': [{'app_name': app, 'device': f"Device {i * 2:05d}",
+                                        'device_id': f"Fake\\Device\\Device {i * 2:05d}\\Render"}]}
+            for i in range(count)}
+
+
+def read_trace(path):
+    """[(start, end, args)] of the routing calls, in start order."""
+    starts = {}
+    calls = []
+    with open(path) as f:
+        for line in f:
+            event, pid, stamp, *args = line.rstrip('\n').split('\t')
+            if event == 'start':
+                starts[pid] = (float(stamp), args)
+            else:
+                started, call_args = starts.pop(pid)
+                calls.append((started, float(stamp), call_args))
+    return sorted(calls)
+
+
+def rewrite_profiles(box, profiles, stop, counter):
+    swap_common = box.import_module('swap_common')
+    extra = {'soundvolumeview_path': box.soundvolumeview}
+    while not stop.is_set():
+        with swap_common.profile_lock(swap_common.PROFILE_FILE):
+            swap_common.write_profile_file(swap_common.PROFILE_FILE, profiles, list(profiles), extra=extra)
+        counter['rewrites'] += 1
+        time.sleep(0.005)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=50, help="concurrent swap-cli.py processes")
+    parser.add_argument('--profiles', type=int, default=10, help="distinct profiles they activate")
+    parser.add_argument('--set-delay', type=float, default=0.02, help="seconds per fake routing call")
+    args = parser.parse_args()
+
+    app = current_process_name()
+    profiles = make_profiles(app, args.profiles)
+    env = {'FAKE_DEVICES': str(2 * args.profiles), 'FAKE_APPS': app, 'FAKE_SET_DELAY': str(args.set_delay)}
+    with Sandbox(profiles, env=env) as box:
+        trace_path = box.path('trace.txt')
+        box.env['FAKE_TRACE'] = trace_path
+        stop = threading.Event()
+        counter = Counter()
+        writer = threading.Thread(target=rewrite_profiles, args=(box, profiles, stop, counter))
+        writer.start()
+        t0 = time.perf_counter()
+        try:
+            procs = [box.popen('swap-cli.py', f"Profile-{i % args.profiles}", stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+                     for i in range(args.processes)]
+            outputs = [proc.communicate(timeout=600)[0] for proc in procs]
+        finally:
+            stop.set()
+            writer.join()
+        wall = time.perf_counter() - t0
+
+        codes = Counter(proc.returncode for proc in procs)
+        calls = read_trace(trace_path)
+        overlaps = [(a, b) for a, b in zip(calls, calls[1:]) if b[0] < a[1]]
+        with open(box.path('routing_state.json')) as f:
+            current = json.load(f)['current']
+        final_device = current.get(f"{app.lower()}|Render", {}).get('device_id')
+        last_device = calls[-1][2][1] if calls else None
+
+        print(f"{args.processes} processes in {wall:.2f} s; {counter['rewrites']} profile file rewrites meanwhile")
+        print("Exit codes: " + ", ".join(f"{code}: {count}" for code, count in sorted(codes.items())))
+        print(f"Routing calls: {len(calls)} (a call per process without coalescing: {args.processes})")
+        print(f"Overlapping routing calls: {len(overlaps)}")
+        print(f"Final route: {final_device} (last routing call: {last_device})")
+
+        failed = False
+        for proc, output in zip(procs, outputs):
+            if proc.returncode not in (EXIT_OK, EXIT_SUPERSEDED):
+                print(f"FAILED: {' '.join(proc.args[1:])} exited with {proc.returncode}:\n{output}")
+                failed = True
+        if overlaps:
+            print(f"FAILED: routing calls overlapped, e.g. {overlaps[0]}")
+            failed = True
+        if final_device != last_device:
+            print("FAILED: routing_state.json does not match the last routing call")
+            failed = True
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,66 +2,605 @@ import os
 import sys
 import json
 import subprocess
-import psutil
-import re
+import hashlib
+import csv
+import configparser
+import tempfile
+import time
+import sqlite3
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from swap_common import (
+    BASE_DIR_SETTINGS, PROFILE_FILE, SETTINGS_FILE, INVENTORY_CACHE_FILE, HISTORY_FILE, PROFILE_NAME_REGEX,
+    TIMED_OUT, CONFLICT_POLICIES, NDJSON_EXTENSIONS, PROFILER,
+    read_timeouts, iter_profile_file, compile_pattern, expand_pattern_rules, encode_json, load_profiles_config,
+    profiles_to_save, import_profile_stream, write_profile_file, rule_device_label, profile_lock, ActivationQueue,
+    acquire_activation,
+    RoutingState, ActivationHistory, open_state_snapshot, profiled,
+)
 
-def get_base_path():
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
+VALIDATION_CHUNK_SIZE = 100
+PLAN_DIR = os.path.join(BASE_DIR_SETTINGS, "plans")
+PLAN_VERSION = 1
+# Exit code of an activation cut short (or skipped) by a newer one
+EXIT_SUPERSEDED = 4
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[int(index)]
+
+
+def dedupe_rules(rules):
+    """Drop duplicate rules and rules overridden by a later rule for the same app and direction.
+
+    Same result as executing every rule in order (the last one wins), with fewer spawns.
+    """
+    winners = {}
+    for idx, rule in enumerate(rules):
+        winners[((rule.get('app_name') or '').lower(), rule.get('direction') or 'Render')] = idx
+    return [rules[idx] for idx in sorted(winners.values())]
+
+
+def process_targets():
+    """Running processes to match pattern rules against: [(name, [name, path])]."""
+    import psutil
+    targets = {}
+    for p in psutil.process_iter(['name', 'exe']):
+        name = p.info.get('name')
+        if name:
+            texts = targets.setdefault(name, [name])
+            exe = p.info.get('exe')
+            if exe and exe not in texts:
+                texts.append(exe)
+    return list(targets.items())
 
-BASE_DIR_SETTINGS = get_base_path()
-PROFILE_FILE = os.path.join(BASE_DIR_SETTINGS, "audio_profiles.json")
-PROFILE_NAME_REGEX = re.compile(r'^[A-Za-z0-9-]+$')
 
 class AudioProfileManager:
     def __init__(self):
         self.profiles = {}
+        self.invalid_profiles = {}  # name -> (profile as read, reason)
         self.soundvolumeview_path = "SoundVolumeView.exe"
         self.config_file = PROFILE_FILE
+        self.snapshot = None
+        self.running_apps = None
+        self.routing_state = RoutingState()
+        settings = configparser.ConfigParser()
+        settings.read(SETTINGS_FILE)
+        self.timeouts = read_timeouts(settings)
+        self.timed_out = []  # rules killed by their timeout in the last apply
+        self.not_running = []  # rules skipped in the last apply because their app was not running
+        self.history = ActivationHistory()
+        self.activation_queue = ActivationQueue()
+        self.last_activation = None  # QueuedCancel of the last apply_profile / rollback
 
+    @profiled('load_config')
     def load_config(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                config = json.load(f)
-            if not isinstance(config, dict) or 'profiles' not in config or not isinstance(config['profiles'], dict):
-                raise ValueError("Not a valid audio_profiles.json")
-            self.profiles = config.get('profiles', {})
-            self.soundvolumeview_path = config.get('soundvolumeview_path', self.soundvolumeview_path)
+        # Prefer the running GUI's snapshot while it still matches audio_profiles.json
+        snapshot = open_state_snapshot()
+        if snapshot is not None:
+            if snapshot.profiles_match(self.config_file):
+                self.snapshot = snapshot
+                self.soundvolumeview_path = snapshot.soundvolumeview_path or self.soundvolumeview_path
+                if snapshot.apps_fresh():
+                    self.running_apps = snapshot.apps()
+                return
+            snapshot.close()
+        self.read_profile_file()
 
-    def apply_profile(self, profile_name):
+    def read_profile_file(self):
+        with profile_lock(self.config_file):
+            config, self.invalid_profiles = read_profile_config(self.config_file)
+        self.profiles = config['profiles']
+        self.soundvolumeview_path = config.get('soundvolumeview_path', self.soundvolumeview_path)
+
+    def get_profile_rules(self, profile_name):
+        if self.snapshot is not None:
+            rules = self.snapshot.profile_rules(profile_name)
+            if rules is not None:
+                return rules
+            # Invalid profiles are not published: only the file can tell why it is missing
+            self.snapshot.close()
+            self.snapshot = None
+            self.read_profile_file()
         if profile_name not in self.profiles:
+            return None
+        return self.profiles[profile_name]['rules']
+
+    @profiled('apply_profile')
+    def apply_profile(self, profile_name):
+        rules = self.get_profile_rules(profile_name)
+        if rules is None:
+            return 0
+        self.last_activation = cancel_event = self.activation_queue.request()
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            return 0
+        try:
+            rules = dedupe_rules(rules)
+            if any(rule.get('match') for rule in rules):
+                # One process walk (names and paths) for every pattern of the profile
+                rules = expand_pattern_rules(rules, process_targets())
+            self.routing_state.push_snapshot(profile_name)
+            applied_count = self.apply_rules(rules, profile_name, 'cli', cancel_event)
+            self.routing_state.save()
+        finally:
+            lock.release()
+        return applied_count
+
+    @profiled('apply_plan')
+    def apply_plan(self, plan):
+        """Run a compiled plan (see compile_plan) as-is: no profile parsing, no pattern matching."""
+        profile_name = plan['profile']
+        self.soundvolumeview_path = plan.get('soundvolumeview_path', self.soundvolumeview_path)
+        self.last_activation = cancel_event = self.activation_queue.request()
+        lock = acquire_activation(cancel_event)
+        if lock is None:
             return 0
-        rules = self.profiles[profile_name]['rules']
+        try:
+            self.routing_state.push_snapshot(profile_name)
+            applied_count = self.apply_rules(plan['rules'], profile_name, 'plan', cancel_event)
+            self.routing_state.save()
+        finally:
+            lock.release()
+        return applied_count
+
+    def apply_rules(self, rules, profile_name, source, cancel_event=None):
+        """Apply rules in order, log the activation to the history and return the applied count.
+
+        Stops before the next rule once `cancel_event` is set (a newer activation was queued).
+        Rules of apps not in the process list are skipped and collected in `not_running`.
+        """
+        started = time.time()
+        t0 = time.perf_counter()
+        if self.running_apps is None:
+            # One process walk per activation instead of one per rule
+            import psutil
+            self.running_apps = {p.info['name'].lower() for p in psutil.process_iter(['name']) if p.info.get('name')}
         applied_count = 0
+        self.timed_out = []
+        self.not_running = []
+        results = []
+        timings = []
         for rule in rules:
-            if self.execute_rule(rule):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            rule_start = time.perf_counter()
+            result = self.execute_rule(rule)
+            timings.append(time.perf_counter() - rule_start)
+            results.append((rule, result))
+            if result is True:
+                self.routing_state.record(rule)
                 applied_count += 1
+            elif result == TIMED_OUT:
+                self.timed_out.append(rule)
+        self.history.record(profile_name, source, started, time.perf_counter() - t0, results, timings)
         return applied_count
 
+    @profiled('rollback')
+    def rollback(self):
+        """Re-apply only the routes that changed since the last activation. Returns (profile, restored, total) or None."""
+        self.last_activation = cancel_event = self.activation_queue.request()
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            return None
+        try:
+            result = self.routing_state.pop_rollback()
+            if result is None:
+                return None
+            profile_name, routes, unknown = result
+            for route in unknown:
+                print(f"Note: no earlier device recorded for {route['app_name']}; left as is.")
+            # Routes recorded by the GUI only carry the EarTrumpet device label
+            rules = [dict(route, device_id=route.get('device_id') or route.get('device')) for route in routes]
+            restored = self.apply_rules(rules, profile_name, 'rollback', cancel_event)
+            self.routing_state.save()
+        finally:
+            lock.release()
+        return profile_name, restored, len(rules)
+
+    def list_sound_items(self):
+        """Return SoundVolumeView's device and application rows (its /scomma CSV export)."""
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'items.csv')
+            # On timeout subprocess.run kills and reaps SoundVolumeView before raising TimeoutExpired
+            subprocess.run([self.soundvolumeview_path, '/scomma', out], check=True, capture_output=True,
+                           timeout=self.timeouts['list_devices'])
+            with open(out, 'r', newline='', encoding='utf-8-sig', errors='replace') as f:
+                return list(csv.DictReader(f))
+
+    def validate_profiles(self, profiles):
+        """Check every rule against one SoundVolumeView snapshot and one process snapshot."""
+        device_ids = set()
+        device_names = {}
+        for row in self.list_sound_items():
+            if row.get('Type') == 'Device':
+                device_ids.add((row.get('Command-Line Friendly ID') or '').lower())
+                device_names.setdefault((row.get('Name') or '').lower(), []).append(row.get('Command-Line Friendly ID'))
+        import psutil
+        running = {p.info['name'].lower() for p in psutil.process_iter(['name']) if p.info.get('name')}
+
+        def validate_chunk(chunk):
+            reports = {}
+            for name, profile in chunk:
+                report = {'rules': 0, 'missing_devices': [], 'apps_not_seen': [], 'ambiguous': []}
+                for rule in profile.get('rules', []):
+                    report['rules'] += 1
+                    app_name = rule.get('app_name', '')
+                    device_id = rule.get('device_id') or ''
+                    label = rule_device_label(rule)
+                    if device_id:
+                        if device_id.lower() not in device_ids:
+                            report['missing_devices'].append(f"{app_name} -> {device_id}")
+                    else:
+                        matches = device_names.get(label.lower(), [])
+                        if not matches:
+                            report['missing_devices'].append(f"{app_name} -> {label or 'N/A'}")
+                        elif len(matches) > 1:
+                            report['ambiguous'].append(f"device '{label}' matches {', '.join(matches)}")
+                    if rule.get('match'):
+                        regex = compile_pattern(rule.get('match'), app_name)
+                        if not any(regex.fullmatch(app) for app in running):
+                            report['apps_not_seen'].append(f"{app_name} ({rule.get('match')})")
+                    elif app_name.lower() not in running:
+                        report['apps_not_seen'].append(app_name)
+                reports[name] = report
+            return reports
+
+        items = list(profiles.items())
+        chunks = [items[i:i + VALIDATION_CHUNK_SIZE] for i in range(0, len(items), VALIDATION_CHUNK_SIZE)]
+        reports = {}
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for result in pool.map(validate_chunk, chunks):
+                reports.update(result)
+        return reports
+
     def execute_rule(self, rule):
         try:
-            if not any(p.name().lower() == rule['app_name'].lower() for p in psutil.process_iter(['name'])):
+            if self.running_apps is not None and rule.get('app_name', '').lower() not in self.running_apps:
+                self.not_running.append(rule)
                 return False
             cmd = [
                 self.soundvolumeview_path,
                 '/SetAppDefault',
-                rule['device_id'],
+                rule.get('device_id'),
                 '1',
-                rule['app_name']
+                rule.get('app_name')
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            subprocess.run(cmd, check=True, capture_output=True, timeout=self.timeouts['set'])
             return True
+        except subprocess.TimeoutExpired as e:
+            print(f"SoundVolumeView timed out after {e.timeout:g}s for {rule.get('app_name')} and was stopped.")
+            return TIMED_OUT
         except Exception:
             return False
 
+def read_profile_config(path):
+    """(config, invalid profiles) of audio_profiles.json, see load_profiles_config."""
+    if not os.path.exists(path):
+        return {'profiles': {}}, {}
+    return load_profiles_config(path)
+
+
+def profile_hash(profile):
+    data = json.dumps(profile, sort_keys=True, separators=(',', ':'), default=encode_json)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def devices_hash(path=INVENTORY_CACHE_FILE):
+    """Hash of the device list SWAP last saw (device_cache.json, kept current by the GUI), or ''."""
+    try:
+        with open(path, 'rb') as f:
+            devices = json.loads(f.read()).get('devices', [])
+    except (OSError, ValueError, AttributeError):
+        return ''
+    names = sorted(f"{d.get('direction')}|{d.get('name')}" for d in devices if isinstance(d, dict))
+    return hashlib.sha1("\n".join(names).encode('utf-8')).hexdigest()
+
+
+def plan_path(profile_name):
+    return os.path.join(PLAN_DIR, f"{profile_name}.plan.json")
+
+
+def compile_plan(app, profile_name):
+    """Resolve a profile into a plan file: the SoundVolumeView commands to run, nothing else.
+
+    Rules are deduplicated and device names resolved to SoundVolumeView IDs ahead of time.
+    The plan records the hash of the profile and of the known device set; it is dropped as
+    soon as either changes. Returns (path, commands) or raises ValueError.
+    """
+    with profile_lock(PROFILE_FILE):
+        config, invalid = read_profile_config(PROFILE_FILE)
+        st = os.stat(PROFILE_FILE)
+    if profile_name in invalid:
+        raise ValueError(f"Profile '{profile_name}' in audio_profiles.json is invalid: {invalid[profile_name][1]}")
+    profile = config['profiles'].get(profile_name)
+    if profile is None:
+        raise ValueError(f"Profile '{profile_name}' not found in audio_profiles.json")
+    rules = dedupe_rules(profile.get('rules', []))
+    if any(rule.get('match') for rule in rules):
+        raise ValueError("pattern rules depend on the running processes and cannot be compiled")
+    app.soundvolumeview_path = config.get('soundvolumeview_path', app.soundvolumeview_path)
+
+    device_ids = {}
+    device_names = {}
+    for row in app.list_sound_items():
+        if row.get('Type') == 'Device':
+            device_id = row.get('Command-Line Friendly ID') or ''
+            device_ids[device_id.lower()] = device_id
+            device_names.setdefault((row.get('Name') or '').lower(), []).append(device_id)
+    commands = []
+    missing = []
+    for rule in rules:
+        label = rule_device_label(rule)
+        device_id = device_ids.get((rule.get('device_id') or '').lower())
+        if device_id is None and len(device_names.get(label.lower(), [])) == 1:
+            device_id = device_names[label.lower()][0]
+        if not device_id:
+            missing.append(f"{rule.get('app_name')} -> {rule.get('device_id') or label or 'N/A'}")
+            continue
+        commands.append({'app_name': rule.get('app_name', ''), 'device': label, 'device_id': device_id,
+                         'direction': rule.get('direction') or 'Render'})
+    if missing:
+        raise ValueError("device(s) not found or ambiguous: " + ", ".join(missing))
+
+    plan = {'version': PLAN_VERSION, 'profile': profile_name, 'profile_hash': profile_hash(profile),
+            'profiles_stat': [st.st_mtime_ns, st.st_size], 'devices_hash': devices_hash(),
+            'soundvolumeview_path': app.soundvolumeview_path, 'rules': commands}
+    return write_plan(plan), commands
+
+
+def write_plan(plan):
+    os.makedirs(PLAN_DIR, exist_ok=True)
+    path = plan_path(plan['profile'])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(plan, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+@profiled('load_plan')
+def load_plan(profile_name):
+    """Return the compiled plan of a profile if it is still current, else None (a stale plan is deleted).
+
+    The profile is only re-read when audio_profiles.json changed on disk, and the plan is
+    kept if that profile's own content did not change.
+    """
+    path = plan_path(profile_name)
+    try:
+        with open(path, 'r') as f:
+            plan = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        stale = plan.get('version') != PLAN_VERSION or plan.get('devices_hash') != devices_hash()
+        if not stale:
+            st = os.stat(PROFILE_FILE)
+            if [st.st_mtime_ns, st.st_size] != plan.get('profiles_stat'):
+                with profile_lock(PROFILE_FILE):
+                    profile = read_profile_config(PROFILE_FILE)[0]['profiles'].get(profile_name)
+                    st = os.stat(PROFILE_FILE)
+                stale = profile is None or profile_hash(profile) != plan.get('profile_hash')
+                if not stale:
+                    plan['profiles_stat'] = [st.st_mtime_ns, st.st_size]
+                    write_plan(plan)
+    except (OSError, ValueError, TimeoutError):
+        stale = True
+    if stale:
+        print(f"Note: the compiled plan of '{profile_name}' is out of date and was removed; run --compile again.")
+        discard_plan(profile_name)
+        return None
+    return plan
+
+
+def discard_plan(profile_name):
+    try:
+        os.remove(plan_path(profile_name))
+    except OSError:
+        pass
+
+
+@profiled('compile')
+def cli_compile(profile_name):
+    app = AudioProfileManager()
+    path, commands = compile_plan(app, profile_name)
+    print(f"Compiled '{profile_name}' into {len(commands)} command(s): {path}")
+    return 0
+
+
+@profiled('import_profiles')
+def cli_import(filename, policy):
+    def progress(count):
+        if count % 1000 == 0:
+            print(f"{count} profile(s) read...")
+
+    # Read, merge and write back under one lock so a concurrent GUI save is not lost
+    with profile_lock(PROFILE_FILE):
+        config, invalid = read_profile_config(PROFILE_FILE)
+        profiles = config.pop('profiles')
+        with open(filename, 'r') as f:
+            items = iter_profile_file(f, ndjson=filename.lower().endswith(NDJSON_EXTENSIONS))
+            imported, stats = import_profile_stream(items, set(profiles) | set(invalid), policy, progress=progress)
+        profiles.update(imported)
+        # Profiles that did not load are written back as they were
+        profiles = profiles_to_save(profiles, invalid)
+        write_profile_file(PROFILE_FILE, profiles, list(profiles), extra=config)
+    print(f"Imported {stats['imported']} profile(s) (overwritten: {stats['overwritten']}, renamed: {stats['renamed']}), "
+          f"skipped {stats['skipped']}, invalid {len(stats['invalid'])}.")
+    for name in stats['invalid']:
+        print(f"WARNING: Invalid profile '{name}' was not imported.")
+    return 0
+
+
+@profiled('validate_profiles')
+def cli_validate():
+    app = AudioProfileManager()
+    with profile_lock(PROFILE_FILE):
+        config, invalid = read_profile_config(PROFILE_FILE)
+    app.soundvolumeview_path = config.get('soundvolumeview_path', app.soundvolumeview_path)
+    reports = app.validate_profiles(config['profiles'])
+    for name in sorted(invalid):
+        print(f"{name}: invalid profile, not loaded: {invalid[name][1]}")
+    unhealthy = len(invalid)
+    for name in sorted(reports):
+        report = reports[name]
+        problems = ([f"  missing device: {item}" for item in report['missing_devices']] +
+                    [f"  app not seen: {item}" for item in report['apps_not_seen']] +
+                    [f"  ambiguous: {item}" for item in report['ambiguous']])
+        if problems:
+            unhealthy += 1
+            print(f"{name} ({report['rules']} rule(s)):")
+            print("\n".join(problems))
+    print(f"{len(reports) + len(invalid) - unhealthy} of {len(reports) + len(invalid)} profile(s) healthy.")
+    return 2 if unhealthy else 0
+
+
+def cli_history(slowest, limit, path=HISTORY_FILE):
+    if not os.path.exists(path):
+        print("No activation history yet.")
+        return 1
+    conn = sqlite3.connect(path)
+    try:
+        if not slowest:
+            rows = conn.execute("SELECT started, profile, source, duration, applied, total FROM activations "
+                                "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            for started, profile_name, source, duration, applied, total in reversed(rows):
+                when = datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M:%S')
+                print(f"{when}  {profile_name:<24} {source:<8} {applied}/{total} rule(s)  {duration * 1000:8.1f} ms")
+            return 0
+
+        groups = (
+            ("profile", "SELECT profile, duration FROM activations"),
+            ("rule", "SELECT app || ' -> ' || device || CASE direction WHEN 'Capture' THEN ' (input)' ELSE '' END, "
+                     "duration FROM rule_results"),
+            ("app", "SELECT app, duration FROM rule_results"),
+        )
+        for title, query in groups:
+            samples = {}
+            for key, duration in conn.execute(query):
+                samples.setdefault(key, []).append(duration)
+            stats = []
+            for key, values in samples.items():
+                values.sort()
+                stats.append((percentile(values, 95), percentile(values, 50), len(values), key))
+            stats.sort(reverse=True)
+            print(f"Slowest by {title} (p50 / p95):")
+            for p95, p50, count, key in stats[:limit]:
+                print(f"  {p50 * 1000:8.1f} ms  {p95 * 1000:8.1f} ms  n={count:<5} {key}")
+        outcomes = conn.execute("SELECT outcome, COUNT(*) FROM rule_results GROUP BY outcome ORDER BY outcome").fetchall()
+        print("Rule outcomes: " + ", ".join(f"{outcome} {count}" for outcome, count in outcomes))
+        return 0
+    finally:
+        conn.close()
+
+
+@profiled('export_profiles')
+def cli_export(filename, names):
+    with profile_lock(PROFILE_FILE):
+        config, invalid = read_profile_config(PROFILE_FILE)
+    profiles = config['profiles']
+    if names:
+        bad = [name for name in names if name in invalid]
+        if bad:
+            print("ERROR: Invalid profile(s) in audio_profiles.json: "
+                  + ", ".join(f"{name} ({invalid[name][1]})" for name in bad))
+            return 1
+    else:
+        names = list(profiles)
+        for name in invalid:
+            print(f"WARNING: Invalid profile '{name}' was not exported: {invalid[name][1]}")
+    missing = [name for name in names if name not in profiles]
+    if missing:
+        print(f"ERROR: Profile(s) not found in audio_profiles.json: {', '.join(missing)}")
+        return 1
+    write_profile_file(filename, profiles, names, ndjson=filename.lower().endswith(NDJSON_EXTENSIONS))
+    print(f"Exported {len(names)} profile(s) to {filename}.")
+    return 0
+
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="SmartWindowsAudioProfiles CLI")
-    parser.add_argument("profile_name", help="Profile name to activate (uses audio_profiles.json in app directory)")
+    parser.add_argument("profile_name", nargs="?", help="Profile name to activate (uses audio_profiles.json in app directory)")
+    parser.add_argument("--import", dest="import_file", metavar="FILE", help="Import profiles from a .json or .ndjson file into audio_profiles.json")
+    parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default='skip', help="What to do with imported profiles that already exist (default: skip)")
+    parser.add_argument("--export", dest="export_file", metavar="FILE", help="Export profiles to a .json or .ndjson file")
+    parser.add_argument("--profiles", nargs="+", metavar="NAME", help="Profiles to export (default: all)")
+    parser.add_argument("--validate", action="store_true", help="Check all profiles against the current devices and running apps")
+    parser.add_argument("--rollback", action="store_true", help="Restore the routing in effect before the last activation")
+    parser.add_argument("--history", action="store_true", help="Show recent profile activations")
+    parser.add_argument("--slowest", action="store_true", help="With --history: p50/p95 latency per profile, rule and app, slowest first")
+    parser.add_argument("--limit", type=int, default=20, metavar="N", help="With --history: number of entries to show (default: 20)")
+    parser.add_argument("--compile", dest="compile_profile", metavar="PROFILE", help="Resolve a profile into a plan file that later activations run directly")
+    parser.add_argument("--profile-run", action="store_true", help="Profile time and memory of each operation into the profile_runs folder")
     args = parser.parse_args()
+    PROFILER.enabled = args.profile_run
+
+    if args.compile_profile:
+        if not PROFILE_NAME_REGEX.match(args.compile_profile):
+            print("ERROR: Invalid profile name! Only letters, numbers, and hyphens (-) are allowed. No spaces.")
+            sys.exit(1)
+        try:
+            sys.exit(cli_compile(args.compile_profile))
+        except subprocess.TimeoutExpired as e:
+            print(f"ERROR: Compile failed: {e}")
+            sys.exit(3)
+        except Exception as e:
+            print(f"ERROR: Compile failed: {e}")
+            sys.exit(2)
+
+    if args.history:
+        try:
+            sys.exit(cli_history(args.slowest, args.limit))
+        except sqlite3.Error as e:
+            print(f"ERROR: Could not read the activation history: {e}")
+            sys.exit(2)
+
+    if args.rollback:
+        app = AudioProfileManager()
+        try:
+            app.load_config()
+            result = app.rollback()
+        except Exception as e:
+            print(f"ERROR: Rollback failed: {e}")
+            sys.exit(2)
+        if app.last_activation.superseded:
+            print("Rollback superseded by a newer activation.")
+            sys.exit(EXIT_SUPERSEDED)
+        if result is None:
+            print("Nothing to roll back.")
+            sys.exit(1)
+        profile_name, restored, total = result
+        print(f"Rolled back '{profile_name}': {restored} of {total} route(s) restored.")
+        if app.timed_out:
+            print(f"ERROR: {len(app.timed_out)} route(s) timed out.")
+            sys.exit(3)
+        sys.exit(0 if restored == total else 2)
+
+    if args.import_file or args.export_file:
+        try:
+            if args.import_file:
+                sys.exit(cli_import(args.import_file, args.on_conflict))
+            sys.exit(cli_export(args.export_file, args.profiles))
+        except Exception as e:
+            print(f"ERROR: {'Import' if args.import_file else 'Export'} failed: {e}")
+            sys.exit(2)
+
+    if args.validate:
+        try:
+            sys.exit(cli_validate())
+        except subprocess.TimeoutExpired as e:
+            print(f"ERROR: Validation failed: {e}")
+            sys.exit(3)
+        except Exception as e:
+            print(f"ERROR: Validation failed: {e}")
+            sys.exit(2)
+
+    if args.profile_name is None:
+        parser.error("a profile name is required")
 
     if not PROFILE_NAME_REGEX.match(args.profile_name):
         print("ERROR: Invalid profile name! Only letters, numbers, and hyphens (-) are allowed. No spaces.")
@@ -72,18 +611,38 @@ if __name__ == "__main__":
         if not os.path.exists(PROFILE_FILE):
             print("ERROR: audio_profiles.json not found in the application directory.")
             sys.exit(1)
-        app.load_config()
-        if args.profile_name in app.profiles:
+        plan = load_plan(args.profile_name)
+        if plan is not None:
+            applied = app.apply_plan(plan)
+            failed = len(plan['rules']) - applied - len(app.not_running)
+            if failed > 0 and not app.last_activation.superseded and not app.timed_out:
+                # A device may be gone: the next activation takes the normal path. Apps that
+                # are not running are skipped, as on the normal path, and keep the plan.
+                discard_plan(args.profile_name)
+                print(f"Note: {failed} command(s) of the compiled plan failed; the plan was removed.")
+        else:
+            app.load_config()
+            if app.get_profile_rules(args.profile_name) is None:
+                if args.profile_name in app.invalid_profiles:
+                    print(f"ERROR: Profile '{args.profile_name}' in audio_profiles.json is invalid: "
+                          f"{app.invalid_profiles[args.profile_name][1]}")
+                    sys.exit(1)
+                print(f"ERROR: Profile '{args.profile_name}' not found in audio_profiles.json.")
+                sys.exit(1)
             applied = app.apply_profile(args.profile_name)
-            if applied > 0:
-                print(f"Profile '{args.profile_name}' activated with {applied} rule(s).")
-                sys.exit(0)
-            else:
-                print(f"ERROR: Profile '{args.profile_name}' found but no rules could be applied. Are the target applications running? Is SoundVolumeView.exe configured correctly?")
-                sys.exit(2)
+        if app.last_activation.superseded:
+            print(f"Profile '{args.profile_name}' superseded by a newer activation ({applied} rule(s) applied).")
+            sys.exit(EXIT_SUPERSEDED)
+        if app.timed_out:
+            print(f"ERROR: SoundVolumeView timed out on {len(app.timed_out)} rule(s) ({applied} applied): "
+                  + ", ".join(rule.get('app_name', '') for rule in app.timed_out))
+            sys.exit(3)
+        if applied > 0:
+            print(f"Profile '{args.profile_name}' activated with {applied} rule(s).")
+            sys.exit(0)
         else:
-            print(f"ERROR: Profile '{args.profile_name}' not found in audio_profiles.json.")
-            sys.exit(1)
+            print(f"ERROR: Profile '{args.profile_name}' found but no rules could be applied. Are the target applications running? Is SoundVolumeView.exe configured correctly?")
+            sys.exit(2)
     except Exception as e:
         print(f"ERROR: Failed to activate profile '{args.profile_name}': {e}")
         sys.exit(2)
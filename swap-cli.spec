@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('icon.ico', '.')],
-    hiddenimports=['psutil'],
+    hiddenimports=['psutil', 'swap_common'],
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -9,55 +9,1480 @@ import csv
 import psutil
 import tempfile
 import threading
+import time
+import bisect
+import heapq
+import itertools
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
-from PIL import Image, ImageDraw
 import sys
 import configparser
+import queue
+import hashlib
+import hmac
+import sqlite3
+import shutil
+import socket
+from swap_common import (
+    BASE_DIR_SETTINGS, PROFILE_FILE, SETTINGS_FILE, STATE_FILE, INVENTORY_CACHE_FILE, PROFILE_RUN_DIR, HISTORY_FILE,
+    PROFILE_NAME_REGEX, DEFAULT_TIMEOUTS, TIMED_OUT, NDJSON_EXTENSIONS, PROFILER,
+    read_timeouts, iter_profile_file, compile_pattern, app_label_variants, expand_pattern_rules, Rule, encode_json,
+    load_profiles_config, profiles_to_save, import_profile_stream, write_profile_file, rule_device_label, profile_lock,
+    ActivationQueue, QueuedCancel, acquire_activation, RoutingState, ActivationHistory, write_state_snapshot, profiled,
+)
+
+
+EARTRUMPET_CACHE_FILE = os.path.join(BASE_DIR_SETTINGS, "eartrumpet_cache.json")
+# Bytes read from each end of the executable for its quick hash
+EXE_HASH_CHUNK = 64 * 1024
 
+if hasattr(sys, '_MEIPASS'):
+    BASE_DIR = sys._MEIPASS
+else:
+    BASE_DIR = os.path.abspath(".")
 
-def get_base_path():
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
 
+DEVICE_LINE_PREFIXES = (('[Playback]', 'Render'), ('[Recording]', 'Capture'))
+STREAM_BATCH_SIZE = 200
+STREAM_BATCH_INTERVAL = 0.05
 
-BASE_DIR_SETTINGS = get_base_path()
-PROFILE_FILE = os.path.join(BASE_DIR_SETTINGS, "audio_profiles.json")
-SETTINGS_FILE = os.path.join(BASE_DIR_SETTINGS, "config.ini")
 
-PROFILE_NAME_REGEX = re.compile(r'^[A-Za-z0-9-]+$')
+# Timeouts in effect for EarTrumpet commands (DEFAULT_TIMEOUTS, then [Timeouts] in config.ini)
+COMMAND_TIMEOUTS = dict(DEFAULT_TIMEOUTS)
 
-if hasattr(sys, '_MEIPASS'):
-    BASE_DIR = sys._MEIPASS
-else:
-    BASE_DIR = os.path.abspath(".")
+
+def command_timeout(flag):
+    return COMMAND_TIMEOUTS.get(flag.lstrip('-').replace('-', '_'))
+
+
+def iter_eartrumpet_lines(exe_path, flag, timeout=None):
+    """Run EarTrumpet with a listing flag and yield its non-empty output lines as they arrive.
+
+    Closing the generator early (e.g. breaking out of the loop) kills the child process.
+    A watchdog kills the child once the command's timeout (COMMAND_TIMEOUTS) has passed,
+    and subprocess.TimeoutExpired is raised. Raises RuntimeError if EarTrumpet exits
+    with a non-zero code after a full read.
+    """
+    if timeout is None:
+        timeout = command_timeout(flag)
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            [exe_path, flag],
+            stdout=subprocess.PIPE,
+            stderr=err,
+            text=True,
+            bufsize=1,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        finished = False
+        timed_out = threading.Event()
+        watchdog = None
+        if timeout:
+            def expire():
+                timed_out.set()
+                proc.kill()
+            watchdog = threading.Timer(timeout, expire)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            for raw in proc.stdout:
+                line = raw.strip()
+                if line:
+                    yield line
+            finished = True
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if not finished:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired([exe_path, flag], timeout)
+        if proc.returncode != 0:
+            err.seek(0)
+            message = err.read().decode(errors='replace').strip()
+            raise RuntimeError(message or f"EarTrumpet {flag} returned an error.")
+
+
+def parse_device_line(line):
+    """Turn a '[Playback] label' / '[Recording] label' line into a device dict, or None."""
+    for prefix, direction in DEVICE_LINE_PREFIXES:
+        if line.startswith(prefix):
+            label = line[len(prefix):].strip()
+            # Build normalized device structure
+            return {
+                'id': label,                # using label as identifier
+                'name': label,
+                'device_name': label,
+                'item_id': '',
+                'direction': direction,
+                'state': 'Active',
+                'type': 'Device'
+            }
+    return None
+
+
+def iter_batches(items, batch_size=STREAM_BATCH_SIZE, interval=STREAM_BATCH_INTERVAL):
+    """Group an iterable into lists, flushing on size or when `interval` seconds have passed."""
+    batch = []
+    last_flush = time.monotonic()
+    for item in items:
+        batch.append(item)
+        now = time.monotonic()
+        if len(batch) >= batch_size or now - last_flush >= interval:
+            yield batch
+            batch = []
+            last_flush = now
+    if batch:
+        yield batch
+
+
+def exe_fingerprint(exe_path):
+    """Return (path, size, mtime_ns, quick hash) of an executable, or None if it cannot be read.
+
+    A bare name such as "EarTrumpet.exe" is looked up in PATH. The quick hash covers the
+    size and the first and last EXE_HASH_CHUNK bytes, so a rebuilt binary with the same
+    size and a restored mtime is still told apart.
+    """
+    path = shutil.which(exe_path) or exe_path
+    try:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        digest = hashlib.sha1(str(st.st_size).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read(EXE_HASH_CHUNK))
+            if st.st_size > EXE_HASH_CHUNK:
+                f.seek(max(EXE_HASH_CHUNK, st.st_size - EXE_HASH_CHUNK))
+                digest.update(f.read(EXE_HASH_CHUNK))
+        return (path, st.st_size, st.st_mtime_ns, digest.hexdigest())
+    except (OSError, ValueError):
+        return None
+
+
+class ExeCapabilityCache:
+    """What SWAP learned about each EarTrumpet executable, kept in a small JSON sidecar.
+
+    Entries are keyed by the executable's absolute path and dropped as soon as its
+    fingerprint (size, mtime, quick hash) no longer matches. An entry looks like
+    {'fingerprint': [...], 'verified': True, 'flags': ['--list-devices', ...], 'batch': True};
+    'batch' is missing while unknown.
+    """
+
+    def __init__(self, path=EARTRUMPET_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                self._entries = entries if isinstance(entries, dict) else {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save the EarTrumpet cache: {e}")
+
+    def lookup(self, exe_path):
+        """Return (fingerprint, entry); entry is {} when nothing is known about this exact binary."""
+        fingerprint = exe_fingerprint(exe_path)
+        if fingerprint is None:
+            return None, {}
+        with self.lock:
+            entry = self._load().get(fingerprint[0])
+        if not isinstance(entry, dict) or entry.get('fingerprint') != list(fingerprint):
+            return fingerprint, {}
+        return fingerprint, dict(entry)
+
+    def record(self, fingerprint, flag=None, **values):
+        """Merge values (and a flag seen working) into the entry of this fingerprint; saved only on change."""
+        if fingerprint is None:
+            return
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(fingerprint[0])
+            if not isinstance(entry, dict) or entry.get('fingerprint') != list(fingerprint):
+                entry = {'fingerprint': list(fingerprint)}
+            updated = dict(entry, **values)
+            if flag and flag not in updated.get('flags', []):
+                updated['flags'] = sorted(updated.get('flags', []) + [flag])
+            if updated != entries.get(fingerprint[0]):
+                entries[fingerprint[0]] = updated
+                self._save()
+
+
+EARTRUMPET_CACHE = ExeCapabilityCache()
 
 
 class Checker:
     @staticmethod
-    def verify_eartrumpet_exe(exe_path):
+    def verify_eartrumpet_exe(exe_path, refresh=False):
+        """True if exe_path is a working EarTrumpet with the CLI.
+
+        A successful check is remembered per binary (see ExeCapabilityCache) and not run
+        again until the file changes or refresh is set. A failed check is not remembered,
+        as it may come from the audio service rather than the file.
+        """
+        fingerprint, entry = EARTRUMPET_CACHE.lookup(exe_path)
+        if entry.get('verified') and not refresh:
+            return True
         try:
-            # Try to list devices, should return lines
-            cmd = [exe_path, '--list-devices']
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            if result.returncode != 0:
-                return False
-            # Must contain at least one line matching [Playback] or [Recording]
-            for line in result.stdout.splitlines():
-                if line.strip().startswith('[Playback]') or line.strip().startswith('[Recording]'):
-                    return True
+            # Must list at least one [Playback] or [Recording] line; stop reading at the first one
+            lines = iter_eartrumpet_lines(exe_path, '--list-devices')
+            try:
+                for line in lines:
+                    if parse_device_line(line):
+                        EARTRUMPET_CACHE.record(fingerprint, '--list-devices', verified=True)
+                        return True
+            finally:
+                lines.close()
             return False
+        except subprocess.TimeoutExpired:
+            raise
         except Exception:
             return False
 
 
+# Batches that failed along with some of their single calls say nothing about batch
+# support; after this many, the rest of the session applies rules one by one
+BATCH_PROBE_LIMIT = 3
+
+
+class AudioBackend:
+    """Lists devices and audio apps and routes apps to devices.
+
+    Devices are dicts with at least 'name' and 'direction' ('Render' or 'Capture').
+    set_route returns True when the route was applied, False when the backend refused
+    it, and raises subprocess.TimeoutExpired when the backend hung.
+    """
+
+    name = "backend"
+    # True/False once known; None means "try a batch and find out"
+    supports_batch = False
+    # Inconclusive batch attempts while supports_batch is None (not persisted)
+    batch_probes = 0
+
+    def available(self):
+        return True
+
+    def list_devices(self):
+        raise NotImplementedError
+
+    def list_apps(self):
+        raise NotImplementedError
+
+    def set_route(self, app_label, device_label, direction='Render'):
+        raise NotImplementedError
+
+    def set_routes_batch(self, routes):
+        """Apply [(app_label, device_label, direction)] at once; True only if all were applied."""
+        return all([self.set_route(*route) for route in routes])
+
+
+def run_backend_command(cmd):
+    # On timeout subprocess.run kills and reaps the child before raising TimeoutExpired
+    return subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=COMMAND_TIMEOUTS['set'],
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+
+
+class EarTrumpetBackend(AudioBackend):
+    name = "EarTrumpet"
+
+    def __init__(self, exe_path):
+        self.exe_path = exe_path
+        # Capabilities learned by earlier runs of this same binary; batch support stays
+        # None (probe on first use) until one of them found out
+        self._fingerprint, entry = EARTRUMPET_CACHE.lookup(exe_path)
+        self._supports_batch = entry.get('batch')
+
+    @property
+    def supports_batch(self):
+        return self._supports_batch
+
+    @supports_batch.setter
+    def supports_batch(self, value):
+        self._supports_batch = value
+        self._learned(batch=value)
+
+    def _learned(self, flag=None, **values):
+        EARTRUMPET_CACHE.record(self._fingerprint, flag, **values)
+
+    def available(self):
+        return Checker.verify_eartrumpet_exe(self.exe_path)
+
+    def list_devices(self):
+        found = False
+        for line in iter_eartrumpet_lines(self.exe_path, '--list-devices'):
+            device = parse_device_line(line)
+            if device:
+                if not found:
+                    # A device listing is as good as a verification of the executable
+                    found = True
+                    self._learned('--list-devices', verified=True)
+                yield device
+
+    def list_apps(self):
+        yield from iter_eartrumpet_lines(self.exe_path, '--list-apps')
+        self._learned('--list-apps')
+
+    def set_route(self, app_label, device_label, direction='Render'):
+        # EarTrumpet picks the flow from the device itself
+        ok = self._run([self.exe_path, '--set', app_label, device_label])
+        if ok:
+            self._learned('--set')
+        return ok
+
+    def set_routes_batch(self, routes):
+        cmd = [self.exe_path]
+        for app_label, device_label, _ in routes:
+            cmd += ['--set', app_label, device_label]
+        return self._run(cmd)
+
+    @staticmethod
+    def _run(cmd):
+        print(f"Executing: {cmd}")
+        result = run_backend_command(cmd)
+        if result.returncode != 0:
+            print(f"EarTrumpet --set failed. rc={result.returncode}\nstdout={result.stdout}\nstderr={result.stderr}")
+        return result.returncode == 0
+
+
+class SoundVolumeViewBackend(AudioBackend):
+    """NirSoft SoundVolumeView: one /scomma export for listings, /SetAppDefault per route."""
+
+    name = "SoundVolumeView"
+
+    def __init__(self, exe_path):
+        self.exe_path = exe_path
+        self._ids = {}
+
+    def available(self):
+        try:
+            self._rows()
+            return True
+        except subprocess.TimeoutExpired:
+            raise
+        except Exception:
+            return False
+
+    def _rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'items.csv')
+            subprocess.run([self.exe_path, '/scomma', out], check=True, capture_output=True,
+                           timeout=COMMAND_TIMEOUTS['list_devices'],
+                           creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
+            with open(out, 'r', newline='', encoding='utf-8-sig', errors='replace') as f:
+                return list(csv.DictReader(f))
+
+    def list_devices(self):
+        devices = []
+        for row in self._rows():
+            if row.get('Type') != 'Device' or row.get('Direction') not in ('Render', 'Capture'):
+                continue
+            # Same label format as EarTrumpet: "Speakers (Realtek(R) Audio)"
+            label = row.get('Name') or ''
+            if row.get('Device Name'):
+                label = f"{label} ({row['Device Name']})"
+            self._ids[label.lower()] = row.get('Command-Line Friendly ID') or label
+            devices.append({'name': label, 'direction': row['Direction'], 'id': self._ids[label.lower()]})
+        return devices
+
+    def list_apps(self):
+        apps = set()
+        for row in self._rows():
+            if row.get('Type') == 'Application':
+                path = row.get('Process Path') or ''
+                apps.add(path.replace('\\', '/').rsplit('/', 1)[-1] or row.get('Name') or '')
+        apps.discard('')
+        return sorted(apps, key=str.lower)
+
+    def set_route(self, app_label, device_label, direction='Render'):
+        device = self._ids.get(device_label.lower(), device_label)
+        cmd = [self.exe_path, '/SetAppDefault', device, '1', app_label]
+        print(f"Executing: {cmd}")
+        return run_backend_command(cmd).returncode == 0
+
+
+class SimulatedBackend(AudioBackend):
+    """In-memory backend for load tests: no audio stack, no processes.
+
+    Routes are kept in `routes` ({(app, direction): device}). With `apps=None` every app
+    is accepted; otherwise unknown apps and devices are refused like a real backend.
+    `latency` (seconds) is slept per call to model a slow backend.
+    """
+
+    name = "Simulator"
+    supports_batch = True
+
+    def __init__(self, devices=None, apps=None, latency=0.0):
+        if devices is None:
+            devices = [{'name': f"Simulated Output {i}", 'direction': 'Render'} for i in range(1, 4)]
+            devices += [{'name': f"Simulated Input {i}", 'direction': 'Capture'} for i in range(1, 3)]
+        self.devices = devices
+        self.apps = None if apps is None else list(apps)
+        self.latency = latency
+        self.routes = {}
+        self.calls = 0
+        self._known_devices = {(d['direction'], d['name'].lower()) for d in devices}
+        self._known_apps = None if apps is None else {app.lower() for app in apps}
+
+    def list_devices(self):
+        return list(self.devices)
+
+    def list_apps(self):
+        return list(self.apps or [])
+
+    def _route(self, app_label, device_label, direction):
+        if self._known_apps is not None and app_label.lower() not in self._known_apps:
+            return False
+        if (direction, device_label.lower()) not in self._known_devices:
+            return False
+        self.routes[(app_label.lower(), direction)] = device_label
+        return True
+
+    def set_route(self, app_label, device_label, direction='Render'):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._route(app_label, device_label, direction)
+
+    def set_routes_batch(self, routes):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return all([self._route(*route) for route in routes])
+
+
+BACKENDS = {
+    'eartrumpet': lambda manager: EarTrumpetBackend(manager.eartrumpet_path),
+    'soundvolumeview': lambda manager: SoundVolumeViewBackend(manager.soundvolumeview_path),
+    'simulator': lambda manager: SimulatedBackend(),
+}
+
+
+DEVICE_POLL_INTERVAL = 5.0
+# Progress updates from the activation worker are batched to at most one per frame
+ACTIVATION_PROGRESS_INTERVAL_MS = 16
+
+
+def load_inventory_cache(path=INVENTORY_CACHE_FILE):
+    """Return the last saved {'devices': [...], 'apps': [...]} or None."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        devices = [d for d in cache.get('devices', []) if isinstance(d, dict) and d.get('name') and d.get('direction')]
+        return {'devices': devices, 'apps': [a for a in cache.get('apps', []) if isinstance(a, str)]}
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_inventory_cache(devices, apps, path=INVENTORY_CACHE_FILE):
+    # Written to a temporary file first so a crash never leaves a truncated cache
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'saved': time.time(), 'devices': devices, 'apps': apps}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not save the device cache: {e}")
+
+
+def normalize_device_label(label):
+    label = label.strip()
+    if label.endswith(" (Default)"):
+        label = label[:-len(" (Default)")]
+    return label.lower()
+
+
+def group_rules_by_app(rules):
+    """Group rules per app (case-insensitive), in order of first appearance."""
+    groups = {}
+    for rule in rules:
+        groups.setdefault((rule.get('app_name') or '').strip().lower(), []).append(rule)
+    return list(groups.values())
+
+
+def analyze_rules(rules, known_devices=None):
+    """Build the deduplicated execution list of a profile and report rule problems.
+
+    Rules are keyed by (app, direction). Identical rules are duplicates; for a key with
+    several different devices the last rule wins, as it did when all were executed, and
+    the earlier ones are shadowed. `known_devices` (normalized labels) enables the
+    missing-device check. Returns a dict with 'rules' (to execute), 'status'
+    (rule index -> problem), 'warnings' and 'spawns_saved'.
+    """
+    winners = {}
+    status = {}
+    for idx, rule in enumerate(rules):
+        key = ((rule.get('app_name') or '').strip().lower(), rule.get('direction') or 'Render')
+        device = normalize_device_label(rule_device_label(rule))
+        previous = winners.get(key)
+        if previous is not None:
+            prev_idx, prev_device = previous
+            status[prev_idx] = 'duplicate' if prev_device == device else 'shadowed'
+        winners[key] = (idx, device)
+        if known_devices and device and device not in known_devices:
+            status.setdefault(idx, 'missing device')
+
+    keep = sorted(idx for idx, _ in winners.values())
+    warnings = []
+    for idx in sorted(status):
+        rule = rules[idx]
+        label = f"{rule.get('app_name', '')} -> {rule_device_label(rule) or 'N/A'}"
+        if status[idx] == 'duplicate':
+            warnings.append(f"Duplicate rule skipped: {label}")
+        elif status[idx] == 'shadowed':
+            warnings.append(f"Rule overridden by a later rule for the same app: {label}")
+        else:
+            warnings.append(f"Device never seen in the device list: {label}")
+    return {
+        'rules': [rules[idx] for idx in keep],
+        'status': status,
+        'warnings': warnings,
+        'spawns_saved': len(rules) - len(keep),
+    }
+
+
+VALIDATION_CHUNK_SIZE = 100
+
+
+def build_device_index(devices):
+    """Map (direction, normalized label) to the device labels it matches."""
+    index = {}
+    for device in devices:
+        key = (device['direction'], normalize_device_label(device['name']))
+        index.setdefault(key, []).append(device['name'])
+    return index
+
+
+def build_app_index(app_labels):
+    """Map lower-cased EarTrumpet session labels (and their .exe-less form) to labels."""
+    index = {}
+    for label in app_labels:
+        for variant in app_label_variants(label):
+            index.setdefault(variant, set()).add(label)
+    return index
+
+
+def _validate_chunk(chunk, device_index, app_index):
+    reports = {}
+    app_labels = None
+    for name, profile in chunk:
+        report = {'rules': 0, 'missing_devices': [], 'apps_not_seen': [], 'ambiguous': []}
+        for rule in profile.get('rules', []):
+            report['rules'] += 1
+            app_name = (rule.get('app_name') or '').strip()
+            device_label = rule_device_label(rule)
+            direction = rule.get('direction') or 'Render'
+
+            matches = device_index.get((direction, normalize_device_label(device_label)), [])
+            if not matches:
+                report['missing_devices'].append(f"{app_name} -> {device_label or 'N/A'}")
+            elif len(matches) > 1:
+                report['ambiguous'].append(f"device '{device_label}' matches {len(matches)} {direction} devices")
+
+            if rule.get('match'):
+                if app_labels is None:
+                    app_labels = {label for labels in app_index.values() for label in labels}
+                regex = compile_pattern(rule.get('match'), app_name)
+                if not any(regex.fullmatch(label) for label in app_labels):
+                    report['apps_not_seen'].append(f"{app_name} ({rule.get('match')})")
+                continue
+
+            exact = set()
+            for variant in app_label_variants(app_name):
+                exact |= app_index.get(variant, set())
+            if not exact:
+                if app_labels is None:
+                    app_labels = {label for labels in app_index.values() for label in labels}
+                wanted = app_label_variants(app_name)
+                partial = sorted(label for label in app_labels if any(w and w in label.lower() for w in wanted))
+                if not partial:
+                    report['apps_not_seen'].append(app_name)
+                elif len(partial) > 1:
+                    report['ambiguous'].append(f"app '{app_name}' matches sessions {', '.join(partial)}")
+            elif len(exact) > 1:
+                report['ambiguous'].append(f"app '{app_name}' matches sessions {', '.join(sorted(exact))}")
+        reports[name] = report
+    return reports
+
+
+def validate_profiles(profiles, devices, app_labels, max_workers=4):
+    """Check every rule of every profile against one device and one app snapshot.
+
+    Profiles are validated in chunks on a thread pool against shared, read-only
+    indexes. Returns {profile name: report} with 'rules', 'missing_devices',
+    'apps_not_seen' and 'ambiguous' lists.
+    """
+    device_index = build_device_index(devices)
+    app_index = build_app_index(app_labels)
+    items = list(profiles.items())
+    chunks = [items[i:i + VALIDATION_CHUNK_SIZE] for i in range(0, len(items), VALIDATION_CHUNK_SIZE)]
+    reports = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for result in pool.map(lambda chunk: _validate_chunk(chunk, device_index, app_index), chunks):
+            reports.update(result)
+    return reports
+
+
+def format_validation_report(reports):
+    healthy = [name for name, r in reports.items() if not (r['missing_devices'] or r['apps_not_seen'] or r['ambiguous'])]
+    lines = [f"{len(healthy)} of {len(reports)} profile(s) healthy."]
+    for name in sorted(reports):
+        report = reports[name]
+        if name in healthy:
+            continue
+        lines.append("")
+        lines.append(f"{name} ({report['rules']} rule(s)):")
+        lines.extend(f"  missing device: {item}" for item in report['missing_devices'])
+        lines.extend(f"  app not seen: {item}" for item in report['apps_not_seen'])
+        lines.extend(f"  ambiguous: {item}" for item in report['ambiguous'])
+    return "\n".join(lines)
+
+
+PROFILE_WORD_REGEX = re.compile(r'[0-9a-z]+')
+# Profiles listed in the Profiles tab dropdown at most; the search box narrows the list
+PROFILE_LIST_LIMIT = 500
+
+
+def profile_words(name, profile):
+    """Search words of a profile: those of its name, app names and device labels, lower-cased."""
+    parts = [name]
+    for rule in profile.get('rules', []):
+        parts.append(rule.get('app_name') or '')
+        parts.append(rule_device_label(rule))
+    return frozenset(PROFILE_WORD_REGEX.findall(" ".join(parts).lower()))
+
+
+class ProfileSearchIndex:
+    """Inverted index from words to profile names, for the Profiles tab search.
+
+    Every word of a query must be the start of a word of the profile's name, app names
+    or device labels. Index words are kept sorted so a prefix is one bisect range.
+    add() and remove() only touch the postings of that profile. While typing, each
+    query usually extends the previous one, so its matches are narrowed down instead
+    of being searched again.
+    """
+
+    def __init__(self, profiles=None):
+        self.postings = {}  # word -> set of profile names
+        self.profile_words = {}  # profile name -> its words
+        self.rank = {}  # profile name -> position; kept in that order, so results follow the profiles'
+        self._next_rank = 0
+        self._last = None  # (query words, matches) of the previous search
+        for name, profile in (profiles or {}).items():
+            words = profile_words(name, profile)
+            self.profile_words[name] = words
+            self.rank[name] = self._next_rank
+            self._next_rank += 1
+            for word in words:
+                self.postings.setdefault(word, set()).add(name)
+        self.words = sorted(self.postings)
+
+    def add(self, name, profile):
+        """Index a new profile, or re-index an edited one (keeping its position)."""
+        words = profile_words(name, profile)
+        old = self.profile_words.get(name, frozenset())
+        for word in old - words:
+            self._unpost(word, name)
+        for word in words - old:
+            names = self.postings.get(word)
+            if names is None:
+                names = self.postings[word] = set()
+                bisect.insort(self.words, word)
+            names.add(name)
+        self.profile_words[name] = words
+        if name not in self.rank:
+            self.rank[name] = self._next_rank
+            self._next_rank += 1
+        self._last = None
+
+    def remove(self, name):
+        for word in self.profile_words.pop(name, ()):
+            self._unpost(word, name)
+        self.rank.pop(name, None)
+        self._last = None
+
+    def _unpost(self, word, name):
+        names = self.postings[word]
+        names.discard(name)
+        if not names:
+            del self.postings[word]
+            del self.words[bisect.bisect_left(self.words, word)]
+
+    def search(self, query, limit=PROFILE_LIST_LIMIT):
+        """Return (first `limit` matching names in profile order, match count), or None for an empty query."""
+        words = set(PROFILE_WORD_REGEX.findall(query.lower()))
+        if not words:
+            return None
+        found = None
+        pending = words
+        if self._last is not None:
+            last_words, last_found = self._last
+            # Every match of this query is a match of the last one if each earlier word is extended here
+            if all(any(word.startswith(last) for word in words) for last in last_words):
+                found = last_found
+                pending = words - last_words
+        # Longest words first: they usually match the fewest profiles
+        for word in sorted(pending, key=len, reverse=True):
+            lo = bisect.bisect_left(self.words, word)
+            hi = bisect.bisect_left(self.words, word + '{', lo)  # '{' sorts right after 'z'
+            if found is None:
+                found = set().union(*(self.postings[w] for w in self.words[lo:hi]))
+            elif len(found) < hi - lo:
+                # Fewer candidates left than index words to merge: check the candidates instead
+                found = {name for name in found if any(w.startswith(word) for w in self.profile_words[name])}
+            else:
+                found = set().union(*(found & self.postings[w] for w in self.words[lo:hi]))
+            if not found:
+                break
+        self._last = (words, found)
+        if len(found) <= limit:
+            return sorted(found, key=self.rank.__getitem__), len(found)
+        # The first `limit` in the profiles' order: with that many matches they come early in a scan
+        return list(itertools.islice((name for name in self.rank if name in found), limit)), len(found)
+
+
+APP_LIST_MAX_AGE = 10.0
+MAX_APP_CANDIDATES = 3
+
+
+class AppLabelResolver:
+    """Maps saved app names to EarTrumpet session labels, memoized per app-list fingerprint.
+
+    Candidates are ranked deterministically: exact label, label without '.exe', label
+    starting with the name as a word, name as a word inside the label, then plain
+    substring; ties go to the shorter label, then alphabetical. An exact match hides
+    the partial ones, so 'chrome' never spawns a '--set chromedriver'. Labels that
+    worked are tried first next time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = []
+        self.fingerprint = None
+        self.updated_at = None
+        self._ranked = {}
+        self._learned = {}
+        self._devices = {}
+
+    def update(self, labels):
+        labels = sorted(set(labels), key=str.lower)
+        fingerprint = hashlib.sha1("\n".join(labels).encode('utf-8')).hexdigest()
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.labels = labels
+                self.fingerprint = fingerprint
+                self._ranked = {}
+            self.updated_at = time.monotonic()
+
+    def age(self):
+        return float('inf') if self.updated_at is None else time.monotonic() - self.updated_at
+
+    @staticmethod
+    def _rank(app, label):
+        app = app.lower()
+        stem = app[:-4] if app.endswith('.exe') else app
+        text = label.lower()
+        if text == app:
+            return 0
+        if text == stem:
+            return 1
+        if re.match(re.escape(stem) + r'\b', text):
+            return 2
+        if re.search(r'\b' + re.escape(stem) + r'\b', text):
+            return 3
+        if stem in text:
+            return 4
+        return None
+
+    def candidates(self, app_name):
+        key = app_name.lower()
+        with self.lock:
+            fingerprint = self.fingerprint
+            ranked = self._ranked.get(key)
+            if ranked is None:
+                scored = sorted((rank, len(label), label.lower(), label)
+                                for label in self.labels
+                                for rank in [self._rank(app_name, label)] if rank is not None)
+                # An exact match makes partial ones wrong-label spawns; otherwise try the best few
+                if scored and scored[0][0] <= 1:
+                    scored = [item for item in scored if item[0] <= 1]
+                ranked = self._ranked[key] = [item[3] for item in scored[:MAX_APP_CANDIDATES]]
+            learned = self._learned.get((fingerprint, key))
+        if not ranked:
+            # No session matches (or no app list): fall back to the saved name and its .exe-less form
+            ranked = [app_name]
+            if app_name.lower().endswith('.exe'):
+                ranked.append(app_name[:-4])
+        if learned in ranked:
+            ranked = [learned] + [label for label in ranked if label != learned]
+        return ranked
+
+    def device_candidates(self, device_label):
+        candidates = [device_label]
+        # If device label ends with " (Default)", also try without it
+        suffix = " (Default)"
+        if device_label.endswith(suffix):
+            candidates.append(device_label[:-len(suffix)])
+        learned = self._devices.get(device_label)
+        if learned in candidates:
+            candidates = [learned] + [label for label in candidates if label != learned]
+        return candidates
+
+    def learn(self, app_name, app_label, device_label, device_used):
+        with self.lock:
+            self._learned[(self.fingerprint, app_name.lower())] = app_label
+            self._devices[device_label] = device_used
+
+
+def process_names():
+    """Lower-cased names of the running processes."""
+    return frozenset(p.info['name'].lower() for p in psutil.process_iter(['name']) if p.info.get('name'))
+
+
+def profile_key(profile):
+    """Hash of a profile's rules, to tell whether a plan built from them is still current."""
+    data = json.dumps(profile.get('rules', []), default=encode_json, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def plan_processes(processes, stems):
+    """The processes a plan depends on: those whose name contains one of its app stems (all when None)."""
+    if stems is None:
+        return frozenset(processes)
+    return frozenset(name for name in processes if any(stem in name for stem in stems))
+
+
+# Likely next profiles resolved after each activation, and plans kept in total
+WARM_PROFILES = 2
+WARM_PLAN_LIMIT = 8
+
+
+class ProfileWarmer:
+    """Learns which profile usually follows which and keeps their activation plans resolved.
+
+    Transitions between consecutive activations are counted (read once from the
+    activation history, then updated on each activation). After an activation, the
+    WARM_PROFILES most likely next profiles are resolved on a background thread by
+    `build_plans(names)`. Plans are kept in a bounded LRU and handed out by take() only
+    while the profile's rules and the running processes its apps depend on are unchanged.
+    """
+
+    def __init__(self, build_plans, history_path=HISTORY_FILE, limit=WARM_PLAN_LIMIT):
+        self.build_plans = build_plans  # callable(profile names) -> {name: plan}
+        self.history_path = history_path
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.transitions = {}  # profile -> {next profile: count}
+        self.last = None
+        self.plans = {}  # insertion order is the LRU order
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'warmed': 0,
+                      'cold_resolves': 0, 'cold_seconds': 0.0, 'checks': 0, 'check_seconds': 0.0}
+        self.started = False
+        self._executor = None
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._executor.submit(self._load_history)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load_history(self):
+        if not os.path.exists(self.history_path):
+            return
+        try:
+            conn = sqlite3.connect(self.history_path)
+            try:
+                names = [row[0] for row in conn.execute(
+                    "SELECT profile FROM activations WHERE source NOT IN ('rollback', 'hotplug') ORDER BY id")]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Could not read the activation history for warm-up: {e}")
+            return
+        with self.lock:
+            for previous, name in zip(names, names[1:]):
+                counts = self.transitions.setdefault(previous, {})
+                counts[name] = counts.get(name, 0) + 1
+            if self.last is None and names:
+                self.last = names[-1]
+            last = self.last
+        if last is not None:
+            self._warm(last)
+
+    def predict(self, profile_name, count=WARM_PROFILES):
+        """The profiles most often activated right after `profile_name`, most likely first."""
+        with self.lock:
+            counts = dict(self.transitions.get(profile_name, {}))
+        return [name for name, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:count]]
+
+    def observe(self, profile_name):
+        """Count an activation and warm the profiles likely to come next."""
+        with self.lock:
+            if self.last is not None:
+                counts = self.transitions.setdefault(self.last, {})
+                counts[profile_name] = counts.get(profile_name, 0) + 1
+            self.last = profile_name
+        if self.started:
+            try:
+                self._executor.submit(self._warm, profile_name)
+            except RuntimeError:
+                pass
+
+    def _warm(self, profile_name):
+        names = self.predict(profile_name)
+        if not names:
+            return
+        try:
+            plans = self.build_plans(names)
+        except Exception as e:
+            print(f"Could not warm up profiles {', '.join(names)}: {e}")
+            return
+        with self.lock:
+            for name, plan in plans.items():
+                self.plans.pop(name, None)
+                self.plans[name] = plan
+                self.stats['warmed'] += 1
+            while len(self.plans) > self.limit:
+                del self.plans[next(iter(self.plans))]
+
+    def take(self, profile_name, key, processes, seconds=0.0):
+        """The warm plan of a profile if still current, else None. `seconds` is the time the check took."""
+        with self.lock:
+            self.stats['checks'] += 1
+            self.stats['check_seconds'] += seconds
+            plan = self.plans.get(profile_name)
+            if plan is not None and plan['key'] == key and plan['processes'] == plan_processes(processes, plan['stems']):
+                self.plans[profile_name] = self.plans.pop(profile_name)
+                self.stats['hits'] += 1
+                return plan
+            if plan is not None:
+                del self.plans[profile_name]
+                self.stats['stale'] += 1
+            self.stats['misses'] += 1
+            return None
+
+    def note_cold_resolve(self, seconds):
+        with self.lock:
+            self.stats['cold_resolves'] += 1
+            self.stats['cold_seconds'] += seconds
+
+    def diagnostics(self):
+        """Hit rate and estimated time saved: cold resolves avoided minus the cost of the checks."""
+        with self.lock:
+            stats = dict(self.stats)
+            plans = list(self.plans)
+            last = self.last
+        cold = stats['cold_seconds'] / stats['cold_resolves'] if stats['cold_resolves'] else None
+        check = stats['check_seconds'] / stats['checks'] if stats['checks'] else 0.0
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'hits': stats['hits'], 'misses': stats['misses'], 'stale': stats['stale'], 'warmed': stats['warmed'],
+            'hit_rate': round(stats['hits'] / lookups, 3) if lookups else None,
+            'avg_cold_resolve_ms': round(cold * 1000, 2) if cold is not None else None,
+            'avg_check_ms': round(check * 1000, 2),
+            'saved_ms': round(stats['hits'] * cold * 1000 - stats['checks'] * check * 1000, 1) if cold is not None else None,
+            'warm_plans': plans,
+            'last': last,
+            'next': self.predict(last) if last is not None else [],
+        }
+
+
+class DeviceMonitor:
+    """Polls the backend's device list in the background and reports added/removed devices.
+
+    Windows only offers device notifications through COM (IMMNotificationClient),
+    which EarTrumpet's CLI does not expose, so this relies on a cheap periodic listing.
+    `on_change(added, removed)` is called from the monitor thread with device dicts.
+    """
+
+    def __init__(self, backend_getter, on_change, interval=DEVICE_POLL_INTERVAL, on_poll=None):
+        self.backend_getter = backend_getter
+        self.on_change = on_change
+        self.on_poll = on_poll
+        self.interval = interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def seed(self, devices):
+        """Use an already displayed device list as the baseline for the next diff."""
+        with self._lock:
+            self._snapshot = {(d['direction'], d['name']): d for d in devices}
+
+    def devices(self):
+        """The last known devices, sorted by name."""
+        with self._lock:
+            devices = list(self._snapshot.values()) if self._snapshot else []
+        return sorted(devices, key=lambda d: d['name'].lower())
+
+    def labels(self):
+        """Lower-cased labels of the last known devices, or None before the first listing."""
+        with self._lock:
+            if self._snapshot is None:
+                return None
+            return {name.lower() for _, name in self._snapshot}
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Device monitor error: {e}")
+            if self.on_poll:
+                self.on_poll()
+
+    def poll(self):
+        current = {}
+        for device in self.backend_getter().list_devices():
+            current[(device['direction'], device['name'])] = device
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = current
+        if previous is None:
+            return
+        added = [current[k] for k in current.keys() - previous.keys()]
+        removed = [previous[k] for k in previous.keys() - current.keys()]
+        if added or removed:
+            self.on_change(added, removed)
+
+
+TRIGGER_TYPES = ('app_started', 'device_appeared')
+SCHEDULER_POLL_INTERVAL = 5.0
+
+
+class CronSchedule:
+    """Minimal 5-field cron expression: minute hour day-of-month month day-of-week.
+
+    Each field accepts '*', numbers, ranges (a-b), lists (a,b) and steps (*/n, a-b/n).
+    Day-of-week uses 0 (or 7) for Sunday, as in crontab. As in cron, a day field
+    starting with '*' (e.g. */2) counts as unrestricted for the day-of-month or
+    day-of-week rule.
+    """
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        parts = self.expr.split()
+        if len(parts) != 5:
+            raise ValueError("expected 5 fields: minute hour day month weekday")
+        fields = [self._parse_field(part, lo, hi) for part, (lo, hi) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = parts[2].startswith('*')
+        self.any_weekday = parts[4].startswith('*')
+
+    @staticmethod
+    def _parse_field(text, lo, hi):
+        values = set()
+        for token in text.split(','):
+            step = 1
+            if '/' in token:
+                token, step_text = token.split('/', 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"invalid step in '{text}'")
+            if token == '*':
+                start, end = lo, hi
+            elif '-' in token:
+                start, end = (int(v) for v in token.split('-', 1))
+            else:
+                start = end = int(token)
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"'{text}' is out of range {lo}-{hi}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        # Like cron: when both day fields are restricted, either one may match
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, dt):
+        """Return the first matching minute strictly after `dt`, or None if there is none."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + 5
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        return None
+
+
+class ProfileScheduler:
+    """Activates profiles from their 'schedules' and 'triggers' entries.
+
+    Every schedule, plus one shared trigger poll, lives in a single heap ordered by
+    next fire time and is served by one timer thread, however many profiles have
+    schedules. Triggers are evaluated against one process/device snapshot per poll.
+    """
+
+    def __init__(self, on_activate, snapshot_provider, poll_interval=SCHEDULER_POLL_INTERVAL):
+        self.on_activate = on_activate              # callable(profile_name, reason)
+        self.snapshot_provider = snapshot_provider  # callable(need_devices) -> (process names, device labels or None)
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._triggers = []
+        self._last_processes = None
+        self._last_devices = None
+        self._thread = None
+        self._stopped = False
+
+    def load(self, profiles):
+        with self._cond:
+            self._heap = []
+            self._triggers = []
+            self._last_processes = None
+            self._last_devices = None
+            now = datetime.now()
+            for name, profile in profiles.items():
+                for expr in profile.get('schedules', []):
+                    try:
+                        cron = CronSchedule(expr)
+                    except ValueError as e:
+                        print(f"Ignoring schedule '{expr}' of profile '{name}': {e}")
+                        continue
+                    self._push(cron.next_after(now), name, cron)
+                for trigger in profile.get('triggers', []):
+                    if trigger.get('type') in TRIGGER_TYPES and trigger.get('match'):
+                        self._triggers.append((name, trigger['type'], trigger['match'].strip().lower()))
+            if self._triggers:
+                heapq.heappush(self._heap, (time.time(), next(self._seq), None, None))
+            self._cond.notify()
+
+    def _push(self, when, name, cron):
+        if when is not None:
+            heapq.heappush(self._heap, (when.timestamp(), next(self._seq), name, cron))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            due = []
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+                while self._heap and self._heap[0][0] <= time.time():
+                    when, _, name, cron = heapq.heappop(self._heap)
+                    if name is None:
+                        due.append((None, None))
+                        heapq.heappush(self._heap, (when + self.poll_interval, next(self._seq), None, None))
+                    else:
+                        due.append((name, f"schedule '{cron.expr}'"))
+                        self._push(cron.next_after(datetime.fromtimestamp(when)), name, cron)
+            for name, reason in due:
+                try:
+                    if name is None:
+                        self._poll_triggers()
+                    else:
+                        self.on_activate(name, reason)
+                except Exception as e:
+                    print(f"Scheduler error: {e}")
+
+    def _poll_triggers(self):
+        triggers = self._triggers
+        need_devices = any(kind == 'device_appeared' for _, kind, _ in triggers)
+        processes, devices = self.snapshot_provider(need_devices)
+        started = processes - self._last_processes if self._last_processes is not None else set()
+        appeared = devices - self._last_devices if devices is not None and self._last_devices is not None else set()
+        self._last_processes = processes
+        if devices is not None:
+            self._last_devices = devices
+
+        fired = set()
+        for name, kind, match in triggers:
+            if name in fired:
+                continue
+            if kind == 'app_started':
+                hit = match in started or (match + '.exe') in started
+            else:
+                hit = any(match in label for label in appeared)
+            if hit:
+                fired.add(name)
+                self.on_activate(name, f"trigger {kind} '{match}'")
+
+
+API_HOST = "127.0.0.1"
+API_LOOPBACK_NAMES = ('127.0.0.1', 'localhost', '[::1]')
+API_WILDCARD_HOSTS = ('', '0.0.0.0', '::')
+API_WORKERS = 4
+# Requests allowed to wait for a worker; beyond that they are answered 503 at once
+API_BACKLOG_PER_WORKER = 8
+API_MAX_BODY = 64 * 1024
+API_BUSY_LINGER = 0.2
+API_BUSY_RESPONSE = (b"HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: 30\r\nRetry-After: 1\r\n\r\n{\"error\": \"too many requests\"}")
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    server_version = "SWAP"
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        t0 = time.perf_counter()
+        server = self.server
+        path = self.path.split('?', 1)[0].rstrip('/')
+        route = server.routes.get((method, path))
+        refusal = self._refusal(method)
+        if refusal is not None:
+            status, body = refusal
+        elif server.authorization is not None and not hmac.compare_digest(
+                self.headers.get('Authorization', '').encode('utf-8'), server.authorization):
+            status, body = 401, {'error': "missing or wrong token"}
+        elif route is None:
+            status, body = 404, {'error': f"no such endpoint: {method} {path or '/'}"}
+        elif method == 'POST' and self.headers.get_content_type() != 'application/json':
+            status, body = 415, {'error': "POST requests must have Content-Type: application/json"}
+        else:
+            try:
+                status, body = route(self._read_json())
+            except ValueError as e:
+                status, body = 400, {'error': str(e)}
+            except Exception as e:
+                print(f"Control API error on {method} {path}: {e}")
+                status, body = 500, {'error': str(e)}
+        body['elapsed_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        data = json.dumps(body, default=encode_json).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _refusal(self, method):
+        """(status, body) for requests a web page may have sent, else None.
+
+        Browsers send an Origin header with cross-site requests and cannot send a JSON POST
+        cross-site without a preflight this server never answers, so a page cannot activate
+        profiles (CSRF). A page reached through DNS rebinding still names its own host in
+        Host, so that is checked too.
+        """
+        if self.headers.get('Origin') is not None:
+            return 403, {'error': "requests from web pages are not accepted"}
+        allowed = self.server.allowed_hosts
+        if allowed is not None and (self.headers.get('Host') or '').lower() not in allowed:
+            return 403, {'error': "unexpected Host header"}
+        return None
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > API_MAX_BODY:
+            raise ValueError("request body too large")
+        if not length:
+            return {}
+        data = json.loads(self.rfile.read(length))
+        if not isinstance(data, dict):
+            raise ValueError("request body must be a JSON object")
+        return data
+
+    def log_message(self, format, *args):
+        # One line per request would flood the console of a polled machine; errors are printed above
+        pass
+
+
+class ControlServer(HTTPServer):
+    """Optional HTTP/JSON control API of a running SWAP (see api_port in config.ini).
+
+    Served from the process's warm state: the profiles in memory, the device monitor's
+    list and the app resolver's snapshot. Requests run on a fixed pool of workers and
+    every answer carries its 'elapsed_ms'. Activations go through apply_profile, so they
+    queue with the GUI, schedules and other processes and the newest one wins.
+    """
+
+    # Bursts from a controller must queue in the kernel, not be dropped into SYN retries
+    request_queue_size = 128
+
+    def __init__(self, manager, host=API_HOST, port=0, workers=API_WORKERS, token=None):
+        super().__init__((host, port), ControlRequestHandler)
+        self.manager = manager
+        # Compared in constant time, so response times do not leak how much of a guess matched
+        self.authorization = f"Bearer {token}".encode('utf-8') if token else None
+        # Host headers accepted (with or without the port); any when listening on every address
+        if host in API_WILDCARD_HOSTS:
+            self.allowed_hosts = None
+        else:
+            names = set(API_LOOPBACK_NAMES) | {f"[{host}]" if ':' in host else host}
+            port = self.server_address[1]
+            self.allowed_hosts = {name.lower() for name in names} | {f"{name}:{port}".lower() for name in names}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='swap-api')
+        self.slots = threading.BoundedSemaphore(workers * (1 + API_BACKLOG_PER_WORKER))
+        # Concurrent requests share one device/app listing instead of each starting EarTrumpet
+        self.refresh_lock = threading.Lock()
+        self.routes = {
+            ('GET', '/profiles'): self.list_profiles,
+            ('GET', '/devices'): self.list_devices,
+            ('GET', '/apps'): self.list_apps,
+            ('POST', '/validate'): self.validate,
+            ('POST', '/activate'): self.activate,
+            ('GET', '/diagnostics'): self.diagnostics,
+        }
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.sendall(API_BUSY_RESPONSE)
+                # Closing with the request still unread would reset the connection before
+                # the client reads the answer, so wait (briefly) for it to hang up first
+                request.shutdown(socket.SHUT_WR)
+                request.settimeout(API_BUSY_LINGER)
+                while request.recv(API_MAX_BODY):
+                    pass
+            except OSError:
+                pass
+            self.close_request(request)
+            return
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def warm_devices(self):
+        manager = self.manager
+        devices = manager.device_monitor.devices() or list(manager.devices)
+        if not devices:
+            with self.refresh_lock:
+                devices = manager.device_monitor.devices()
+                if not devices:
+                    manager.device_monitor.poll()
+                    devices = manager.device_monitor.devices()
+        return devices
+
+    def warm_apps(self):
+        with self.refresh_lock:
+            self.manager.refresh_app_labels()
+        return list(self.manager.app_resolver.labels)
+
+    def _profile_names(self, request):
+        names = request.get('profiles')
+        profiles = dict(self.manager.profiles)
+        if names is None:
+            return profiles
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError("'profiles' must be a list of profile names")
+        unknown = [name for name in names if name not in profiles]
+        if unknown:
+            raise ValueError(f"unknown profile(s): {', '.join(unknown)}")
+        return {name: profiles[name] for name in names}
+
+    def list_profiles(self, request):
+        manager = self.manager
+        return 200, {'active': manager.active_profile,
+                     'profiles': [{'name': name, 'rules': len(profile.get('rules', []))}
+                                  for name, profile in dict(manager.profiles).items()]}
+
+    def list_devices(self, request):
+        return 200, {'devices': self.warm_devices()}
+
+    def list_apps(self, request):
+        return 200, {'apps': self.warm_apps()}
+
+    def diagnostics(self, request):
+        return 200, {'warm_up': self.manager.warmer.diagnostics()}
+
+    def validate(self, request):
+        profiles = self._profile_names(request)
+        reports = validate_profiles(profiles, self.warm_devices(), self.warm_apps())
+        healthy = sum(1 for r in reports.values() if not (r['missing_devices'] or r['apps_not_seen'] or r['ambiguous']))
+        return 200, {'healthy': healthy, 'profiles': reports}
+
+    def activate(self, request):
+        profile_name = request.get('profile')
+        if not isinstance(profile_name, str) or not profile_name:
+            raise ValueError("'profile' is required")
+        manager = self.manager
+        if profile_name not in manager.profiles:
+            return 404, {'error': f"profile '{profile_name}' not found"}
+        cancel_event = manager.activation_queue.request()
+        results = []
+        applied = manager.apply_profile(profile_name, source='api', cancel_event=cancel_event, results=results)
+        timed_out = sum(1 for _, ok in results if ok == TIMED_OUT)
+        if cancel_event.superseded:
+            print(f"Profile '{profile_name}' superseded by a newer activation after {applied} rule(s). (control API)")
+        else:
+            print(f"Profile '{profile_name}': {applied} of {len(results)} rule(s) applied. (control API)")
+        return 200, {'profile': profile_name, 'applied': applied, 'rules': len(results),
+                     'timed_out': timed_out, 'superseded': cancel_event.superseded}
+
+
 class AutocompleteCombobox(ttk.Combobox):
     def set_completion_list(self, completion_list):
         self._completion_list = sorted(completion_list, key=str.lower)
@@ -65,6 +1490,19 @@ class AutocompleteCombobox(ttk.Combobox):
         self['state'] = 'normal'
         self.bind('<KeyRelease>', self.handle_keyrelease)
 
+    def add_completions(self, items):
+        if not hasattr(self, '_completion_list'):
+            self.set_completion_list([])
+        keys = [c.lower() for c in self._completion_list]
+        for item in items:
+            key = item.lower()
+            idx = bisect.bisect_left(keys, key)
+            if idx < len(keys) and self._completion_list[idx] == item:
+                continue
+            keys.insert(idx, key)
+            self._completion_list.insert(idx, item)
+        self['values'] = self._completion_list
+
     def autocomplete(self):
         value = self.get()
         if not value:
@@ -109,25 +1547,92 @@ class ToolTip:
 
 
 class AudioProfileManager:
-    def __init__(self):
+    def __init__(self, headless=False):
         self.changes_pending = False
-        self.root = tk.Tk()
-        self.root.title("SmartWindowsAudioProfiles")
-        self.root.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
-        self.root.geometry("1200x600")
-        self.root.minsize(800, 600)
+        self.root = None
+        self.background = False
+        self.tray_icon = None
+        self._main_queue = queue.Queue()
+        self._quit_event = threading.Event()
         self.config_file = PROFILE_FILE
         self.eartrumpet_path = "EarTrumpet.exe"
         self.profiles = {}
+        self.invalid_profiles = {}  # name -> (profile as read, reason), written back unchanged on save
+        self.profiles_load_error = None  # set when audio_profiles.json could not be read; saving is then refused
+        self.profiles_stat = (0, -1)
+        # soundvolumeview_path of audio_profiles.json, passed on to swap-cli.py in swap_state.bin
+        self.profiles_soundvolumeview_path = ''
+        self._publish_lock = threading.Lock()
+        self._published = None  # (content key, time) of the last swap_state.bin written
+        self._profile_index = None  # built on the first search, see profile_index()
+        self.running_apps = set()
         self.devices = []
+        self.input_devices = []
+        self.output_devices = []
+        self._device_keys = []
+        self._input_keys = []
+        self._output_keys = []
+        self.cached_apps = []
+        self.devices_loading = False
+        self.refresh_button = None
+        self.input_devices_listbox = None
+        self.output_devices_listbox = None
         self.ini_path = SETTINGS_FILE
         self.settings = configparser.ConfigParser()
         self.load_ini()
         self.load_config()
+        self.active_profile = None
+        self.activation_executor = ThreadPoolExecutor(max_workers=1)
+        self.activation_queue = ActivationQueue()
+        self.last_activation = None  # QueuedCancel of the latest apply_profile
+        self.routing_state = RoutingState()
+        self.history = ActivationHistory()
+        self.app_resolver = AppLabelResolver()
+        self._backend = None
+        self._backend_key = None
+        self.timed_out_rules = []  # rules whose --set was killed by the watchdog in the last activation
+        self.activation_cancel = None
+        self._activation_progress_lock = threading.Lock()
+        self._activation_progress_state = None
+        self._activation_progress_scheduled = False
+        self.scheduler = ProfileScheduler(self._on_scheduled_activation, self._scheduler_snapshot)
+        self.device_monitor = DeviceMonitor(lambda: self.backend, self._on_devices_changed,
+                                            self.device_poll_interval, on_poll=lambda: self.publish_state(refresh_apps=True))
+        self.control_server = None
+        self.warmer = ProfileWarmer(self.build_plans)
+        if not headless:
+            self.create_window()
+
+    def create_window(self):
+        self.root = tk.Tk()
+        self.root.title("SmartWindowsAudioProfiles")
+        self.root.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
+        self.root.geometry("1200x600")
+        self.root.minsize(800, 600)
         self.create_gui()
         self.center_root()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+    def call_soon(self, func, *args):
+        """Run `func` on the Tk thread, or on the background loop when there is no window."""
+        root = self.root
+        if root is not None:
+            try:
+                root.after(0, func, *args)
+                return
+            except (RuntimeError, tk.TclError):
+                pass
+        self._main_queue.put((func, args))
+
+    def call_in_gui(self, func, *args):
+        """Like call_soon, but dropped when the window is closed (UI-only updates)."""
+        root = self.root
+        if root is not None:
+            try:
+                root.after(0, func, *args)
+            except (RuntimeError, tk.TclError):
+                pass
+
     def center_root(self):
         self.root.update_idletasks()
         w = 1200
@@ -138,16 +1643,42 @@ class AudioProfileManager:
         y = (sh // 2) - (h // 2)
         self.root.geometry(f"{w}x{h}+{x}+{y}")
 
+    @property
+    def backend(self):
+        """The configured AudioBackend, rebuilt when its name or executable path changes."""
+        key = (self.backend_name, self.eartrumpet_path, self.soundvolumeview_path)
+        if self._backend is None or self._backend_key != key:
+            self._backend = BACKENDS[self.backend_name](self)
+            self._backend_key = key
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        # Use a given backend (e.g. a SimulatedBackend for load tests) until the config changes
+        self._backend = backend
+        self._backend_key = (self.backend_name, self.eartrumpet_path, self.soundvolumeview_path)
+
     def load_ini(self):
         self.settings.read(self.ini_path)
         if 'App' not in self.settings:
             self.settings['App'] = {}
         self.eartrumpet_path = self.settings['App'].get('eartrumpet_path', "EarTrumpet.exe")
+        self.backend_name = self.settings['App'].get('backend', 'eartrumpet').strip().lower()
+        if self.backend_name not in BACKENDS:
+            print(f"Unknown backend '{self.backend_name}' in config.ini, using eartrumpet")
+            self.backend_name = 'eartrumpet'
+        self.soundvolumeview_path = self.settings['App'].get('soundvolumeview_path', "SoundVolumeView.exe")
         self.auto_save_enabled = self.settings['App'].getboolean('auto_save', True)
+        self.device_poll_interval = self.settings['App'].getfloat('device_poll_interval', DEVICE_POLL_INTERVAL)
+        self.api_port = self.settings['App'].getint('api_port', 0)
+        self.api_host = self.settings['App'].get('api_host', API_HOST)
+        self.api_workers = max(1, self.settings['App'].getint('api_workers', API_WORKERS))
+        self.api_token = self.settings['App'].get('api_token', '').strip()
+        COMMAND_TIMEOUTS.update(read_timeouts(self.settings))
 
     def save_ini(self):
         self.settings['App']['eartrumpet_path'] = self.eartrumpet_path
-        self.settings['App']['auto_save'] = str(self.auto_save_var.get() if hasattr(self, 'auto_save_var') else True)
+        self.settings['App']['auto_save'] = str(self.auto_save_var.get() if hasattr(self, 'auto_save_var') else self.auto_save_enabled)
         with open(self.ini_path, 'w') as f:
             self.settings.write(f)
         if hasattr(self, "auto_save_var") and self.auto_save_var.get():
@@ -164,15 +1695,29 @@ class AudioProfileManager:
 
         self.devices_frame = ttk.Frame(notebook)
         notebook.add(self.devices_frame, text="Audio Devices")
-        self.create_devices_tab()
-
         self.settings_frame = ttk.Frame(notebook)
         notebook.add(self.settings_frame, text="Settings")
         about_tab = ttk.Frame(notebook)
         notebook.add(about_tab, text="About")
+
+        # Only the Profiles tab is visible at startup; the others are built on first view
+        self.refresh_button = None
+        self.input_devices_listbox = None
+        self.output_devices_listbox = None
+        self._pending_tabs = {
+            str(self.devices_frame): self.create_devices_tab,
+            str(self.settings_frame): self.create_settings_tab,
+            str(about_tab): lambda: self.create_about_tab(about_tab),
+        }
+        notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+
+    def _on_tab_changed(self, event):
+        builder = self._pending_tabs.pop(event.widget.select(), None)
+        if builder is not None:
+            builder()
+
+    def create_about_tab(self, about_tab):
         ttk.Label(about_tab, text="SmartWindowsAudioProfiles\nby dayeggpi\nVersion 1.0.1", font=('Courrier', 9)).pack(pady=50)
-        ttk.Button(self.settings_frame, text="Open WindowsVolume Mixer", command=self.open_volume_mixer).pack(pady=5)
-        self.create_settings_tab()
 
     def open_volume_mixer(self):
         try:
@@ -184,6 +1729,8 @@ class AudioProfileManager:
                 messagebox.showerror("Error", f"Could not open Volume Mixer: {e}", parent=self.root)
 
     def mark_profiles_tab_unsaved(self):
+        if self.root is None:
+            return
         notebook = self.profiles_frame.master
         for i in range(notebook.index("end")):
             if "Profiles" in notebook.tab(i, "text"):
@@ -207,6 +1754,19 @@ class AudioProfileManager:
         ttk.Button(top_frame, text="Delete Profile", command=self.delete_profile).pack(side='left', padx=2)
 
         ttk.Button(top_frame, text="Import", command=self.import_profiles).pack(side='right', padx=2)
+        self.validate_button = ttk.Button(top_frame, text="Validate All", command=self.validate_all_profiles)
+        self.validate_button.pack(side='right', padx=2)
+
+        search_frame = ttk.Frame(self.profiles_frame)
+        search_frame.pack(fill='x', padx=5)
+        ttk.Label(search_frame, text="Search:").pack(side='left')
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.pack(side='left', padx=(5, 10))
+        search_entry.bind('<Return>', self.select_first_match)
+        self.search_var.trace_add('write', lambda *args: self.filter_profiles())
+        self.search_count_var = tk.StringVar(value="")
+        ttk.Label(search_frame, textvariable=self.search_count_var, foreground='#606060').pack(side='left')
 
         rules_frame = ttk.LabelFrame(self.profiles_frame, text="Profile Rules")
         rules_frame.pack(fill='both', expand=True, padx=5, pady=5)
@@ -221,6 +1781,9 @@ class AudioProfileManager:
         self.rules_listbox.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+        self.analysis_var = tk.StringVar(value="")
+        ttk.Label(rules_frame, textvariable=self.analysis_var, foreground='#a05000').pack(anchor='w', padx=5)
+
         button_frame = ttk.Frame(rules_frame)
         button_frame.pack(fill='x', padx=5, pady=5)
 
@@ -230,17 +1793,23 @@ class AudioProfileManager:
         self.activate_button = ttk.Button(top_frame, text="Activate Profile", command=self.activate_profile)
         self.activate_button.pack(side='left', padx=2)
 
+        ttk.Button(top_frame, text="Rollback", command=self.rollback_routing).pack(side='left', padx=2)
+
         self.export_button = ttk.Button(top_frame, text="Export", command=self.export_profiles)
         self.export_button.pack(side='right', padx=2)
 
         self.add_rule_button = ttk.Button(button_frame, text="Add Rule", command=self.add_rule)
         self.add_rule_button.pack(side='left', padx=2)
 
+        self.schedule_button = ttk.Button(top_frame, text="Schedule...", command=self.edit_schedule)
+        self.schedule_button.pack(side='left', padx=2)
+
         self.rules_listbox.bind('<Double-1>', lambda e: self.edit_rule())
 
         self.activate_button.config(state='disabled')
         self.export_button.config(state='disabled')
         self.add_rule_button.config(state='disabled')
+        self.schedule_button.config(state='disabled')
 
         self.auto_save_var = tk.BooleanVar(value=self.auto_save_enabled)
         ttk.Checkbutton(self.profiles_frame, text="Auto-Save Changes", variable=self.auto_save_var,
@@ -248,6 +1817,15 @@ class AudioProfileManager:
 
         ttk.Button(self.profiles_frame, text="Save Changes Now", command=self.save_config).pack(anchor='w', padx=10, pady=5)
 
+        activation_frame = ttk.Frame(self.profiles_frame)
+        activation_frame.pack(fill='x', padx=10, pady=(0, 5))
+        self.activation_progress = ttk.Progressbar(activation_frame, mode='determinate', length=200)
+        self.activation_progress.pack(side='left')
+        self.activation_cancel_button = ttk.Button(activation_frame, text="Cancel", command=self.cancel_activation, state='disabled')
+        self.activation_cancel_button.pack(side='left', padx=5)
+        self.activation_status_var = tk.StringVar(value="")
+        ttk.Label(activation_frame, textvariable=self.activation_status_var).pack(side='left', padx=5)
+
     def _on_input_listbox_hover(self, event):
         if not hasattr(self, "input_devices"):
             self.input_tip.hidetip()
@@ -319,7 +1897,15 @@ class AudioProfileManager:
         self.output_devices_listbox.bind("<Motion>", self._on_output_listbox_hover)
         self.output_devices_listbox.bind("<Leave>", lambda e: self.output_tip.hidetip())
 
+        # Devices listed before the tab was first opened
+        self.input_devices_listbox.insert(tk.END, *[d['name'] for d in self.input_devices])
+        self.output_devices_listbox.insert(tk.END, *[d['name'] for d in self.output_devices])
+        self._set_refresh_state(self.devices_loading)
+        self.update_device_counts()
+
     def update_device_counts(self):
+        if self.input_devices_listbox is None:
+            return
         self.input_devices_listbox.master.master.children['!label'].config(
             text=f"INPUT ({len(self.input_devices)} items)"
         )
@@ -331,6 +1917,14 @@ class AudioProfileManager:
         webbrowser.open_new(r"https://github.com/File-New-Project/EarTrumpet")
 
     def create_settings_tab(self):
+        ttk.Button(self.settings_frame, text="Open WindowsVolume Mixer", command=self.open_volume_mixer).pack(pady=5)
+        diagnostics_frame = ttk.LabelFrame(self.settings_frame, text="Diagnostics")
+        diagnostics_frame.pack(fill='x', padx=10, pady=(10, 0))
+        self.profiling_var = tk.BooleanVar(value=PROFILER.enabled)
+        ttk.Checkbutton(diagnostics_frame, text="Profile operations (time and memory), for bug reports",
+                        variable=self.profiling_var, command=self.toggle_profiling).pack(anchor='w', padx=5, pady=(5, 0))
+        ttk.Label(diagnostics_frame, text=f"Loading, activating, refreshing devices, importing and validating write\n"
+                                          f"a .pstats, a .collapsed (flame graph) and a .txt file each to {PROFILE_RUN_DIR}").pack(anchor='w', padx=5, pady=5)
         path_frame = ttk.LabelFrame(self.settings_frame, text="Configuration")
         path_frame.pack(fill='x', padx=10, pady=10)
 
@@ -362,6 +1956,7 @@ class AudioProfileManager:
                 messagebox.showerror("Error", "Profile name already exists!", parent=self.root)
                 return
             self.profiles[name] = {'rules': []}
+            self.reindex_profile(name)
             self.update_profile_combo()
             self.profile_var.set(name)
             if "Select a profile..." in self.profile_combo['values']:
@@ -388,7 +1983,9 @@ class AudioProfileManager:
 
         if messagebox.askyesno("Confirm", f"Delete profile '{current}'?"):
             del self.profiles[current]
+            self.reindex_profile(current)
             print(f"After deletion: {list(self.profiles.keys())}")
+            self.reload_schedules()
             self.update_profile_combo()
             self.profile_var.set("Select a profile...")
             self.on_profile_selected()
@@ -412,148 +2009,516 @@ class AudioProfileManager:
             if not messagebox.askyesno("Unsaved Changes", "You have unsaved changes. Apply with current in-memory rules?", parent=self.root):
                 return
 
-        applied = self.apply_profile(current)
+        if self.activation_cancel is not None:
+            messagebox.showwarning("Warning", "A profile activation is already running.", parent=self.root)
+            return
+
+        self.start_activation(current)
+
+    def start_activation(self, profile_name, reason=None):
+        """Run a profile's rules on the activation executor, reporting progress on the Tk thread."""
+        if profile_name not in self.profiles:
+            return
+        rules = analyze_rules(self.profiles[profile_name]['rules'])['rules']
+        self._submit_activation(profile_name, rules, reason)
+
+    def _submit_activation(self, profile_name, rules, reason):
+        cancel_event = self.activation_queue.request()
+        self.activation_cancel = cancel_event
+        self.activation_progress['maximum'] = max(len(rules), 1)
+        self.activation_progress['value'] = 0
+        self.activation_status_var.set(f"Activating '{profile_name}'...")
+        self.activation_cancel_button.config(state='normal')
+        self.activate_button.config(state='disabled')
+        self.activation_executor.submit(self._activation_worker, profile_name, rules, cancel_event, reason)
+
+    @profiled('activation')
+    def _activation_worker(self, profile_name, rules, cancel_event, reason):
+        results = []
+        timings = []
+        started = time.time()
+        t0 = time.perf_counter()
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            self.call_soon(self._finish_activation, profile_name, results, len(rules), cancel_event, True, reason)
+            return
+        # Whether the run stopped early is decided here: once it is over, the queue may
+        # already hold the next request and cancel_event.is_set() would report that instead
+        stopped = []
+        try:
+            self.active_profile = profile_name
+            self.routing_state.push_snapshot(profile_name)
+            plan = self.take_plan(profile_name)
+            self.timed_out_rules = []
+            results = self.run_rules(rules, progress=self._post_activation_progress, cancel_event=cancel_event,
+                                     timings=timings, plan=plan, stopped=stopped)
+            self.routing_state.save()
+        except Exception as e:
+            print(f"Error activating profile '{profile_name}': {e}")
+        finally:
+            lock.release()
+        self.warmer.observe(profile_name)
+        source = 'trigger' if reason is not None else 'gui'
+        self.history.record(profile_name, source, started, time.perf_counter() - t0, results, timings)
+        self.call_soon(self._finish_activation, profile_name, results, len(rules), cancel_event, bool(stopped), reason)
+
+    def _post_activation_progress(self, done, total, rule):
+        # Coalesce updates: at most one pending Tk callback, however fast rules complete
+        with self._activation_progress_lock:
+            self._activation_progress_state = (done, total, rule)
+            if self._activation_progress_scheduled:
+                return
+            self._activation_progress_scheduled = True
+        try:
+            self.root.after(ACTIVATION_PROGRESS_INTERVAL_MS, self._show_activation_progress)
+        except (AttributeError, RuntimeError, tk.TclError):
+            self._activation_progress_scheduled = False
+
+    def _show_activation_progress(self):
+        with self._activation_progress_lock:
+            done, total, rule = self._activation_progress_state
+            self._activation_progress_scheduled = False
+        if self.root is None:
+            return
+        self.activation_progress['maximum'] = max(total, 1)
+        self.activation_progress['value'] = done
+        self.activation_status_var.set(f"Rule {done}/{total}: {rule.get('app_name', '')} -> {rule_device_label(rule) or 'N/A'}")
+
+    def cancel_activation(self):
+        if self.activation_cancel is not None:
+            self.activation_cancel.set()
+            self.activation_cancel_button.config(state='disabled')
+            self.activation_status_var.set("Cancelling after the current rule...")
+
+    def _finish_activation(self, profile_name, results, total, cancel_event, cancelled, reason, rollback=False):
+        if self.activation_cancel is cancel_event:
+            self.activation_cancel = None
+        if self.root is None:
+            # The window was closed while running in the background
+            applied = sum(1 for _, ok in results if ok is True)
+            print(f"Profile '{profile_name}': {applied} of {total} rule(s) applied.")
+            return
+        if self.activation_cancel is None:
+            self.activation_cancel_button.config(state='disabled')
+        self.activation_progress['value'] = len(results)
+        if self.profile_var.get() in self.profiles:
+            self.activate_button.config(state='normal')
+
+        applied = sum(1 for _, ok in results if ok is True)
+        failed = [rule for rule, ok in results if ok is not True]
+        timed_out = sum(1 for _, ok in results if ok == TIMED_OUT)
+        summary = f"Profile '{profile_name}' activated with {applied} of {total} rule(s)."
+        if rollback:
+            summary = f"Rolled back '{profile_name}': {applied} of {total} route(s) restored."
+        if cancelled:
+            summary = f"Activation of '{profile_name}' cancelled after {len(results)} of {total} rule(s); {applied} applied."
+            if getattr(cancel_event, 'superseded', False):
+                summary = (f"Activation of '{profile_name}' superseded by a newer one after {len(results)} of {total} "
+                           f"rule(s); {applied} applied.")
+        if timed_out:
+            summary += f" {timed_out} timed out."
+        self.activation_status_var.set(summary)
+
+        if rollback:
+            if failed:
+                messagebox.showwarning("Rollback", f"{summary}\n\n{len(failed)} route(s) could not be restored.", parent=self.root)
+            elif not cancelled:
+                messagebox.showinfo("Rollback", summary, parent=self.root)
+            return
+
+        if reason is not None:
+            print(f"{summary} ({reason})")
+            return
         if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
             self.save_config()
 
-        if applied == 0:
+        if failed:
+            outcomes = dict((id(rule), ok) for rule, ok in results)
+            lines = [f"{rule.get('app_name', '')} -> {rule_device_label(rule) or 'N/A'}"
+                     + (" (timed out)" if outcomes[id(rule)] == TIMED_OUT else "") for rule in failed[:20]]
+            if len(failed) > 20:
+                lines.append(f"... and {len(failed) - 20} more")
+            messagebox.showwarning(
+                "Warning",
+                f"{summary}\n\n{len(failed)} rule(s) were not applied. Ensure the apps have an active audio session, "
+                "and the EarTrumpet path is correct:\n" + "\n".join(lines),
+                parent=self.root
+            )
+        elif applied == 0 and not cancelled:
             messagebox.showwarning("Warning", "No rules were applied. Ensure the app has an active audio session, and the EarTrumpet path is correct.", parent=self.root)
-        else:
-            messagebox.showinfo("Success", f"Profile '{current}' activated with {applied} rule(s).", parent=self.root)
-            
-    
-    def apply_profile(self, profile_name):
+        elif not cancelled:
+            messagebox.showinfo("Success", summary, parent=self.root)
+
+    @profiled('apply_profile')
+    def apply_profile(self, profile_name, source='cli', cancel_event=None, results=None):
+        """Apply a profile without the GUI and return the applied rule count.
+
+        `cancel_event` is the activation's queue entry (taken here if not given); afterwards
+        `last_activation.superseded` tells whether a newer request cut it short. `results`
+        (if given) receives the [(rule, outcome)] of the rules that were run.
+        """
         if profile_name not in self.profiles:
-            messagebox.showwarning("Warning", f"Profile Name not in profile", parent=self.root) #to delete
             return 0
+        if cancel_event is None:
+            cancel_event = self.activation_queue.request()
+        self.last_activation = cancel_event
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            return 0
+
+        try:
+            started = time.time()
+            t0 = time.perf_counter()
+            self.active_profile = profile_name
+            rules = analyze_rules(self.profiles[profile_name]['rules'])['rules']
+            self.routing_state.push_snapshot(profile_name)
+            self.timed_out_rules = []
+            timings = []
+            outcomes = self.run_rules(rules, cancel_event=cancel_event, timings=timings, plan=self.take_plan(profile_name))
+            self.routing_state.save()
+        finally:
+            lock.release()
+        self.warmer.observe(profile_name)
+        self.history.record(profile_name, source, started, time.perf_counter() - t0, outcomes, timings)
+        if results is not None:
+            results.extend(outcomes)
+        return sum(1 for _, ok in outcomes if ok is True)
+
+    def rollback_routing(self):
+        if self.activation_cancel is not None:
+            messagebox.showwarning("Warning", "A profile activation is already running.", parent=self.root)
+            return
+        cancel_event = self.activation_queue.request()
+        self.activation_cancel = cancel_event
+        self.activation_progress['value'] = 0
+        self.activation_status_var.set("Rolling back...")
+        self.activation_cancel_button.config(state='normal')
+        self.activate_button.config(state='disabled')
+        self.activation_executor.submit(self._rollback_worker, cancel_event)
+
+    @profiled('rollback')
+    def _rollback_worker(self, cancel_event):
+        # The snapshot is popped under the activation lock: another SWAP process may have
+        # activated or rolled back since this one last read routing_state.json
+        results = []
+        timings = []
+        started = time.time()
+        t0 = time.perf_counter()
+        stopped = []
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            self.call_soon(self._end_rollback, cancel_event, None)
+            return
+        try:
+            result = self.routing_state.pop_rollback()
+            if result is None:
+                self.call_soon(self._end_rollback, cancel_event, "There is no earlier routing to roll back to.")
+                return
+            profile_name, routes, unknown = result
+            if unknown:
+                print(f"Rollback: no earlier device recorded for {', '.join(r['app_name'] for r in unknown)}; left as is.")
+            if routes:
+                # Only the routes that differ from the current ones are re-applied
+                self.active_profile = None
+                self.timed_out_rules = []
+                results = self.run_rules(routes, progress=self._post_activation_progress, cancel_event=cancel_event,
+                                         timings=timings, stopped=stopped)
+            self.routing_state.save()
+        except Exception as e:
+            print(f"Error rolling back routing: {e}")
+            self.call_soon(self._end_rollback, cancel_event, f"Error rolling back routing: {e}")
+            return
+        finally:
+            lock.release()
+        if not routes:
+            self.call_soon(self._end_rollback, cancel_event,
+                           f"Nothing to restore: the routing before '{profile_name}' was not set by SWAP.")
+            return
+        self.history.record(profile_name, 'rollback', started, time.perf_counter() - t0, results, timings)
+        self.call_soon(self._finish_activation, profile_name, results, len(routes), cancel_event, bool(stopped), None,
+                       True)
+
+    def _end_rollback(self, cancel_event, message):
+        """Finish a rollback that re-applied nothing; `message` is None when it was superseded."""
+        if self.activation_cancel is cancel_event:
+            self.activation_cancel = None
+        if self.root is None:
+            if message:
+                print(f"Rollback: {message}")
+            return
+        if self.activation_cancel is None:
+            self.activation_cancel_button.config(state='disabled')
+        if self.profile_var.get() in self.profiles:
+            self.activate_button.config(state='normal')
+        self.activation_status_var.set(message or "Rollback cancelled.")
+        if message:
+            messagebox.showinfo("Rollback", message, parent=self.root)
+
+    def resolve_rules(self, rules):
+        """Get the apps, expand pattern rules and group the rules per app: everything before the --set calls."""
+        if rules:
+            self.refresh_app_labels()
+        if any(rule.get('match') for rule in rules):
+            # Patterns are matched once against the current apps and become plain rules
+            rules = expand_pattern_rules(rules, self.pattern_targets())
+        return group_rules_by_app(rules)
+
+    def build_plans(self, names):
+        """Resolve profiles ahead of their activation for the ProfileWarmer: {name: plan}."""
+        processes = process_names()
+        # One fresh app list for all of them, taken after the process snapshot it is checked against
+        self.refresh_app_labels(max_age=0)
+        devices = self.device_monitor.devices() or list(self.devices)
+        known_devices = {normalize_device_label(d['name']) for d in devices} or None
+        plans = {}
+        for name in names:
+            profile = self.profiles.get(name)
+            if profile is None:
+                continue
+            t0 = time.perf_counter()
+            analysis = analyze_rules(profile['rules'], known_devices)
+            groups = self.resolve_rules(analysis['rules'])
+            for group in groups:
+                self.app_resolver.candidates((group[0].get('app_name') or '').strip())
+            stems = None
+            if not any(rule.get('match') for rule in analysis['rules']):
+                stems = {min(app_label_variants(rule.get('app_name')), key=len) for rule in analysis['rules'] if rule.get('app_name')}
+            plans[name] = {'key': profile_key(profile), 'stems': stems, 'processes': plan_processes(processes, stems),
+                           'groups': groups, 'warnings': analysis['warnings'], 'seconds': time.perf_counter() - t0}
+            if analysis['warnings']:
+                print(f"Warm-up of '{name}': " + "; ".join(analysis['warnings']))
+        return plans
+
+    def take_plan(self, profile_name):
+        """The warm plan of a profile if it is still current (long-running process only)."""
+        profile = self.profiles.get(profile_name)
+        if not self.warmer.started or profile is None:
+            return None
+        t0 = time.perf_counter()
+        try:
+            key, processes = profile_key(profile), process_names()
+        except Exception as e:
+            print(f"Could not check the warm plan of '{profile_name}': {e}")
+            return None
+        plan = self.warmer.take(profile_name, key, processes, time.perf_counter() - t0)
+        if plan is not None:
+            print(f"Using the warm plan of '{profile_name}'.")
+        return plan
+
+    def run_rules(self, rules, progress=None, cancel_event=None, timings=None, plan=None, stopped=None):
+        """Execute rules grouped per app and return [(rule, applied)]. Does not touch Tk.
+
+        Output and input rules of one app are sent in a single EarTrumpet call when possible;
+        `timings` (if given) receives the seconds spent on each rule's call, in result order,
+        and `stopped` (if given) gets True appended when `cancel_event` ended the run early.
+        With a warm `plan` (see ProfileWarmer) its resolved groups are run instead, and rules
+        that fail are retried once if a fresh app list turns out to differ from the plan's.
+        """
+        results = []
+        if plan is not None:
+            groups = plan['groups']
+        else:
+            t0 = time.perf_counter()
+            groups = self.resolve_rules(rules)
+            if self.warmer.started:
+                self.warmer.note_cold_resolve(time.perf_counter() - t0)
+        total = sum(len(group) for group in groups)
+        cancelled = False
+        for group in groups:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                if stopped is not None:
+                    stopped.append(True)
+                break
+            for rule, applied, elapsed in self._run_group(group):
+                if timings is not None:
+                    timings.append(elapsed)
+                results.append((rule, applied))
+                if progress:
+                    progress(len(results), total, rule)
+
+        failed = [i for i, (_, applied) in enumerate(results) if applied is False]
+        if plan is not None and failed and not cancelled:
+            fingerprint = self.app_resolver.fingerprint
+            self.refresh_app_labels(max_age=0)
+            if self.app_resolver.fingerprint != fingerprint:
+                print(f"Warm plan was out of date; retrying {len(failed)} rule(s).")
+                retried = {id(rule): (applied, elapsed) for group in group_rules_by_app([results[i][0] for i in failed])
+                           for rule, applied, elapsed in self._run_group(group)}
+                for i in failed:
+                    rule = results[i][0]
+                    applied, elapsed = retried[id(rule)]
+                    results[i] = (rule, applied)
+                    if timings is not None:
+                        timings[i] += elapsed
+        return results
+
+    def _run_group(self, group):
+        """Execute one app's rules and record their routes; yields (rule, applied, seconds)."""
+        t0 = time.perf_counter()
+        outcomes = self.execute_rule_group(group)
+        elapsed = time.perf_counter() - t0
+        for rule, applied in zip(group, outcomes):
+            if applied is True:
+                self.routing_state.record(rule)
+            elif applied == TIMED_OUT:
+                self.timed_out_rules.append(rule)
+            yield rule, applied, elapsed
+
+    def edit_schedule(self):
+        current = self.profile_var.get()
+        if current not in self.profiles:
+            messagebox.showwarning("Warning", "Please select a valid profile.", parent=self.root)
+            return
 
-        rules = self.profiles[profile_name]['rules']
-        applied_count = 0
-        for rule in rules:
-            if self.execute_rule(rule):
-                applied_count += 1
+        dialog = ScheduleDialog(self.root, f"Schedule - {current}", self.profiles[current])
+        result = dialog.result
+        if result is None:
+            return
+        profile = self.profiles[current]
+        for key in ('schedules', 'triggers'):
+            # Only keep the keys when used, so untouched profiles stay in the old file format
+            if result[key]:
+                profile[key] = result[key]
             else:
-                messagebox.showwarning("Warning", f"{rule} : Rule not applied as app is not running.", parent=self.root) #to delete
-        return applied_count
+                profile.pop(key, None)
+        self.reload_schedules()
+        if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
+            self.save_config()
+            self.changes_pending = False
+        else:
+            self.changes_pending = True
+        self.mark_profiles_tab_unsaved()
 
-    def execute_rule(self, rule):
+    def reload_schedules(self):
+        self.scheduler.load(self.profiles)
+
+    def _scheduler_snapshot(self, need_devices):
+        # Runs on the scheduler thread: one process walk (and at most one device listing) per poll
+        processes = process_names()
+        devices = None
+        if need_devices:
+            devices = self.device_monitor.labels()
+        if need_devices and devices is None:
+            devices = {device['name'].lower() for device in self.backend.list_devices()}
+        return processes, devices
+
+    def _on_scheduled_activation(self, profile_name, reason):
+        self.call_soon(self.run_scheduled_activation, profile_name, reason)
+
+    def run_scheduled_activation(self, profile_name, reason):
+        if profile_name not in self.profiles:
+            return
+        print(f"Activating profile '{profile_name}' ({reason})")
+        if self.root is None:
+            cancel_event = self.activation_queue.request()
+            self.activation_executor.submit(self._background_activation, profile_name, reason, cancel_event)
+        else:
+            self.start_activation(profile_name, reason)
+
+    def _background_activation(self, profile_name, reason, cancel_event):
         try:
-            if rule.get('direction') and rule['direction'] != 'Render':
-                return False
+            applied = self.apply_profile(profile_name, source='trigger', cancel_event=cancel_event)
+            if cancel_event.superseded:
+                print(f"Profile '{profile_name}' superseded by a newer activation after {applied} rule(s). ({reason})")
+                return
+            print(f"Profile '{profile_name}' activated with {applied} rule(s). ({reason})")
+        except Exception as e:
+            print(f"Error activating profile '{profile_name}': {e}")
+
+    def execute_rule_group(self, rules):
+        """Apply the rules of one app, batched into one backend call if the backend accepts it."""
+        backend = self.backend
+        if len(rules) < 2 or backend.supports_batch is False or (
+                backend.supports_batch is None and backend.batch_probes >= BATCH_PROBE_LIMIT):
+            return [self.execute_rule(rule) for rule in rules]
+        probed = False
+        try:
+            app_target = (rules[0].get('app_name') or '').strip()
+            labels = [rule_device_label(rule) for rule in rules]
+            if app_target and all(labels):
+                app_label = self.app_resolver.candidates(app_target)[0]
+                devices = [self.app_resolver.device_candidates(label)[0] for label in labels]
+                routes = [(app_label, dev_label, rule.get('direction') or 'Render') for dev_label, rule in zip(devices, rules)]
+                probed = True
+                if backend.set_routes_batch(routes):
+                    backend.supports_batch = True
+                    for label, dev_label in zip(labels, devices):
+                        self.app_resolver.learn(app_target, app_label, label, dev_label)
+                    return [True] * len(rules)
+        except subprocess.TimeoutExpired as e:
+            print(f"{backend.name} timed out after {e.timeout:g}s and was stopped.")
+            if backend.supports_batch is None:
+                backend.batch_probes += 1
+            return [TIMED_OUT] * len(rules)
+        except Exception as e:
+            print(f"Error executing rules: {e}")
+
+        # One call per rule; if those succeed where the batch failed, the backend does not batch
+        applied = [self.execute_rule(rule) for rule in rules]
+        if probed and backend.supports_batch is None:
+            if all(ok is True for ok in applied):
+                print(f"{backend.name} does not accept several routes in one call; applying rules one by one.")
+                backend.supports_batch = False
+            else:
+                backend.batch_probes += 1
+        return applied
 
+    def execute_rule(self, rule):
+        try:
             app_target = (rule.get('app_name') or '').strip()
-            device_label = (rule.get('device') or rule.get('name') or rule.get('device_name') or '').strip()
+            device_label = rule_device_label(rule)
             if not app_target or not device_label:
                 print("Rule missing app or device. Skipping.")
                 return False
 
-            attempts = []
-            # Try exactly as selected
-            attempts.append([self.eartrumpet_path, '--set', app_target, device_label])
-
-            # If device label ends with " (Default)", also try without it
-            suffix = " (Default)"
-            if device_label.endswith(suffix):
-                attempts.append([self.eartrumpet_path, '--set', app_target, device_label[:-len(suffix)]])
-
-            # If app looks like "Spotify.exe", also try "Spotify"
-            if app_target.lower().endswith('.exe'):
-                app_no_ext = app_target[:-4]
-                attempts.append([self.eartrumpet_path, '--set', app_no_ext, device_label])
-                if device_label.endswith(suffix):
-                    attempts.append([self.eartrumpet_path, '--set', app_no_ext, device_label[:-len(suffix)]])
-
-            last = None
-            for cmd in attempts:
-                print(f"Executing: {cmd}")
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                last = result
-                if result.returncode == 0:
-                    return True
-
-            if last:
-                print(f"EarTrumpet --set failed. rc={last.returncode}\nstdout={last.stdout}\nstderr={last.stderr}")
+            # Best-ranked session labels first; the label that worked last time leads
+            backend = self.backend
+            direction = rule.get('direction') or 'Render'
+            for app_label in self.app_resolver.candidates(app_target):
+                for dev_label in self.app_resolver.device_candidates(device_label):
+                    if backend.set_route(app_label, dev_label, direction):
+                        self.app_resolver.learn(app_target, app_label, device_label, dev_label)
+                        return True
             return False
 
+        except subprocess.TimeoutExpired as e:
+            # A hung backend would hang again on the next candidate label
+            print(f"{self.backend.name} timed out after {e.timeout:g}s and was stopped.")
+            return TIMED_OUT
         except Exception as e:
             print(f"Error executing rule: {e}")
             return False
-            
-            def add_unique(seq, value):
-                if value and value not in seq:
-                    seq.append(value)
-
-            add_unique(app_candidates, app_target_saved)
-            if saved_no_ext != app_target_saved:
-                add_unique(app_candidates, saved_no_ext)
-
-            for lbl in apps_now:
-                lbl_lower = lbl.lower()
-                if (lbl_lower == app_target_saved.lower() or
-                    lbl_lower == saved_no_ext.lower() or
-                    app_target_saved.lower() in lbl_lower or
-                    saved_no_ext.lower() in lbl_lower):
-                    add_unique(app_candidates, lbl)
-
-            # If no apps reported, still attempt with the saved label(s)
-            if not app_candidates:
-                app_candidates = [app_target_saved]
-                if saved_no_ext != app_target_saved:
-                    app_candidates.append(saved_no_ext)
-
-            # Optional: verify device label appears in current devices; if not, still try
-            try:
-                res_dev = subprocess.run(
-                    [self.eartrumpet_path, '--list-devices'],
-                    capture_output=True, text=True, check=False,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                playback_labels = []
-                if res_dev.returncode == 0:
-                    for ln in res_dev.stdout.splitlines():
-                        ln = ln.strip()
-                        if ln.startswith('[Playback]'):
-                            playback_labels.append(ln[len('[Playback]'):].strip())
-                # If the saved device is not seen, we still try, but this helps diagnosis
-                if playback_labels and not any(d.lower() == device_label_saved.lower() for d in playback_labels):
-                    print(f"Note: device '{device_label_saved}' not currently in --list-devices playback list.")
-            except Exception:
-                pass
 
-            # Try combinations: app x device, with a couple of retries for timing
-            import time
-            attempts_log = []
-            for _retry in range(2):  # small retry to tolerate session creation timing
-                for app_label in app_candidates:
-                    for dev_label in device_candidates:
-                        cmd = [self.eartrumpet_path, '--set', app_label, dev_label]
-                        print(f"Executing: {cmd}")
-                        result = subprocess.run(
-                            cmd,
-                            capture_output=True, text=True, check=False,
-                            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                        )
-                        attempts_log.append((cmd, result.returncode, result.stdout, result.stderr))
-                        if result.returncode == 0:
-                            return True
-                time.sleep(0.25)  # short delay then retry
-
-            # Log failures for troubleshooting
-            for (cmd, rc, out, err) in attempts_log:
-                print(f"Attempt failed rc={rc}\n  cmd={cmd}\n  stdout={out}\n  stderr={err}")
-            return False
+    def pattern_targets(self):
+        """Audio apps for pattern rules: each session label with the paths of its processes."""
+        targets = {label: [label] for label in self.app_resolver.labels}
+        by_variant = {}
+        for label in targets:
+            for variant in app_label_variants(label):
+                by_variant.setdefault(variant, []).append(label)
+        try:
+            for p in psutil.process_iter(['name', 'exe']):
+                exe = p.info.get('exe')
+                if not exe or not p.info.get('name'):
+                    continue
+                for variant in app_label_variants(p.info['name']):
+                    for label in by_variant.get(variant, []):
+                        if exe not in targets[label]:
+                            targets[label].append(exe)
+        except Exception as e:
+            print(f"Could not list process paths for pattern rules: {e}")
+        return list(targets.items())
 
+    def refresh_app_labels(self, max_age=APP_LIST_MAX_AGE):
+        """Take one --list-apps snapshot for the resolver unless a recent one is already known."""
+        if self.app_resolver.age() <= max_age:
+            return
+        try:
+            self.app_resolver.update(self.backend.list_apps())
+            self.cached_apps = list(self.app_resolver.labels)
         except Exception as e:
-            print(f"Error executing rule: {e}")
-            return False
-            
-           
+            print(f"Could not list audio apps: {e}")
 
     def add_rule(self):
         current_profile = self.profile_var.get()
@@ -562,11 +2527,12 @@ class AudioProfileManager:
             messagebox.showwarning("Warning", "Please select a profile before adding a rule.", parent=self.root)
             return
 
-        dialog = RuleDialog(self.root, "Add Rule", self.devices, eartrumpet_path=self.eartrumpet_path)
+        dialog = RuleDialog(self.root, "Add Rule", self.devices, backend=self.backend, cached_apps=self.cached_apps)
         result = dialog.result
         if result:
-            # result is a single output rule
-            self.profiles[current_profile]['rules'].append(result)
+            # result holds the output and/or input rule for the app
+            self.profiles[current_profile]['rules'].extend(result)
+            self.reindex_profile(current_profile)
             self.update_rules_display()
             if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
                 self.save_config()
@@ -585,12 +2551,23 @@ class AudioProfileManager:
         display_idx = selection[0]
         rule_idx = self.displayed_rules_indices[display_idx]
 
-        current_rule = self.profiles[current_profile]['rules'][rule_idx]
-        dialog = RuleDialog(self.root, "Edit Rule", self.devices, rule_data=current_rule, eartrumpet_path=self.eartrumpet_path)
+        rules = self.profiles[current_profile]['rules']
+        current_rule = rules[rule_idx]
+        # Edit the app's rule for the other direction in the same dialog
+        app_key = (current_rule.get('app_name') or '').strip().lower()
+        direction = current_rule.get('direction') or 'Render'
+        indices = [rule_idx] + [i for i, rule in enumerate(rules)
+                                if (rule.get('app_name') or '').strip().lower() == app_key
+                                and (rule.get('direction') or 'Render') != direction][:1]
+        dialog = RuleDialog(self.root, "Edit Rule", self.devices, rule_data=[rules[i] for i in indices], backend=self.backend, cached_apps=self.cached_apps)
 
         result = dialog.result
         if result:
-            self.profiles[current_profile]['rules'][rule_idx] = result
+            for i in sorted(indices, reverse=True):
+                del rules[i]
+            position = min(indices)
+            rules[position:position] = result
+            self.reindex_profile(current_profile)
             self.update_rules_display()
         if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
             self.save_config()
@@ -609,8 +2586,10 @@ class AudioProfileManager:
         display_idx = selection[0]
         rule_idx = self.displayed_rules_indices[display_idx]
 
-        if messagebox.askyesno("Delete", "Delete this Output rule for the app?", parent=self.root):
+        kind = "Input" if self.profiles[current_profile]['rules'][rule_idx].get('direction') == 'Capture' else "Output"
+        if messagebox.askyesno("Delete", f"Delete this {kind} rule for the app?", parent=self.root):
             del self.profiles[current_profile]['rules'][rule_idx]
+            self.reindex_profile(current_profile)
             self.update_rules_display()
             if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
                 self.save_config()
@@ -626,118 +2605,278 @@ class AudioProfileManager:
             self.activate_button.config(state='disabled')
             self.export_button.config(state='disabled')
             self.add_rule_button.config(state='disabled')
+            self.schedule_button.config(state='disabled')
             return
 
         self.activate_button.config(state='normal')
         self.export_button.config(state='normal')
         self.add_rule_button.config(state='normal')
+        self.schedule_button.config(state='normal')
         self.update_rules_display()
 
+    @profiled('update_rules_display')
     def update_rules_display(self):
         self.rules_listbox.delete(0, tk.END)
         self.displayed_rules_indices = []
 
+        self.analysis_var.set("")
+
         current_profile = self.profile_var.get()
         if current_profile and current_profile in self.profiles:
-            for idx, rule in enumerate(self.profiles[current_profile]['rules']):
-                # Only display output rules
-                if rule.get('direction') and rule['direction'] != 'Render':
-                    continue
+            rules = self.profiles[current_profile]['rules']
+            known_devices = {normalize_device_label(d['name']) for d in self.devices}
+            analysis = analyze_rules(rules, known_devices)
+            for idx, rule in enumerate(rules):
                 app_name = rule.get('app_name', '')
-                device_label = rule.get('device') or rule.get('name') or rule.get('device_name') or 'N/A'
-                display_text = f"{app_name} -> {device_label}"
+                if rule.get('match'):
+                    app_name = f"{app_name} [{rule.get('match')}]"
+                device_label = rule_device_label(rule) or 'N/A'
+                if rule.get('direction') == 'Capture':
+                    display_text = f"{app_name} <- {device_label} (input)"
+                else:
+                    display_text = f"{app_name} -> {device_label}"
+                if idx in analysis['status']:
+                    display_text += f"   [{analysis['status'][idx]}]"
                 self.rules_listbox.insert(tk.END, display_text)
                 self.displayed_rules_indices.append(idx)
+            self.analysis_var.set(self.describe_analysis(analysis))
+
+    @staticmethod
+    def describe_analysis(analysis):
+        counts = {}
+        for problem in analysis['status'].values():
+            counts[problem] = counts.get(problem, 0) + 1
+        parts = []
+        if analysis['spawns_saved']:
+            skipped = ", ".join(f"{counts[p]} {p}" for p in ('duplicate', 'shadowed') if p in counts)
+            parts.append(f"{skipped} rule(s) skipped, saving {analysis['spawns_saved']} EarTrumpet call(s) per activation")
+        if 'missing device' in counts:
+            parts.append(f"{counts['missing device']} rule(s) target a device not in the device list")
+        return "; ".join(parts)
+
+    def analyze_profiles(self, names=None):
+        """Analyze the given (default: all) profiles and return {name: analysis} for those with problems."""
+        known_devices = {normalize_device_label(d['name']) for d in self.devices}
+        reports = {}
+        for name in (self.profiles if names is None else names):
+            analysis = analyze_rules(self.profiles[name].get('rules', []), known_devices)
+            if analysis['warnings']:
+                reports[name] = analysis
+        return reports
 
     def update_profile_combo(self):
-        values = list(self.profiles.keys())
+        self.filter_profiles()
+        self.profile_var.set("Select a profile...")
+        self.on_profile_selected()
+
+    def profile_index(self):
+        if self._profile_index is None:
+            self._profile_index = ProfileSearchIndex(self.profiles)
+        return self._profile_index
+
+    def reindex_profile(self, name):
+        """Update the search index after a profile was added, edited or deleted."""
+        if self._profile_index is not None:
+            if name in self.profiles:
+                self._profile_index.add(name, self.profiles[name])
+            else:
+                self._profile_index.remove(name)
+
+    def filter_profiles(self):
+        """Fill the dropdown with the profiles matching the search box (at most PROFILE_LIST_LIMIT)."""
+        found = self.profile_index().search(self.search_var.get()) if self.search_var.get().strip() else None
+        if found is None:
+            values, total = list(itertools.islice(self.profiles, PROFILE_LIST_LIMIT)), len(self.profiles)
+            hint = f"{total} profile(s)"
+        else:
+            values, total = found
+            hint = f"{total} match(es)"
+        if total > len(values):
+            hint += f", first {len(values)} listed; type to narrow down"
+        self.search_count_var.set(hint)
         if values:
             values.insert(0, "Select a profile...")
         self.profile_combo['values'] = values
-        self.profile_var.set("Select a profile...")
-        self.on_profile_selected()
+
+    def select_first_match(self, event=None):
+        values = self.profile_combo['values']
+        if len(values) > 1:
+            self.profile_var.set(values[1])
+            self.on_profile_selected()
 
     def refresh_devices(self):
-        self.input_devices = []
-        self.output_devices = []
-        self.refresh_button.config(text="Loading...", state='disabled')
+        self._set_refresh_state(True)
         threading.Thread(target=self._refresh_devices_thread, daemon=True).start()
 
-    def _refresh_devices_thread(self):
-        self.input_devices = []
-        self.output_devices = []
-        devices = []
-        try:
-            if not Checker.verify_eartrumpet_exe(self.eartrumpet_path):
-                self.root.after(0, lambda: messagebox.showerror("Error", f"EarTrumpet not found or not working.\n\nPlease configure the correct path in Settings tab.", parent=self.root))
-                self.root.after(0, lambda: self.refresh_button.config(text="Refresh Device List", state='normal'))
-                return
-
-            cmd = [self.eartrumpet_path, '--list-devices']
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            if result.returncode != 0:
-                raise RuntimeError(result.stderr.strip() or "EarTrumpet returned an error while listing devices.")
-
-            pattern_head = ('[Playback]', '[Recording]')
-            for raw in result.stdout.splitlines():
-                line = raw.strip()
-                if not line or not (line.startswith('[Playback]') or line.startswith('[Recording]')):
-                    continue
-                if line.startswith('[Playback]'):
-                    direction = 'Render'
-                    label = line[len('[Playback]'):].strip()
-                else:
-                    direction = 'Capture'
-                    label = line[len('[Recording]'):].strip()
-                # Build normalized device structure
-                devices.append({
-                    'id': label,                # using label as identifier
-                    'name': label,
-                    'device_name': label,
-                    'item_id': '',
-                    'direction': direction,
-                    'state': 'Active',
-                    'type': 'Device'
-                })
-
-            self.root.after(0, self._update_devices_display, devices)
+    def _set_refresh_state(self, loading):
+        self.devices_loading = loading
+        if self.refresh_button is not None:
+            self.refresh_button.config(text="Loading..." if loading else "Refresh Device List",
+                                       state='disabled' if loading else 'normal')
 
+    def show_cached_inventory(self):
+        """Show the devices saved by the last run right away. Returns False when there is no cache."""
+        cache = load_inventory_cache()
+        if not cache or not cache['devices']:
+            return False
+        self._begin_devices_display()
+        self._append_devices_batch(cache['devices'])
+        self.device_monitor.seed(self.devices)
+        self.cached_apps = cache['apps']
+        return True
+
+    def revalidate_devices(self):
+        """Refresh the cached inventory in the background, applying only the differences."""
+        self._set_refresh_state(True)
+        threading.Thread(target=self._refresh_devices_thread, args=(True,), daemon=True).start()
+
+    @profiled('refresh_devices')
+    def _refresh_devices_thread(self, diff=False):
+        # Listing the devices doubles as the backend check: one process instead of two
+        backend = self.backend
+        try:
+            if diff:
+                shown = {(d['direction'], d['name']): d for d in self.devices}
+                current = {(d['direction'], d['name']): d for d in backend.list_devices()}
+                added = [current[k] for k in current.keys() - shown.keys()]
+                removed = [shown[k] for k in shown.keys() - current.keys()]
+                self.call_in_gui(self._apply_device_diff, added, removed)
+            else:
+                self.call_in_gui(self._begin_devices_display)
+                for batch in iter_batches(backend.list_devices()):
+                    self.call_in_gui(self._append_devices_batch, batch)
+            self.call_in_gui(self._finish_devices_display)
+            if diff:
+                self.refresh_app_labels()
+                self.call_in_gui(self.save_inventory)
+
+        except subprocess.TimeoutExpired as e:
+            print(f"{backend.name} timed out: {e}")
+            self.call_in_gui(lambda e=e: messagebox.showerror("Error", f"{backend.name} did not answer within {e.timeout:g}s and was stopped.\n\nThe audio driver may be busy; try again, or raise list_devices in the [Timeouts] section of config.ini.", parent=self.root))
+            self.call_in_gui(self._set_refresh_state, False)
+        except (OSError, RuntimeError) as e:
+            print(f"Could not list devices: {e}")
+            self.call_in_gui(lambda: messagebox.showerror("Error", f"{backend.name} not found or not working.\n\nPlease configure the correct path in Settings tab.", parent=self.root))
+            self.call_in_gui(self._set_refresh_state, False)
         except Exception as e:
             print(f"General error: {e}")
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Unexpected error: {e}", parent=self.root))
-            self.root.after(0, lambda: self.refresh_button.config(text="Refresh Device List", state='normal'))
+            self.call_in_gui(lambda e=e: messagebox.showerror("Error", f"Unexpected error: {e}", parent=self.root))
+            self.call_in_gui(self._set_refresh_state, False)
 
-    def _update_devices_display(self, devices):
-        devices = sorted(devices, key=lambda d: d['name'].lower())
-        self.devices = devices
+    def save_inventory(self):
+        save_inventory_cache(list(self.devices), self.cached_apps)
 
+    def _begin_devices_display(self):
+        self.devices = []
         self.input_devices = []
         self.output_devices = []
-
-        self.input_devices_listbox.delete(0, tk.END)
-        self.output_devices_listbox.delete(0, tk.END)
-
-        for device in devices:
-            display_text = device['name']
+        self._device_keys = []
+        self._input_keys = []
+        self._output_keys = []
+        if self.input_devices_listbox is not None:
+            self.input_devices_listbox.delete(0, tk.END)
+            self.output_devices_listbox.delete(0, tk.END)
+
+    def _append_devices_batch(self, batch):
+        # Keep every list sorted as batches arrive instead of sorting once at the end
+        for device in batch:
+            key = device['name'].lower()
+            idx = bisect.bisect_right(self._device_keys, key)
+            self._device_keys.insert(idx, key)
+            self.devices.insert(idx, device)
             if device['direction'] == 'Capture':
-                self.input_devices.append(device)
-                self.input_devices_listbox.insert(tk.END, display_text)
+                devices, keys, listbox = self.input_devices, self._input_keys, self.input_devices_listbox
             elif device['direction'] == 'Render':
-                self.output_devices.append(device)
-                self.output_devices_listbox.insert(tk.END, display_text)
+                devices, keys, listbox = self.output_devices, self._output_keys, self.output_devices_listbox
+            else:
+                continue
+            idx = bisect.bisect_right(keys, key)
+            keys.insert(idx, key)
+            devices.insert(idx, device)
+            if listbox is not None:
+                listbox.insert(idx, device['name'])
+        self.update_device_counts()
 
-        self.refresh_button.config(text="Refresh Device List", state='normal')
+    def _finish_devices_display(self):
+        self._set_refresh_state(False)
         self.update_device_counts()
+        self.device_monitor.seed(self.devices)
+        self.update_rules_display()
+        if self.devices:
+            self.save_inventory()
 
         if not self.devices:
             messagebox.showerror("Error", "Failed to refresh device list!\nPlease check that devices are connected or EarTrumpet is working.", parent=self.root)
 
+    def _on_devices_changed(self, added, removed):
+        # Runs on the monitor thread: queue the re-routing before touching the UI
+        self.reapply_rules_for_devices(added)
+        if self.root is None:
+            self.devices = self.device_monitor.devices()
+        self.call_in_gui(self._apply_device_diff, added, removed)
+
+    def reapply_rules_for_devices(self, devices):
+        """Re-apply the active profile's rules that target `devices` on the activation executor."""
+        if not devices or self.active_profile not in self.profiles:
+            return
+        # Takes the current ticket instead of a new one: any newer request cancels the
+        # re-apply, but it never supersedes an activation that is already queued
+        cancel_event = QueuedCancel(self.activation_queue, self.activation_queue.latest())
+        try:
+            self.activation_executor.submit(self._reapply_worker, list(devices), cancel_event)
+        except RuntimeError:
+            pass  # The executor is shut down on exit
+
+    @profiled('hotplug')
+    def _reapply_worker(self, devices, cancel_event):
+        started = time.time()
+        t0 = time.perf_counter()
+        lock = acquire_activation(cancel_event)
+        if lock is None:
+            return
+        # The active profile is read under the lock: an activation that ran first may have changed it
+        profile_name = self.active_profile
+        try:
+            if profile_name not in self.profiles:
+                return
+            labels = {(d['direction'], normalize_device_label(d['name'])) for d in devices}
+            matching = []
+            for rule in analyze_rules(self.profiles[profile_name]['rules'])['rules']:
+                device_label = rule_device_label(rule)
+                if (rule.get('direction') or 'Render', normalize_device_label(device_label)) in labels:
+                    print(f"Device '{device_label}' reappeared, re-applying rule for {rule.get('app_name')}")
+                    matching.append(rule)
+            if not matching:
+                return
+            self.timed_out_rules = []
+            timings = []
+            results = self.run_rules(matching, cancel_event=cancel_event, timings=timings)
+            self.routing_state.save()
+        except Exception as e:
+            print(f"Error re-applying rules of '{profile_name}': {e}")
+            return
+        finally:
+            lock.release()
+        self.history.record(profile_name, 'hotplug', started, time.perf_counter() - t0, results, timings)
+
+    def _apply_device_diff(self, added, removed):
+        for device in removed:
+            key = device['name'].lower()
+            for devices, keys, listbox in ((self.devices, self._device_keys, None),
+                                           (self.input_devices, self._input_keys, self.input_devices_listbox),
+                                           (self.output_devices, self._output_keys, self.output_devices_listbox)):
+                idx = bisect.bisect_left(keys, key)
+                while idx < len(keys) and keys[idx] == key:
+                    if devices[idx]['direction'] == device['direction'] and devices[idx]['name'] == device['name']:
+                        del keys[idx]
+                        del devices[idx]
+                        if listbox is not None:
+                            listbox.delete(idx)
+                        break
+                    idx += 1
+        present = {(d['direction'], d['name']) for d in self.devices}
+        self._append_devices_batch([d for d in added if (d['direction'], d['name']) not in present])
+
     def copy_device_id(self):
         selection_input = self.input_devices_listbox.curselection()
         selection_output = self.output_devices_listbox.curselection()
@@ -760,6 +2899,10 @@ class AudioProfileManager:
         self.root.clipboard_append(text_to_copy)
         messagebox.showinfo("Success", f"Copied to clipboard", parent=self.root)
 
+    def toggle_profiling(self):
+        PROFILER.enabled = self.profiling_var.get()
+        print(f"Profiling {'on' if PROFILER.enabled else 'off'}: files go to {PROFILE_RUN_DIR}")
+
     def browse_eartrumpet(self):
         filename = filedialog.askopenfilename(
             title="Select EarTrumpet.exe",
@@ -777,7 +2920,7 @@ class AudioProfileManager:
 
     def test_eartrumpet(self):
         try:
-            if not Checker.verify_eartrumpet_exe(self.eartrumpet_path):
+            if not Checker.verify_eartrumpet_exe(self.eartrumpet_path, refresh=True):
                 messagebox.showerror("Error", "Configured EarTrumpet.exe is invalid or not working!\nPlease fix it in Settings.", parent=self.root)
             else:
                 messagebox.showinfo("Success", "EarTrumpet is working correctly!", parent=self.root)
@@ -789,41 +2932,89 @@ class AudioProfileManager:
     def import_profiles(self):
         filename = filedialog.askopenfilename(
             title="Import Profiles",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("NDJSON files", "*.ndjson *.jsonl"), ("All files", "*.*")]
         )
-        if filename:
-            try:
-                with open(filename, 'r') as f:
-                    imported_data = json.load(f)
+        if not filename:
+            return
+        policy = 'overwrite'
+        if self.profiles:
+            policy = ConflictPolicyDialog(self.root).result
+            if policy is None:
+                return
+        window = ProgressWindow(self.root, "Importing Profiles", f"Reading {os.path.basename(filename)}...")
+        threading.Thread(target=self._import_profiles_thread, args=(filename, policy, window), daemon=True).start()
 
-                if not isinstance(imported_data, dict) or 'profiles' not in imported_data or not isinstance(imported_data['profiles'], dict):
-                    raise ValueError("This file does not appear to be a valid exported profile file!")
+    @profiled('import_profiles')
+    def _import_profiles_thread(self, filename, policy, window):
+        imported, stats, reports, error = {}, None, {}, None
+        try:
+            total = max(os.path.getsize(filename), 1)
+            with open(filename, 'r') as f:
+                counting = CountingFile(f)
+                items = iter_profile_file(counting, ndjson=filename.lower().endswith(NDJSON_EXTENSIONS))
+                progress = lambda count: self.call_in_gui(window.update, 100.0 * counting.read_chars / total, f"{count} profile(s) read...")
+                existing = set(self.profiles) | set(self.invalid_profiles)
+                imported, stats = import_profile_stream(items, existing, policy,
+                                                        progress=progress, cancel=window.cancel_event.is_set)
+            known_devices = {normalize_device_label(d['name']) for d in list(self.devices)}
+            for name, profile in imported.items():
+                analysis = analyze_rules(profile['rules'], known_devices)
+                if analysis['warnings']:
+                    reports[name] = analysis
+        except Exception as e:
+            error = e
+        self.call_in_gui(self._finish_import, window, imported, stats, reports, error)
+
+    def _finish_import(self, window, imported, stats, reports, error):
+        cancelled = window.cancel_event.is_set()
+        window.close()
+        if error is not None:
+            messagebox.showerror("Error", f"Error importing profiles: {error}", parent=self.root)
+            return
+        if cancelled:
+            messagebox.showinfo("Import Cancelled", "Import cancelled, no profiles were imported.", parent=self.root)
+            return
 
-                invalid_profiles = []
-                for name, profile in imported_data.get('profiles', {}).items():
-                    if not PROFILE_NAME_REGEX.match(name):
-                        invalid_profiles.append(name)
-                        continue
-                    if name in self.profiles:
-                        if not messagebox.askyesno("Conflict", f"Profile '{name}' already exists. Overwrite?", parent=self.root):
-                            continue
-                    self.profiles[name] = profile
-
-                if invalid_profiles:
-                    messagebox.showwarning(
-                        "Invalid Profile Names",
-                        "These profile names were invalid and were NOT imported:\n" +
-                        "\n".join(invalid_profiles),
-                        parent=self.root
-                    )
-
-                self.update_profile_combo()
-                if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
-                    self.save_config()
-                messagebox.showinfo("Success", "Profiles imported successfully!", parent=self.root)
+        self.profiles.update(imported)
+        for name in imported:
+            self.invalid_profiles.pop(name, None)
+            self.reindex_profile(name)
+
+        if stats['invalid']:
+            shown = stats['invalid'][:20]
+            more = f"\n... and {len(stats['invalid']) - 20} more" if len(stats['invalid']) > 20 else ""
+            messagebox.showwarning(
+                "Invalid Profile Names",
+                "These profiles were invalid (bad name or format) and were NOT imported:\n" +
+                "\n".join(shown) + more,
+                parent=self.root
+            )
 
-            except Exception as e:
-                messagebox.showerror("Error", f"Error importing profiles: {e}", parent=self.root)
+        if reports:
+            saved = sum(a['spawns_saved'] for a in reports.values())
+            lines = [f"{name}: {self.describe_analysis(a)}" for name, a in list(reports.items())[:20]]
+            if len(reports) > 20:
+                lines.append(f"... and {len(reports) - 20} more profile(s)")
+            messagebox.showwarning(
+                "Profile Rule Warnings",
+                f"{len(reports)} imported profile(s) have rule problems "
+                f"(duplicates/overrides skipped at activation save {saved} EarTrumpet call(s)):\n\n" + "\n".join(lines),
+                parent=self.root
+            )
+
+        self.update_profile_combo()
+        self.reload_schedules()
+        if getattr(self, 'auto_save_var', True) and self.auto_save_var.get():
+            self.save_config()
+        else:
+            self.changes_pending = True
+            self.mark_profiles_tab_unsaved()
+        messagebox.showinfo(
+            "Success",
+            f"Profiles imported successfully!\n\nImported: {stats['imported']} (overwritten: {stats['overwritten']}, "
+            f"renamed: {stats['renamed']})\nSkipped: {stats['skipped']}\nInvalid: {len(stats['invalid'])}",
+            parent=self.root
+        )
 
     def export_profiles(self):
         export_window = tk.Toplevel(self.root)
@@ -865,66 +3056,269 @@ class AudioProfileManager:
             filename = filedialog.asksaveasfilename(
                 title="Export Selected Profiles",
                 defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+                filetypes=[("JSON files", "*.json"), ("NDJSON files", "*.ndjson *.jsonl"), ("All files", "*.*")]
             )
 
             if filename:
-                try:
-                    export_data = {
-                        'profiles': {k: self.profiles[k] for k in selected_names},
-                        'eartrumpet_path': self.eartrumpet_path
-                    }
-                    with open(filename, 'w') as f:
-                        json.dump(export_data, f, indent=2)
-                    export_window.destroy()
-                    messagebox.showinfo("Success", "Profiles exported successfully!", parent=self.root)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Error exporting profiles: {e}", parent=self.root)
+                export_window.destroy()
+                profiles = {k: self.profiles[k] for k in selected_names}
+                threading.Thread(target=self._export_profiles_thread, args=(filename, profiles), daemon=True).start()
 
         ttk.Button(export_window, text="Export Selected", command=export_selected).pack(pady=10)
 
+    def validate_all_profiles(self):
+        if not self.profiles:
+            messagebox.showwarning("Warning", "There are no profiles to validate.", parent=self.root)
+            return
+        self.validate_button.config(text="Validating...", state='disabled')
+        threading.Thread(target=self._validate_profiles_thread, args=(dict(self.profiles),), daemon=True).start()
+
+    @profiled('validate_profiles')
+    def _validate_profiles_thread(self, profiles):
+        try:
+            # One device snapshot (the warm list when there is one) and one app snapshot for all profiles
+            devices = list(self.devices)
+            if not devices:
+                devices = list(self.backend.list_devices())
+            apps = list(self.backend.list_apps())
+            self.app_resolver.update(apps)
+            report = format_validation_report(validate_profiles(profiles, devices, apps))
+            self.call_in_gui(self._show_validation_report, report)
+        except Exception as e:
+            self.call_in_gui(lambda e=e: messagebox.showerror("Error", f"Error validating profiles: {e}", parent=self.root))
+        finally:
+            self.call_in_gui(lambda: self.validate_button.config(text="Validate All", state='normal'))
+
+    def _show_validation_report(self, report):
+        window = tk.Toplevel(self.root)
+        window.title("Profile Health Report")
+        window.geometry("700x500")
+        window.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
+        text_frame = ttk.Frame(window)
+        text_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        text = tk.Text(text_frame, wrap='none', font=('Courier', 9))
+        scroll_y = ttk.Scrollbar(text_frame, orient='vertical', command=text.yview)
+        text.configure(yscrollcommand=scroll_y.set)
+        text.pack(side='left', fill='both', expand=True)
+        scroll_y.pack(side='right', fill='y')
+        text.insert('1.0', report)
+        text.config(state='disabled')
+        ttk.Button(window, text="Close", command=window.destroy).pack(pady=(0, 10))
+
+    def _export_profiles_thread(self, filename, profiles):
+        try:
+            write_profile_file(filename, profiles, list(profiles), extra={'eartrumpet_path': self.eartrumpet_path},
+                               ndjson=filename.lower().endswith(NDJSON_EXTENSIONS))
+            self.call_in_gui(lambda: messagebox.showinfo("Success", f"{len(profiles)} profile(s) exported successfully!", parent=self.root))
+        except Exception as e:
+            self.call_in_gui(lambda e=e: messagebox.showerror("Error", f"Error exporting profiles: {e}", parent=self.root))
+
+    @profiled('load_config')
     def load_config(self):
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    if not isinstance(config, dict) or 'profiles' not in config or not isinstance(config['profiles'], dict):
-                        raise ValueError("This file does not appear to be a valid exported profile file!")
-                self.profiles = config.get('profiles', {})
+                with profile_lock(self.config_file):
+                    config, self.invalid_profiles = load_profiles_config(self.config_file)
+                    self.profiles_stat = self._stat_profiles_file()
+                self.profiles = config['profiles']
+                self.profiles_load_error = None
+                self._profile_index = None
                 self.eartrumpet_path = config.get('eartrumpet_path', self.eartrumpet_path)
+                self.profiles_soundvolumeview_path = config.get('soundvolumeview_path') or ''
+                for name, (_, reason) in self.invalid_profiles.items():
+                    print(f"Profile '{name}' was not loaded and is kept unchanged in the file: {reason}")
+                for name, analysis in self.analyze_profiles().items():
+                    print(f"Profile '{name}': " + "; ".join(analysis['warnings']))
         except Exception as e:
+            self.profiles_load_error = str(e)
             print(f"Error loading config: {e}")
 
+    def _stat_profiles_file(self):
+        try:
+            st = os.stat(self.config_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return (0, -1)
+
+    def publish_state(self, refresh_apps=False):
+        """Write swap_state.bin so swap-cli.py can skip re-reading profiles and the process table.
+
+        Called from the Tk thread and the device monitor; the file is only rewritten when its
+        content changed or half of its validity has passed.
+        """
+        with self._publish_lock:
+            try:
+                if refresh_apps:
+                    self.running_apps = process_names()
+                # In-memory edits that are not on disk must not be served as the file's content
+                pending = self.changes_pending
+                profiles_stat = (0, -1) if pending else self.profiles_stat
+                valid_for = 3 * self.device_poll_interval if self.device_poll_interval > 0 else 30.0
+                devices = list(self.devices)
+                key = (profiles_stat, self.profiles_soundvolumeview_path, frozenset(self.running_apps),
+                       tuple((d['direction'], d['name']) for d in devices))
+                now = time.time()
+                if self._published is not None and self._published[0] == key and now - self._published[1] < valid_for / 2:
+                    return
+                write_state_snapshot(STATE_FILE, {} if pending else dict(self.profiles), devices, self.running_apps,
+                                     profiles_stat, valid_for, self.profiles_soundvolumeview_path)
+                self._published = (key, now)
+            except Exception as e:
+                print(f"Error publishing state snapshot: {e}")
+
     def save_config(self):
+        if self.profiles_load_error is not None:
+            # Saving now would replace every profile in the file with the ones created since
+            message = (f"{os.path.basename(self.config_file)} could not be loaded ({self.profiles_load_error}), "
+                       "so it was not overwritten. Fix or move the file, then restart SWAP.")
+            print(f"Error saving config: {message}")
+            if self.root is not None:
+                messagebox.showerror("Error", message, parent=self.root)
+            return
         try:
-            config = {'profiles': self.profiles}
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=2)
+            config = {'profiles': profiles_to_save(self.profiles, self.invalid_profiles)}
+            tmp_path = self.config_file + '.tmp'
+            # Other SWAP processes read the file under the same lock, so the swap never races a reader
+            with profile_lock(self.config_file):
+                with open(tmp_path, 'w') as f:
+                    json.dump(config, f, indent=2, default=encode_json)
+                os.replace(tmp_path, self.config_file)
+                self.profiles_stat = self._stat_profiles_file()
+            # The file is written without soundvolumeview_path
+            self.profiles_soundvolumeview_path = ''
+            self.reload_schedules()
             self.changes_pending = False
             self.mark_profiles_tab_unsaved()
+            self.publish_state()
 
         except Exception as e:
             print(f"Error saving config: {e}")
 
     def show_window(self, icon=None, item=None):
+        if threading.current_thread() is not threading.main_thread() or self.root is None:
+            # Tray callbacks run on the tray thread; the window is (re)built on the main thread
+            self.call_soon(self._open_window)
+            return
         self.root.deiconify()
         self.root.lift()
 
+    def _open_window(self):
+        if self.root is not None:
+            self.root.deiconify()
+            self.root.lift()
+            return
+        self.create_window()
+        self.update_profile_combo()
+        # The background loop keeps the device list current
+        self._begin_devices_display()
+        self._append_devices_batch(self.device_monitor.devices())
+        self.update_rules_display()
+        self.root.mainloop()
+        # Back to background mode: drop every widget, keep profiles and caches
+        self.auto_save_enabled = self.auto_save_var.get()
+        root, self.root = self.root, None
+        root.destroy()
+        for name in [n for n, v in vars(self).items() if isinstance(v, (tk.Misc, tk.Variable))]:
+            delattr(self, name)
+
     def on_closing(self):
         if self.changes_pending and not self.auto_save_var.get():
             if messagebox.askyesno("Unsaved Changes", "Some changes were not saved. Save now?", parent=self.root):
                 self.save_config()
-        self.quit_app()
+        if self.background:
+            self.root.quit()
+        else:
+            self.quit_app()
 
     def quit_app(self, icon=None, item=None):
-        self.root.quit()
+        self.scheduler.stop()
+        self.device_monitor.stop()
+        self.warmer.stop()
+        if self.control_server is not None:
+            self.control_server.stop()
+        self.activation_executor.shutdown(wait=False, cancel_futures=True)
+        self.history.close()
+        self._quit_event.set()
+        if self.tray_icon is not None:
+            self.tray_icon.stop()
+        if self.root is not None:
+            self.call_soon(self.root.quit)
+
+    def start_services(self):
+        self.reload_schedules()
+        self.scheduler.start()
+        self.device_monitor.start()
+        self.warmer.start()
+        self.publish_state(refresh_apps=True)
+        self.start_control_server()
+
+    def start_control_server(self):
+        if self.api_port <= 0 or self.control_server is not None:
+            return
+        if self.api_host not in ('127.0.0.1', 'localhost', '::1') and not self.api_token:
+            print(f"Control API on {self.api_host} without api_token: any machine that can reach it may activate profiles.")
+        try:
+            self.control_server = ControlServer(self, self.api_host, self.api_port, self.api_workers, self.api_token)
+        except OSError as e:
+            print(f"Could not start the control API on {self.api_host}:{self.api_port}: {e}")
+            return
+        self.control_server.start()
+        print(f"Control API listening on http://{self.api_host}:{self.api_port}")
 
     def run(self):
         self.update_profile_combo()
+        cached = self.show_cached_inventory()
         self.update_rules_display()
-        self.refresh_devices()
+        # Let the window come up first; EarTrumpet is only started afterwards
+        self.root.after_idle(self.revalidate_devices if cached else self.refresh_devices)
+        self.root.after_idle(self.start_services)
         self.root.mainloop()
 
+    def run_background(self):
+        """Run schedules, triggers, the device monitor and the CLI snapshot without the window.
+
+        The Tk window is only built when opened from the tray icon and is destroyed again
+        when closed. Without pystray installed there is no icon; stop the process to quit.
+        """
+        self.background = True
+        try:
+            self.device_monitor.poll()
+            self.devices = self.device_monitor.devices()
+            save_inventory_cache(self.devices, self.cached_apps)
+        except Exception as e:
+            print(f"Could not list devices: {e}")
+        self.start_services()
+        self.tray_icon = self._create_tray_icon()
+        if self.tray_icon is not None:
+            self.tray_icon.run_detached()
+        while not self._quit_event.is_set():
+            try:
+                func, args = self._main_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Background task error: {e}")
+
+    def _create_tray_icon(self):
+        try:
+            import pystray
+            from PIL import Image, ImageDraw
+        except ImportError:
+            print("pystray/Pillow not installed: running in the background without a tray icon.")
+            return None
+        try:
+            image = Image.open(os.path.join(BASE_DIR, "icon.ico"))
+        except OSError:
+            image = Image.new('RGB', (64, 64), 'white')
+            ImageDraw.Draw(image).ellipse((8, 8, 56, 56), fill='black')
+        menu = pystray.Menu(
+            pystray.MenuItem("Open SWAP", self.show_window, default=True),
+            pystray.MenuItem("Quit", self.quit_app)
+        )
+        return pystray.Icon("SWAP", image, "SmartWindowsAudioProfiles", menu)
+
 
 class ProfileDialog:
     def __init__(self, parent, title, profile_data=None):
@@ -977,16 +3371,172 @@ class ProfileDialog:
         self.dialog.destroy()
 
 
+class CountingFile:
+    """Wraps a text file and counts the characters read, for progress reporting."""
+
+    def __init__(self, f):
+        self.f = f
+        self.read_chars = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.read_chars += len(data)
+        return data
+
+    def __iter__(self):
+        for line in self.f:
+            self.read_chars += len(line)
+            yield line
+
+
+class ProgressWindow:
+    def __init__(self, parent, title, text):
+        self.cancel_event = threading.Event()
+
+        self.window = tk.Toplevel(parent)
+        self.window.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
+        self.window.title(title)
+        self.window.geometry("400x130")
+        self.window.resizable(False, False)
+        self.window.transient(parent)
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.status_var = tk.StringVar(value=text)
+        ttk.Label(self.window, textvariable=self.status_var).pack(anchor='w', padx=10, pady=(10, 5))
+        self.progress = ttk.Progressbar(self.window, mode='determinate', maximum=100)
+        self.progress.pack(fill='x', padx=10, pady=5)
+        self.cancel_button = ttk.Button(self.window, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(pady=5)
+        ProfileDialog.center_window(self.window, parent)
+
+    def update(self, percent, text=None):
+        if not self.window.winfo_exists():
+            return
+        self.progress['value'] = percent
+        if text is not None:
+            self.status_var.set(text)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.status_var.set("Cancelling...")
+
+    def close(self):
+        if self.window.winfo_exists():
+            self.window.destroy()
+
+
+class ConflictPolicyDialog:
+    def __init__(self, parent):
+        self.result = None
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
+        self.dialog.title("Import Conflicts")
+        self.dialog.geometry("360x200")
+        self.dialog.resizable(False, False)
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+
+        ttk.Label(self.dialog, text="When an imported profile already exists:").pack(anchor='w', padx=10, pady=(10, 5))
+        self.policy_var = tk.StringVar(value='overwrite')
+        for value, text in (('overwrite', "Overwrite all existing profiles"),
+                            ('skip', "Skip all existing profiles"),
+                            ('rename', "Import all as a renamed copy (e.g. Work-2)")):
+            ttk.Radiobutton(self.dialog, text=text, variable=self.policy_var, value=value).pack(anchor='w', padx=20)
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=15)
+        ttk.Button(button_frame, text="OK", command=self.ok_clicked).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Cancel", command=self.cancel_clicked).pack(side='left', padx=5)
+        ProfileDialog.center_window(self.dialog, parent)
+        self.dialog.wait_window()
+
+    def ok_clicked(self):
+        self.result = self.policy_var.get()
+        self.dialog.destroy()
+
+    def cancel_clicked(self):
+        self.dialog.destroy()
+
+
+class ScheduleDialog:
+    def __init__(self, parent, title, profile):
+        self.result = None
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
+        self.dialog.title(title)
+        self.dialog.geometry("500x420")
+        self.dialog.resizable(False, False)
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+
+        ttk.Label(self.dialog, text="Schedules, one cron expression per line (minute hour day month weekday):").pack(anchor='w', padx=10, pady=(10, 0))
+        ttk.Label(self.dialog, text="e.g. '0 9 * * 1-5' activates at 09:00 on weekdays").pack(anchor='w', padx=10)
+        self.schedules_text = tk.Text(self.dialog, height=6, width=60)
+        self.schedules_text.pack(padx=10, pady=5)
+        self.schedules_text.insert('1.0', "\n".join(profile.get('schedules', [])))
+
+        ttk.Label(self.dialog, text="Triggers, one per line: 'app_started <app.exe>' or 'device_appeared <device name>'").pack(anchor='w', padx=10, pady=(10, 0))
+        self.triggers_text = tk.Text(self.dialog, height=6, width=60)
+        self.triggers_text.pack(padx=10, pady=5)
+        self.triggers_text.insert('1.0', "\n".join(f"{t.get('type')} {t.get('match')}" for t in profile.get('triggers', [])))
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="OK", command=self.ok_clicked).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Cancel", command=self.cancel_clicked).pack(side='left', padx=5)
+        ProfileDialog.center_window(self.dialog, parent)
+        self.dialog.wait_window()
+
+    def ok_clicked(self):
+        schedules = []
+        for line in self.schedules_text.get('1.0', tk.END).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                CronSchedule(line)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid schedule '{line}':\n{e}", parent=self.dialog)
+                return
+            schedules.append(line)
+
+        triggers = []
+        for line in self.triggers_text.get('1.0', tk.END).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            kind, _, match = line.partition(' ')
+            if kind not in TRIGGER_TYPES or not match.strip():
+                messagebox.showerror("Error", f"Invalid trigger '{line}'!\nUse 'app_started <app.exe>' or 'device_appeared <device name>'.", parent=self.dialog)
+                return
+            triggers.append({'type': kind, 'match': match.strip()})
+
+        self.result = {'schedules': schedules, 'triggers': triggers}
+        self.dialog.destroy()
+
+    def cancel_clicked(self):
+        self.dialog.destroy()
+
+
+# (dialog text, rule 'match' value)
+MATCH_CHOICES = [("Exact app name", None), ("Glob pattern (e.g. *.exe, D:\\Games\\*)", 'glob'),
+                 ("Regex (whole app name or path)", 'regex')]
+
+
 class RuleDialog:
-    def __init__(self, parent, title, devices, rule_data=None, eartrumpet_path="EarTrumpet.exe"):
+    def __init__(self, parent, title, devices, rule_data=None, backend=None, cached_apps=None):
         self.result = None
+        self.cached_apps = cached_apps or []
         self.devices = sorted(devices, key=lambda d: d['name'].lower())
-        self.eartrumpet_path = eartrumpet_path
+        self.backend = backend or EarTrumpetBackend("EarTrumpet.exe")
 
         self.dialog = tk.Toplevel(parent)
         self.dialog.iconbitmap(os.path.join(BASE_DIR, "icon.ico"))
         self.dialog.title(title)
-        self.dialog.geometry("600x600")
+        self.dialog.geometry("600x700")
         self.dialog.resizable(False, False)
         self.dialog.transient(parent)
         self.dialog.grab_set()
@@ -997,6 +3547,13 @@ class RuleDialog:
         self.app_combobox = AutocompleteCombobox(self.dialog, textvariable=self.app_var, width=50)
         self.app_combobox.pack(pady=(0, 5))
 
+        match_frame = ttk.Frame(self.dialog)
+        match_frame.pack(pady=(0, 5))
+        ttk.Label(match_frame, text="Match:").pack(side='left')
+        self.match_var = tk.StringVar(value=MATCH_CHOICES[0][0])
+        ttk.Combobox(match_frame, textvariable=self.match_var, values=[text for text, _ in MATCH_CHOICES],
+                     state='readonly', width=42).pack(side='left', padx=5)
+
         # Status + Refresh button
         apps_topbar = ttk.Frame(self.dialog)
         apps_topbar.pack(fill='x', padx=10, pady=(0, 10))
@@ -1007,57 +3564,27 @@ class RuleDialog:
         # Initial load
         self._refresh_apps()
         
+        self.render_devices = [d for d in self.devices if d.get("direction") == "Render"]
+        self.capture_devices = [d for d in self.devices if d.get("direction") == "Capture"]
         ttk.Label(self.dialog, text="Output Device (Render):").pack()
-        output_frame = ttk.Frame(self.dialog)
-        output_frame.pack(fill='x', padx=10, pady=2)
-        self.output_listbox = tk.Listbox(output_frame, height=15, exportselection=False, selectmode="browse")
-        output_scroll_y = ttk.Scrollbar(output_frame, orient='vertical', command=self.output_listbox.yview)
-        self.output_listbox.configure(yscrollcommand=output_scroll_y.set)
-        self.output_listbox.pack(side='left', fill='both', expand=True)
-        output_scroll_y.pack(side='right', fill='y')
-        output_scroll_x = ttk.Scrollbar(self.dialog, orient='horizontal', command=self.output_listbox.xview)
-        self.output_listbox.configure(xscrollcommand=output_scroll_x.set)
-        output_scroll_x.pack(fill='x', padx=10, pady=(0, 10))
-
-        self.render_devices = []
-
-        for device in self.devices:
-            if device.get("direction") == "Render":
-                display_str = device['name']
-                self.render_devices.append(device)
-                self.output_listbox.insert(tk.END, display_str)
+        self.output_listbox = self._device_list(self.render_devices)
+        ttk.Label(self.dialog, text="Input Device (Capture, optional):").pack()
+        self.input_listbox = self._device_list(self.capture_devices)
 
         # Preselect if editing
-        if rule_data:
-            device_label = (rule_data.get('device') or rule_data.get('name') or rule_data.get('device_name') or '').strip()
-            target_labels = [device_label]
-            # Also try without ' (Default)' to tolerate list changes
-            if device_label.endswith(" (Default)"):
-                target_labels.append(device_label[:-len(" (Default)")])
-
-            # Always clear any accidental selection BEFORE searching
-            self.output_listbox.selection_clear(0, tk.END)
-
-            # Find the best match (case-insensitive) among devices
-            found_index = None
-            device_names_lower = [d['name'].strip().lower() for d in self.render_devices]
-            for t in target_labels:
-                t_lower = t.strip().lower()
-                if not t_lower:
-                    continue
-                try:
-                    found_index = device_names_lower.index(t_lower)
-                    break
-                except ValueError:
-                    pass
-
-            if found_index is not None:
-                self.output_listbox.selection_set(found_index)
-                self.output_listbox.see(found_index)
-
+        if isinstance(rule_data, dict):
+            rule_data = [rule_data]
+        for rule in rule_data or []:
+            if rule.get('direction') == 'Capture':
+                self._preselect(self.input_listbox, self.capture_devices, rule)
+            else:
+                self._preselect(self.output_listbox, self.render_devices, rule)
             # Always prefill the app name if we have it
-            if rule_data.get('app_name'):
-                self.app_var.set(rule_data['app_name'])
+            if rule.get('app_name'):
+                self.app_var.set(rule.get('app_name'))
+            for text, kind in MATCH_CHOICES:
+                if kind == rule.get('match'):
+                    self.match_var.set(text)
                 
         button_frame = ttk.Frame(self.dialog)
         button_frame.pack(pady=10)
@@ -1068,35 +3595,71 @@ class RuleDialog:
         self.dialog.wait_window()
 
          
+    def _device_list(self, devices):
+        frame = ttk.Frame(self.dialog)
+        frame.pack(fill='x', padx=10, pady=2)
+        listbox = tk.Listbox(frame, height=8, exportselection=False, selectmode="browse")
+        scroll_y = ttk.Scrollbar(frame, orient='vertical', command=listbox.yview)
+        listbox.configure(yscrollcommand=scroll_y.set)
+        listbox.pack(side='left', fill='both', expand=True)
+        scroll_y.pack(side='right', fill='y')
+        scroll_x = ttk.Scrollbar(self.dialog, orient='horizontal', command=listbox.xview)
+        listbox.configure(xscrollcommand=scroll_x.set)
+        scroll_x.pack(fill='x', padx=10, pady=(0, 10))
+        for device in devices:
+            listbox.insert(tk.END, device['name'])
+        return listbox
+
+    @staticmethod
+    def _preselect(listbox, devices, rule):
+        device_label = rule_device_label(rule)
+        target_labels = [device_label]
+        # Also try without ' (Default)' to tolerate list changes
+        if device_label.endswith(" (Default)"):
+            target_labels.append(device_label[:-len(" (Default)")])
+
+        # Always clear any accidental selection BEFORE searching
+        listbox.selection_clear(0, tk.END)
+
+        # Find the best match (case-insensitive) among devices
+        device_names_lower = [d['name'].strip().lower() for d in devices]
+        for t in target_labels:
+            t_lower = t.strip().lower()
+            if t_lower in device_names_lower:
+                found_index = device_names_lower.index(t_lower)
+                listbox.selection_set(found_index)
+                listbox.see(found_index)
+                return
+
     def _refresh_apps(self):
-        exe_list = self._get_audio_apps()
-        self.app_combobox.set_completion_list(exe_list)
-        self.apps_status_var.set(f"Found {len(exe_list)} app(s) with audio")
+        # Last known apps first; the live list is merged in as it arrives
+        self.app_combobox.set_completion_list(self.cached_apps)
+        self.apps_status_var.set("Loading apps...")
+        threading.Thread(target=self._refresh_apps_thread, daemon=True).start()
+
+    def _refresh_apps_thread(self):
+        exe_list = self._get_audio_apps(on_batch=lambda batch: self._after(self.app_combobox.add_completions, batch))
+        self._after(self.apps_status_var.set, f"Found {len(exe_list)} app(s) with audio")
 
-    def _get_audio_apps(self):
-        apps = []
+    def _after(self, func, *args):
+        # The dialog may be closed while apps are still streaming in
         try:
-            cmd = [self.eartrumpet_path, '--list-apps']
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            if result.returncode != 0:
-                return apps
-            for line in result.stdout.splitlines():
-                name = line.strip()
-                if name:
-                    apps.append(name)
-            # Deduplicate and sort
-            apps = sorted(set(apps), key=str.lower)
+            self.dialog.after(0, func, *args)
+        except (tk.TclError, RuntimeError):
+            pass
+
+    def _get_audio_apps(self, on_batch=None):
+        apps = set()
+        try:
+            for batch in iter_batches(self.backend.list_apps()):
+                new_apps = [name for name in batch if name not in apps]
+                apps.update(new_apps)
+                if on_batch and new_apps:
+                    on_batch(new_apps)
         except Exception:
             pass
-        return apps
-        
-        
+        # Deduplicate and sort
+        return sorted(apps, key=str.lower)
 
     def center_window(dialog, parent):
         dialog.update_idletasks()
@@ -1116,19 +3679,25 @@ class RuleDialog:
 
   
         output_sel = self.output_listbox.curselection()
-        if not output_sel:
-            messagebox.showerror("Error", "You must select an output (Render) device.", parent=self.dialog)
+        input_sel = self.input_listbox.curselection()
+        if not output_sel and not input_sel:
+            messagebox.showerror("Error", "You must select an output (Render) or input (Capture) device.", parent=self.dialog)
             return
 
-        output_device = self.render_devices[output_sel[0]]
-        output_rule = {
-            'app_name': app_name,
-            'device': output_device['name'],  # the label we pass to EarTrumpet --set
-            'name': output_device['name'],
-            'direction': 'Render'
-        }
+        match = dict(MATCH_CHOICES)[self.match_var.get()]
+        rules = []
+        for selection, devices, direction in ((output_sel, self.render_devices, 'Render'),
+                                              (input_sel, self.capture_devices, 'Capture')):
+            if selection:
+                device = devices[selection[0]]
+                # device is the label we pass to EarTrumpet --set
+                try:
+                    rules.append(Rule(app_name, device['name'], direction, name=device['name'], match=match))
+                except ValueError as e:
+                    messagebox.showerror("Error", f"Invalid pattern:\n{e}", parent=self.dialog)
+                    return
 
-        self.result = output_rule
+        self.result = rules
         self.dialog.destroy()
         
 
@@ -1141,14 +3710,17 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="SmartWindowsAudioProfiles CLI")
     parser.add_argument("profile_name", nargs="?", help="Profile name to activate (uses audio_profiles.json in app directory)")
+    parser.add_argument("--background", action="store_true", help="Run in the background (tray icon) without opening the window")
+    parser.add_argument("--profile-run", action="store_true", help="Profile time and memory of each operation into the profile_runs folder")
     args = parser.parse_args()
+    PROFILER.enabled = args.profile_run
 
     if args.profile_name is not None and not PROFILE_NAME_REGEX.match(args.profile_name):
         print("ERROR: Invalid profile name! Only letters, numbers, and hyphens (-) are allowed. No spaces.")
         sys.exit(1)
 
     if args.profile_name:
-        app = AudioProfileManager()
+        app = AudioProfileManager(headless=True)
         try:
             if not os.path.exists(PROFILE_FILE):
                 print("ERROR: audio_profiles.json not found in the application directory.")
@@ -1157,6 +3729,13 @@ if __name__ == "__main__":
 
             if args.profile_name in app.profiles:
                 applied = app.apply_profile(args.profile_name)
+                if app.last_activation.superseded:
+                    print(f"Profile '{args.profile_name}' superseded by a newer activation ({applied} rule(s) applied).")
+                    sys.exit(4)
+                if app.timed_out_rules:
+                    print(f"ERROR: EarTrumpet timed out on {len(app.timed_out_rules)} rule(s) ({applied} applied): "
+                          + ", ".join(rule.get('app_name', '') for rule in app.timed_out_rules))
+                    sys.exit(3)
                 if applied > 0:
                     print(f"Profile '{args.profile_name}' activated with {applied} rule(s).")
                     sys.exit(0)
@@ -1166,9 +3745,15 @@ if __name__ == "__main__":
             else:
                 print(f"ERROR: Profile '{args.profile_name}' not found in audio_profiles.json.")
                 sys.exit(1)
+        except subprocess.TimeoutExpired as e:
+            print(f"ERROR: EarTrumpet timed out: {e}")
+            sys.exit(3)
         except Exception as e:
             print(f"ERROR: Failed to activate profile '{args.profile_name}': {e}")
             sys.exit(2)
+    elif args.background:
+        app = AudioProfileManager(headless=True)
+        app.run_background()
     else:
         app = AudioProfileManager()
         app.run()
\ No newline at end of file
@@ -0,0 +1,1097 @@
+"""Tk-free code shared by swap.py and swap-cli.py: profile files, locks, routing state, history and profiling."""
+import os
+import sys
+import re
+import json
+import fnmatch
+import mmap
+import struct
+import time
+import queue
+import sqlite3
+import atexit
+import cProfile
+import pstats
+import tracemalloc
+import functools
+import threading
+from datetime import datetime
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def get_base_path():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+
+BASE_DIR_SETTINGS = get_base_path()
+PROFILE_FILE = os.path.join(BASE_DIR_SETTINGS, "audio_profiles.json")
+SETTINGS_FILE = os.path.join(BASE_DIR_SETTINGS, "config.ini")
+STATE_FILE = os.path.join(BASE_DIR_SETTINGS, "swap_state.bin")
+ROUTING_STATE_FILE = os.path.join(BASE_DIR_SETTINGS, "routing_state.json")
+INVENTORY_CACHE_FILE = os.path.join(BASE_DIR_SETTINGS, "device_cache.json")
+PROFILE_RUN_DIR = os.path.join(BASE_DIR_SETTINGS, "profile_runs")
+ROUTING_HISTORY_LIMIT = 10
+HISTORY_FILE = os.path.join(BASE_DIR_SETTINGS, "swap_history.db")
+HISTORY_LIMIT = 5000
+# One activation at a time across processes, newest request wins
+ACTIVATION_LOCK_FILE = os.path.join(BASE_DIR_SETTINGS, "swap_activation.lock")
+ACTIVATION_QUEUE_FILE = os.path.join(BASE_DIR_SETTINGS, "swap_activation.queue")
+LOCK_POLL_INTERVAL = 0.02
+# Seconds to wait for another process reading or writing audio_profiles.json
+PROFILE_LOCK_TIMEOUT = 10.0
+
+PROFILE_NAME_REGEX = re.compile(r'^[A-Za-z0-9-]+$')
+
+
+# Seconds each kind of command may run before it is killed; overridden by the
+# [Timeouts] section of config.ini. 0 disables the timeout. For SoundVolumeView,
+# list_devices covers the /scomma export.
+DEFAULT_TIMEOUTS = {'list_devices': 15.0, 'list_apps': 15.0, 'set': 10.0}
+# Rule outcome for a command killed by its timeout (distinct from applied/failed)
+TIMED_OUT = 'timeout'
+
+
+def read_timeouts(settings):
+    """Return the per-command timeouts from a ConfigParser, None meaning no timeout."""
+    section = settings['Timeouts'] if 'Timeouts' in settings else {}
+    timeouts = {}
+    for kind, default in DEFAULT_TIMEOUTS.items():
+        try:
+            value = float(section.get(kind, default))
+        except ValueError:
+            print(f"Invalid timeout '{section.get(kind)}' for {kind} in config.ini, using {default}s")
+            value = default
+        timeouts[kind] = value if value > 0 else None
+    return timeouts
+
+
+def loads_json(text):
+    # orjson is several times faster on large profile files; the output is the same
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+CONFLICT_POLICIES = ('overwrite', 'skip', 'rename')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+# What may follow a decoded number up to the end of the buffer when the number was cut there
+JSON_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class StreamingJsonReader:
+    """Incremental reader for one JSON document, decoding values as the file is read.
+
+    Only the structure being walked (via iter_object) is tracked; each value is
+    decoded on its own, so memory stays bounded by the largest single profile.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.consumed = 0
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.consumed += len(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise ValueError("Unexpected end of file")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON: expected '{char}' at offset {self.consumed - len(self.buf) + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # A number cut by the end of the buffer (12|34, 1.|5, 2e|3) continues in the next chunk
+            if type(value) in (int, float) and JSON_NUMBER_TAIL.match(self.buf, end) and self._more():
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self):
+        """Yield the keys of the object starting here; the caller must consume each value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Invalid JSON: object keys must be strings")
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError("Invalid JSON: expected ',' or '}'")
+
+
+def iter_profile_file(f, ndjson=False):
+    """Yield (name, profile) pairs from an exported profile file without loading it whole.
+
+    Accepts the usual {"profiles": {...}} file, or NDJSON with one
+    {"name": ..., "rules": [...]} object per line.
+    """
+    if ndjson:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if not isinstance(entry, dict) or not isinstance(entry.get('name'), str):
+                raise ValueError(f"Line {line_no} is not a profile object with a 'name'")
+            name = entry.pop('name')
+            yield name, entry
+        return
+
+    reader = StreamingJsonReader(f)
+    found = False
+    for key in reader.iter_object():
+        if key == 'profiles' and reader.peek() == '{':
+            found = True
+            for name in reader.iter_object():
+                yield name, reader.value()
+        else:
+            reader.value()
+    if not found:
+        raise ValueError("This file does not appear to be a valid exported profile file!")
+
+
+PATTERN_KINDS = ('glob', 'regex')
+PATTERN_KEY_LENGTH = 8
+# Letters that re.IGNORECASE matches to an ASCII letter but str.lower() does not turn into it
+PATTERN_KEY_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's'})
+
+
+def compile_pattern(kind, pattern):
+    """Compile one pattern rule's app_name (a glob or a regex), ValueError if it is unusable.
+
+    Patterns are matched case-insensitively against the whole app name or process path.
+    """
+    source = fnmatch.translate(pattern) if kind == 'glob' else pattern
+    try:
+        regex = re.compile(source, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"invalid pattern '{pattern}': {e}")
+    return regex
+
+
+def pattern_key(kind, pattern):
+    """Literal text (lower-cased, at most PATTERN_KEY_LENGTH chars) in every match of a glob, or ''.
+
+    The key is the end of the longest literal run: patterns usually share a leading folder
+    (D:\\Games\\...) and differ towards the end.
+    """
+    if kind != 'glob':
+        return ''
+    runs = re.split(r'\*|\?|\[!?\]?[^\]]*\]?', pattern)
+    key = max(runs, key=len)[-PATTERN_KEY_LENGTH:].lower()
+    return key if key.isascii() else ''
+
+
+class PatternMatcher:
+    """All pattern rules of a profile, indexed to match many apps in one pass.
+
+    Each glob is keyed by literal text that all its matches contain. An app name or
+    path only tries the globs whose key is one of its substrings (a hash lookup per
+    substring of the key lengths in use), so the cost per app stays flat as patterns are
+    added. Regexes and globs without literal text are always tried. Candidates go latest
+    rule first, so the winner is the rule that would have won had every rule been
+    applied in order.
+    """
+
+    def __init__(self, rules):
+        self.compiled = {}
+        for order, rule in enumerate(rules):
+            kind = rule.get('match')
+            if kind not in PATTERN_KINDS:
+                continue
+            pattern = rule.get('app_name') or ''
+            index, always, lengths = self.compiled.setdefault(rule.get('direction') or 'Render', ({}, [], set()))
+            entry = (order, compile_pattern(kind, pattern), rule)
+            key = pattern_key(kind, pattern)
+            if key:
+                index.setdefault(key, []).append(entry)
+                lengths.add(len(key))
+            else:
+                always.append(entry)
+
+    def __bool__(self):
+        return bool(self.compiled)
+
+    def match(self, targets):
+        """Return {(app, direction): rule} for `targets` [(app, [name, path, ...])]."""
+        found = {}
+        for direction, (index, always, lengths) in self.compiled.items():
+            for app, texts in targets:
+                best = None
+                for text in texts:
+                    lowered = text.translate(PATTERN_KEY_FOLD).lower()
+                    pieces = {lowered[i:i + n] for n in lengths for i in range(len(lowered) - n + 1)}
+                    candidates = list(always)
+                    for piece in pieces:
+                        candidates.extend(index.get(piece, ()))
+                    for order, regex, rule in sorted(candidates, key=lambda entry: -entry[0]):
+                        if best is not None and order <= best[0]:
+                            break
+                        if regex.fullmatch(text):
+                            best = (order, rule)
+                            break
+                if best is not None:
+                    found[(app, direction)] = best[1]
+        return found
+
+
+def app_label_variants(app_name):
+    app = app_name.strip().lower()
+    return {app, app[:-4]} if app.endswith('.exe') else {app}
+
+
+def expand_pattern_rules(rules, targets):
+    """Replace pattern rules by one Rule per matching app in `targets`; exact rules stay as they are.
+
+    An app that an exact rule already routes for a direction is left to that rule.
+    """
+    matcher = PatternMatcher(rules)
+    exact = [rule for rule in rules if not rule.get('match')]
+    if not matcher:
+        return exact
+    taken = set()
+    for rule in exact:
+        for variant in app_label_variants(rule.get('app_name') or ''):
+            taken.add((variant, rule.get('direction') or 'Render'))
+    expanded = []
+    for (app, direction), rule in matcher.match(targets).items():
+        if (app.lower(), direction) not in taken:
+            expanded.append(Rule(app, rule.get('device'), direction, rule.get('device_id'), rule.get('device_name'),
+                                 rule.get('item_id'), rule.get('name')))
+    return exact + expanded
+
+
+class Rule:
+    """One routing rule: route `app_name`'s `direction` audio to the device `label`.
+
+    Strings are interned, so rules over the same apps and devices share them. `label` is
+    the device label passed to EarTrumpet (device, else name, else device_name, resolved
+    once); the stored fields are written back as they were read.
+    """
+
+    __slots__ = ('app_name', 'match', 'label', 'direction', 'device', 'device_id', 'device_name', 'item_id', 'name',
+                 'extra')
+    FIELDS = ('app_name', 'match', 'device', 'device_id', 'device_name', 'item_id', 'name', 'direction')
+    FIELD_SET = frozenset(FIELDS)
+    DIRECTIONS = ('Render', 'Capture')
+
+    def __init__(self, app_name='', device=None, direction='Render', device_id=None, device_name=None, item_id=None,
+                 name=None, match=None, extra=None):
+        intern = sys.intern
+        direction = direction or 'Render'
+        if direction not in self.DIRECTIONS:
+            # Hand-edited files may say 'render' or 'CAPTURE'
+            direction = direction.capitalize()
+        if direction not in self.DIRECTIONS:
+            raise ValueError(f"unknown rule direction '{direction}'")
+        if match is not None:
+            if match not in PATTERN_KINDS:
+                raise ValueError(f"unknown rule match '{match}' (use 'glob' or 'regex')")
+            compile_pattern(match, app_name)
+        # sys.intern also rejects anything but str (TypeError), which from_json relies on
+        self.app_name = intern(app_name)
+        self.match = match
+        self.direction = intern(direction)
+        self.device = device = intern(device) if device is not None else None
+        self.device_id = device_id
+        self.device_name = device_name = intern(device_name) if device_name is not None else None
+        self.item_id = item_id
+        self.name = name = intern(name) if name is not None else None
+        self.extra = extra or None
+        label = device or name or device_name or ''
+        # Already interned unless it had to be stripped
+        self.label = label if label == label.strip() else intern(label.strip())
+
+    @classmethod
+    def from_json(cls, data):
+        """Validate and convert one rule object of audio_profiles.json (ValueError if invalid)."""
+        if isinstance(data, Rule):
+            return data
+        if not isinstance(data, dict):
+            raise ValueError("a rule must be a JSON object")
+        if data.keys() <= cls.FIELD_SET:
+            # The usual case: only known string fields. Non-string values fail in sys.intern
+            # (or the id checks) and are reported by the validating path below
+            device_id = data.get('device_id')
+            item_id = data.get('item_id')
+            if (device_id is None or type(device_id) is str) and (item_id is None or type(item_id) is str):
+                try:
+                    return cls(**data)
+                except TypeError:
+                    pass
+        values = {}
+        extra = None
+        for key, value in data.items():
+            if key in cls.FIELDS:
+                if value is not None and not isinstance(value, str):
+                    raise ValueError(f"rule field '{key}' must be a string")
+                values[key] = value
+            else:
+                extra = extra or {}
+                extra[key] = value
+        return cls(values.get('app_name') or '', values.get('device'), values.get('direction') or 'Render',
+                   values.get('device_id'), values.get('device_name'), values.get('item_id'), values.get('name'),
+                   values.get('match'), extra)
+
+    def to_json(self):
+        data = {}
+        for key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get(self, key, default=None):
+        """Dict-style read access, for code shared with plain rule dicts (rollback routes, imports)."""
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    def __repr__(self):
+        if self.match:
+            return f"Rule({self.app_name!r}, {self.label!r}, {self.direction!r}, match={self.match!r})"
+        return f"Rule({self.app_name!r}, {self.label!r}, {self.direction!r})"
+
+
+def encode_json(obj):
+    """`default=` hook for json/orjson: writes Rule objects in the audio_profiles.json format."""
+    if isinstance(obj, Rule):
+        return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# load_profiles_config stops sharing rules when, after this many, most were distinct
+RULE_CACHE_PROBE = 16384
+RULE_CACHE_MAX_DISTINCT = 0.5
+
+
+def decode_profile(profile, cache=None):
+    """Validate one profile and return a copy whose rules are Rule objects (ValueError if invalid).
+
+    Rules are never modified in place, so identical rule objects may share one Rule:
+    pass the same `cache` dict for every profile of a file.
+    """
+    if not isinstance(profile, dict) or not isinstance(profile.get('rules'), list):
+        raise ValueError("a profile must be an object with a 'rules' list")
+    if cache is None:
+        return dict(profile, rules=[Rule.from_json(rule) for rule in profile['rules']])
+    rules = []
+    fields = Rule.FIELD_SET
+    intern = sys.intern
+    for data in profile['rules']:
+        # Only rules of known string fields are shared. The key holds the interned strings
+        # the Rule keeps anyway, so the cache costs one tuple per distinct rule
+        key = rule = None
+        if type(data) is dict and data.keys() <= fields:
+            try:
+                key = (*data, *map(intern, data.values()))
+                rule = cache.get(key)
+            except TypeError:
+                key = None
+        if rule is None:
+            rule = Rule.from_json(data)
+            if key is not None:
+                cache[key] = rule
+        rules.append(rule)
+    return dict(profile, rules=rules)
+
+
+def load_profiles_config(path):
+    """Read audio_profiles.json into ({'profiles': {name: {'rules': [Rule, ...], ...}}, ...}, invalid).
+
+    A profile that does not decode only sets itself aside: `invalid` maps its name to
+    (profile as read, reason). Write it back with profiles_to_save so it is not lost.
+    Raises ValueError if the file as a whole is not a profile file.
+    """
+    with open(path, 'r') as f:
+        config = loads_json(f.read())
+    if not isinstance(config, dict) or 'profiles' not in config or not isinstance(config['profiles'], dict):
+        raise ValueError("This file does not appear to be a valid exported profile file!")
+    profiles = {}
+    invalid = {}
+    cache = {}
+    decoded = 0
+    for name, profile in config['profiles'].items():
+        try:
+            profiles[name] = decode_profile(profile, cache)
+        except ValueError as e:
+            invalid[name] = (profile, str(e))
+            continue
+        if cache is not None:
+            decoded += len(profile['rules'])
+            if decoded >= RULE_CACHE_PROBE and len(cache) > decoded * RULE_CACHE_MAX_DISTINCT:
+                # Rules hardly repeat in this file: a miss costs more than decoding alone
+                cache = None
+    config['profiles'] = profiles
+    return config, invalid
+
+
+def profiles_to_save(profiles, invalid):
+    """`profiles` plus the profiles that did not load, unchanged, for writing audio_profiles.json."""
+    merged = dict(profiles)
+    for name, (profile, _) in invalid.items():
+        merged.setdefault(name, profile)
+    return merged
+
+
+def import_profile_stream(items, existing, policy, progress=None, cancel=None):
+    """Merge (name, profile) pairs against `existing` names using one conflict policy.
+
+    Returns (profiles to add/replace, stats). Renamed profiles get a '-2', '-3', ... suffix.
+    `progress(count)` is called every 100 profiles; `cancel()` returning True stops the import.
+    """
+    taken = set(existing)
+    imported = {}
+    stats = {'imported': 0, 'overwritten': 0, 'skipped': 0, 'renamed': 0, 'invalid': []}
+    for count, (name, profile) in enumerate(items, 1):
+        if cancel and cancel():
+            break
+        if progress and count % 100 == 0:
+            progress(count)
+        try:
+            if not PROFILE_NAME_REGEX.match(name):
+                raise ValueError(name)
+            profile = decode_profile(profile)
+        except ValueError:
+            stats['invalid'].append(name)
+            continue
+        if name in taken:
+            if policy == 'skip':
+                stats['skipped'] += 1
+                continue
+            if policy == 'rename':
+                suffix = 2
+                while f"{name}-{suffix}" in taken:
+                    suffix += 1
+                name = f"{name}-{suffix}"
+                stats['renamed'] += 1
+            elif name in existing:
+                stats['overwritten'] += 1
+        taken.add(name)
+        imported[name] = profile
+        stats['imported'] += 1
+    return imported, stats
+
+
+def write_profile_file(filename, profiles, names, extra=None, ndjson=False):
+    """Write the given profiles one at a time; NDJSON writes one profile object per line."""
+    tmp_path = filename + '.tmp'
+    with open(tmp_path, 'w') as f:
+        if ndjson:
+            for name in names:
+                f.write(json.dumps({"name": name, **profiles[name]}, default=encode_json) + "\n")
+        else:
+            f.write('{\n  "profiles": {')
+            for i, name in enumerate(names):
+                f.write(("," if i else "") + "\n    " + json.dumps(name) + ": " + json.dumps(profiles[name], default=encode_json))
+            f.write("\n  }")
+            for key, value in (extra or {}).items():
+                f.write(",\n  " + json.dumps(key) + ": " + json.dumps(value))
+            f.write("\n}\n")
+    os.replace(tmp_path, filename)
+
+
+def rule_device_label(rule):
+    if isinstance(rule, Rule):
+        return rule.label
+    return (rule.get('device') or rule.get('name') or rule.get('device_name') or '').strip()
+
+
+class FileLock:
+    """Exclusive lock shared by every SWAP process (GUI, `SWAP.exe PROFILE`, swap-cli.py).
+
+    It is held on a separate lock file, so the file it protects can still be replaced atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, timeout=None, abort=None):
+        """Wait for the lock; False after `timeout` seconds or as soon as `abort()` is true."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        f = open(self.path, 'a+b')
+        while True:
+            try:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._file = f
+                return True
+            except OSError:
+                if (deadline is not None and time.monotonic() >= deadline) or (abort is not None and abort()):
+                    f.close()
+                    return False
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is None:
+            return
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def __enter__(self):
+        if not self.acquire(timeout=PROFILE_LOCK_TIMEOUT):
+            raise TimeoutError(f"{os.path.basename(self.path)} is held by another SWAP process")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def profile_lock(config_file):
+    """Lock for reading or replacing audio_profiles.json."""
+    return FileLock(config_file + '.lock')
+
+
+class ActivationQueue:
+    """Latest-wins activation requests, shared by every SWAP process through swap_activation.queue.
+
+    Each request takes the next ticket. An activation only starts, and only goes on to the
+    next app, while its ticket is still the latest: a burst of requests collapses into the
+    last one, and a new request cancels the one in flight.
+    """
+
+    TICKET_WIDTH = 20
+
+    def __init__(self, path=ACTIVATION_QUEUE_FILE):
+        self.path = path
+
+    def latest(self):
+        """Latest ticket, or None if it cannot be read right now."""
+        # Read without the lock: a torn read only happens while a newer ticket is written
+        try:
+            with open(self.path, 'rb') as f:
+                return int(f.read(self.TICKET_WIDTH) or 0)
+        except (OSError, ValueError):
+            return None
+
+    def request(self):
+        """Queue an activation request; returns its cancel event (a QueuedCancel)."""
+        with FileLock(self.path + '.lock'):
+            ticket = (self.latest() or 0) + 1
+            # Rewritten in place: replacing the file fails on Windows while a reader has it open
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                f.write(f"{ticket:0{self.TICKET_WIDTH}d}".encode('ascii'))
+        return QueuedCancel(self, ticket)
+
+
+class QueuedCancel(threading.Event):
+    """Cancel event of one queued activation, also set once a newer request is queued."""
+
+    def __init__(self, queue, ticket):
+        super().__init__()
+        self.queue = queue
+        self.ticket = ticket
+        self.superseded = False
+
+    def is_set(self):
+        if not self.superseded:
+            latest = self.queue.latest()
+            self.superseded = latest is not None and latest != self.ticket
+        return self.superseded or super().is_set()
+
+
+def acquire_activation(cancel_event):
+    """Wait for the activation lock; None if the request was superseded first."""
+    lock = FileLock(ACTIVATION_LOCK_FILE)
+    if not lock.acquire(abort=cancel_event.is_set):
+        return None
+    if cancel_event.is_set():
+        lock.release()
+        return None
+    return lock
+
+
+class RoutingState:
+    """Routes last set by SWAP (app + direction -> device) and a bounded stack of earlier routings.
+
+    EarTrumpet cannot report which device an app currently uses, so only routes that
+    SWAP set itself are known. Shared by every SWAP process through routing_state.json;
+    push_snapshot and pop_rollback re-read the file, so call them under the activation lock.
+    """
+
+    def __init__(self, path=ROUTING_STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.current = {}
+        self.history = []
+        self.load()
+
+    @staticmethod
+    def key(rule):
+        return f"{(rule.get('app_name') or '').strip().lower()}|{rule.get('direction') or 'Render'}"
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.current = data.get('current', {})
+            self.history = data.get('history', [])
+        except (OSError, ValueError, AttributeError):
+            self.current, self.history = {}, []
+
+    def save(self):
+        with self.lock:
+            data = {'current': self.current, 'history': self.history}
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def push_snapshot(self, profile_name):
+        """Remember the routing in effect before `profile_name` is applied."""
+        with self.lock:
+            self.load()
+            self.history.append({'profile': profile_name, 'time': time.time(), 'routes': dict(self.current)})
+            del self.history[:-ROUTING_HISTORY_LIMIT]
+
+    def record(self, rule):
+        with self.lock:
+            self.current[self.key(rule)] = {
+                'app_name': (rule.get('app_name') or '').strip(),
+                'direction': rule.get('direction') or 'Render',
+                'device': rule_device_label(rule),
+                'device_id': rule.get('device_id') or ''
+            }
+
+    def pop_rollback(self):
+        """Pop the latest snapshot; return (profile, routes to re-apply, routes with no earlier device) or None."""
+        with self.lock:
+            self.load()
+            if not self.history:
+                return None
+            entry = self.history.pop()
+            previous = entry.get('routes', {})
+            changed = [route for key, route in previous.items() if self.current.get(key) != route]
+            unknown = [route for key, route in self.current.items() if key not in previous]
+            return entry.get('profile'), changed, unknown
+
+
+def rule_outcome(applied):
+    if applied is True:
+        return 'applied'
+    return 'timeout' if applied == TIMED_OUT else 'failed'
+
+
+class ActivationHistory:
+    """Rolling SQLite log of activations and per-rule outcomes, shared by every SWAP process.
+
+    record() only queues the entry; a background thread writes it, so logging never
+    adds to activation latency. Only the last HISTORY_LIMIT activations are kept.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS activations (
+            id INTEGER PRIMARY KEY, started REAL, profile TEXT, source TEXT,
+            duration REAL, applied INTEGER, total INTEGER);
+        CREATE TABLE IF NOT EXISTS rule_results (
+            activation_id INTEGER, app TEXT, device TEXT, direction TEXT,
+            outcome TEXT, duration REAL);
+        CREATE INDEX IF NOT EXISTS rule_results_activation ON rule_results (activation_id);
+    """
+
+    def __init__(self, path=HISTORY_FILE, limit=HISTORY_LIMIT):
+        self.path = path
+        self.limit = limit
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, profile_name, source, started, duration, results, timings):
+        """Queue one activation: results are [(rule, outcome)], timings the seconds per rule."""
+        rows = [((rule.get('app_name') or '').strip(), rule_device_label(rule) or '', rule.get('direction') or 'Render',
+                 rule_outcome(applied), elapsed)
+                for (rule, applied), elapsed in zip(results, timings)]
+        applied = sum(1 for _, ok in results if ok is True)
+        self._queue.put((started, profile_name, source, duration, applied, len(results), rows))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout=2.0):
+        """Flush queued entries (bounded wait) and stop the writer."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.executescript(self.SCHEMA)
+        except sqlite3.Error as e:
+            print(f"Activation history disabled: {e}")
+            return
+        stop = False
+        while not stop:
+            entries = [self._queue.get()]
+            # Write whatever else is already queued in the same transaction
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in entries:
+                stop = True
+                entries = [entry for entry in entries if entry is not None]
+            if not entries:
+                continue
+            try:
+                with conn:
+                    for started, profile_name, source, duration, applied, total, rows in entries:
+                        cursor = conn.execute(
+                            "INSERT INTO activations (started, profile, source, duration, applied, total) VALUES (?, ?, ?, ?, ?, ?)",
+                            (started, profile_name, source, duration, applied, total))
+                        conn.executemany(
+                            "INSERT INTO rule_results (activation_id, app, device, direction, outcome, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                            [(cursor.lastrowid,) + row for row in rows])
+                    oldest = cursor.lastrowid - self.limit
+                    if oldest > 0:
+                        conn.execute("DELETE FROM rule_results WHERE activation_id <= ?", (oldest,))
+                        conn.execute("DELETE FROM activations WHERE id <= ?", (oldest,))
+            except sqlite3.Error as e:
+                print(f"Error writing activation history: {e}")
+        conn.close()
+
+
+# swap_state.bin layout (little-endian), read by swap-cli.py:
+#   header, string index (offset, length), UTF-8 string data, profiles sorted by name
+#   (name, first rule, rule count), rules (app, device label, device id, direction code
+#   | match code << 4), devices (label, direction), apps (name). Every string field is
+#   an index into the string table, including the header's soundvolumeview_path.
+STATE_MAGIC = b'SWAP'
+STATE_VERSION = 3
+STATE_HEADER = struct.Struct('<4sHHddqqIIIIII')
+STATE_STRING = struct.Struct('<II')
+STATE_PROFILE = struct.Struct('<III')
+STATE_RULE = struct.Struct('<IIII')
+STATE_DEVICE = struct.Struct('<II')
+STATE_APP = struct.Struct('<I')
+DIRECTIONS = ('Render', 'Capture')
+MATCH_KINDS = (None, 'glob', 'regex')
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+MATCH_CODES = {kind: code for code, kind in enumerate(MATCH_KINDS) if kind}
+
+
+def write_state_snapshot(path, profiles, devices, apps, profiles_stat, valid_for, soundvolumeview_path=''):
+    """Publish profiles, devices and running apps as a compact binary file for swap-cli.py.
+
+    `profiles_stat` is the (mtime_ns, size) of audio_profiles.json matching `profiles`;
+    readers ignore the profile section when the file on disk no longer matches it.
+    `soundvolumeview_path` is the one set in that file ('' if none).
+    Apps are only trusted by readers for `valid_for` seconds after publishing.
+    """
+    strings = {}
+
+    def intern(value):
+        idx = strings.get(value)
+        if idx is None:
+            idx = strings[value] = len(strings)
+        return idx
+
+    svv_idx = intern(soundvolumeview_path)
+
+    profile_rows = []
+    rule_rows = []
+    for name in sorted(profiles, key=lambda n: n.encode('utf-8')):
+        rules = profiles[name].get('rules', [])
+        profile_rows.append((intern(name), len(rule_rows), len(rules)))
+        for rule in rules:
+            label = rule_device_label(rule)
+            rule_rows.append((intern(rule.get('app_name') or ''), intern(label),
+                              intern(rule.get('device_id') or label),
+                              DIRECTION_CODES.get(rule.get('direction') or 'Render', 0)
+                              | MATCH_CODES.get(rule.get('match'), 0) << 4))
+    device_rows = [(intern(d['name']), DIRECTION_CODES.get(d['direction'], 0)) for d in devices]
+    app_rows = [intern(a) for a in sorted(apps)]
+
+    encoded = [value.encode('utf-8') for value in strings]
+    mtime_ns, size = profiles_stat
+    buf = bytearray(STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, 0, time.time(), valid_for, mtime_ns, size,
+                                      len(encoded), len(profile_rows), len(rule_rows), len(device_rows), len(app_rows),
+                                      svv_idx))
+    offset = 0
+    for data in encoded:
+        buf += STATE_STRING.pack(offset, len(data))
+        offset += len(data)
+    buf += b''.join(encoded)
+    for row in profile_rows:
+        buf += STATE_PROFILE.pack(*row)
+    for row in rule_rows:
+        buf += STATE_RULE.pack(*row)
+    for row in device_rows:
+        buf += STATE_DEVICE.pack(*row)
+    for idx in app_rows:
+        buf += STATE_APP.pack(idx)
+
+    # One temporary file per writer, so two publishers never write into the same one
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buf)
+    # Atomic swap; readers keep their mapping of the previous version
+    os.replace(tmp_path, path)
+
+
+class StateSnapshot:
+    """Read-only, memory-mapped view of swap_state.bin as published by a running SWAP GUI.
+
+    Strings are only decoded for the profile that is looked up.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.published_at, self.valid_for, self.profiles_mtime_ns, self.profiles_size,
+         self.n_strings, self.n_profiles, self.n_rules, self.n_devices, self.n_apps,
+         svv_idx) = STATE_HEADER.unpack_from(self._mm, 0)
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            self.close()
+            raise ValueError("Unsupported state snapshot")
+        self._strings_at = STATE_HEADER.size
+        self._data_at = self._strings_at + self.n_strings * STATE_STRING.size
+        last_offset, last_length = STATE_STRING.unpack_from(self._mm, self._data_at - STATE_STRING.size) if self.n_strings else (0, 0)
+        self._profiles_at = self._data_at + last_offset + last_length
+        self._rules_at = self._profiles_at + self.n_profiles * STATE_PROFILE.size
+        self._devices_at = self._rules_at + self.n_rules * STATE_RULE.size
+        self._apps_at = self._devices_at + self.n_devices * STATE_DEVICE.size
+        if self._apps_at + self.n_apps * STATE_APP.size > len(self._mm):
+            self.close()
+            raise ValueError("Truncated state snapshot")
+        self.soundvolumeview_path = self.string(svv_idx) if svv_idx < self.n_strings else ''
+
+    def close(self):
+        self._mm.close()
+
+    def profiles_match(self, profile_file):
+        try:
+            st = os.stat(profile_file)
+        except OSError:
+            return False
+        return (st.st_mtime_ns, st.st_size) == (self.profiles_mtime_ns, self.profiles_size)
+
+    def apps_fresh(self):
+        return time.time() - self.published_at <= self.valid_for
+
+    def _raw(self, idx):
+        offset, length = STATE_STRING.unpack_from(self._mm, self._strings_at + idx * STATE_STRING.size)
+        start = self._data_at + offset
+        return self._mm[start:start + length]
+
+    def string(self, idx):
+        return self._raw(idx).decode('utf-8')
+
+    def profile_rules(self, name):
+        """Return the rules of profile `name` as dicts, or None if it is not in the snapshot."""
+        key = name.encode('utf-8')
+        lo, hi = 0, self.n_profiles
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name_idx, first, count = STATE_PROFILE.unpack_from(self._mm, self._profiles_at + mid * STATE_PROFILE.size)
+            current = self._raw(name_idx)
+            if current == key:
+                rules = []
+                for i in range(first, first + count):
+                    app, label, device_id, direction = STATE_RULE.unpack_from(self._mm, self._rules_at + i * STATE_RULE.size)
+                    rule = {
+                        'app_name': self.string(app),
+                        'device': self.string(label),
+                        'device_id': self.string(device_id),
+                        'direction': DIRECTIONS[direction & 0xF]
+                    }
+                    if direction >> 4:
+                        rule['match'] = MATCH_KINDS[direction >> 4]
+                    rules.append(rule)
+                return rules
+            if current < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def apps(self):
+        return {self.string(STATE_APP.unpack_from(self._mm, self._apps_at + i * STATE_APP.size)[0])
+                for i in range(self.n_apps)}
+
+
+def open_state_snapshot(path=STATE_FILE):
+    try:
+        return StateSnapshot(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+# Lines of the text report: slowest functions, then biggest allocation sites
+PROFILE_REPORT_LINES = 40
+# Call paths below this share of the run are left out of the collapsed stacks
+PROFILE_MIN_SHARE = 1e-4
+
+
+def collapsed_stacks(stats):
+    """Turn cProfile stats into collapsed stacks: {'a;b;c': microseconds spent in c itself}.
+
+    cProfile records caller/callee pairs rather than whole stacks, so the time of a
+    function is split between its callers in proportion to the time spent under each.
+    This is exact for call trees and an estimate for functions reached along several paths.
+    """
+    entries = stats.stats  # func -> (primitive calls, calls, own time, cumulative time, callers)
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    total = stats.total_tt or 0.0
+    min_seconds = max(total * PROFILE_MIN_SHARE, 1e-6)
+
+    def label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})" if line else name
+
+    stacks = {}
+    pending = [(func, entry[3], (label(func),), frozenset([func])) for func, entry in entries.items() if not entry[4]]
+    while pending:
+        func, seconds, path, seen = pending.pop()
+        _, _, own, cumulative, _ = entries[func]
+        if cumulative <= 0:
+            continue
+        share = min(seconds / cumulative, 1.0)
+        if own * share >= min_seconds:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0.0) + own * share
+        for child, child_cumulative in children.get(func, ()):
+            # Recursion shows up once; its time is already in the outer call
+            if child not in seen and child_cumulative * share >= min_seconds:
+                pending.append((child, child_cumulative * share, path + (label(child),), seen | {child}))
+    return {key: round(seconds * 1e6) for key, seconds in stacks.items() if seconds * 1e6 >= 1}
+
+
+class OperationProfiler:
+    """Runs operations under cProfile and tracemalloc while switched on (--profile-run, Diagnostics in Settings).
+
+    Each run writes <operation>-<time> files to `directory`: .pstats (for pstats or
+    snakeviz), .collapsed (for flamegraph.pl or speedscope) and .txt (slowest functions,
+    biggest allocation sites and peak memory). cProfile only sees the thread that runs
+    the operation, and one operation is profiled at a time; others run as usual.
+    tracemalloc counts allocations from every thread.
+    """
+
+    def __init__(self, directory=PROFILE_RUN_DIR):
+        self.directory = directory
+        self.enabled = False
+        self.lock = threading.Lock()
+
+    def run(self, operation, func, *args, **kwargs):
+        if not self.enabled or not self.lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            t0 = time.perf_counter()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - t0
+                _, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                if started_tracing:
+                    tracemalloc.stop()
+                try:
+                    self._write(operation, profiler, snapshot, peak, elapsed)
+                except Exception as e:
+                    print(f"Could not write the profile of {operation}: {e}")
+        finally:
+            self.lock.release()
+
+    def _write(self, operation, profiler, snapshot, peak, elapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{operation}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(base + '.pstats')
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, micros in sorted(collapsed_stacks(stats).items()):
+                f.write(f"{stack} {micros}\n")
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(f"{operation}: {elapsed * 1000:.1f} ms, peak traced memory {peak / 1024:.0f} KiB\n\n")
+            stats.stream = f
+            stats.sort_stats('cumulative').print_stats(PROFILE_REPORT_LINES)
+            f.write("Biggest allocation sites still held at the end (size, count):\n")
+            for stat in snapshot.statistics('lineno')[:PROFILE_REPORT_LINES]:
+                f.write(f"  {stat}\n")
+        print(f"Profile of {operation} ({elapsed * 1000:.1f} ms) written to {base}.pstats/.collapsed/.txt")
+
+
+PROFILER = OperationProfiler()
+
+
+def profiled(operation):
+    """Decorator: run the function under PROFILER when profiling is switched on."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            return PROFILER.run(operation, func, *args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,92 @@
+"""CronSchedule tests: next_after across month and year ends, Feb 29 and day-of-week rules.
+
+Run with `python -m unittest discover tests` (or pytest).
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import swap
+except ImportError as e:  # swap.py needs tkinter
+    swap = None
+    SWAP_IMPORT_ERROR = str(e)
+else:
+    SWAP_IMPORT_ERROR = None
+
+# 2026-10-19 is a Monday
+MONDAY = datetime(2026, 10, 19, 8, 0)
+
+
+@unittest.skipIf(swap is None, f"swap.py cannot be imported here: {SWAP_IMPORT_ERROR}")
+class NextAfterTest(unittest.TestCase):
+
+    def next_after(self, expr, dt):
+        return swap.CronSchedule(expr).next_after(dt)
+
+    def test_strictly_after(self):
+        self.assertEqual(self.next_after('0 8 * * *', MONDAY), datetime(2026, 10, 20, 8, 0))
+        self.assertEqual(self.next_after('* * * * *', datetime(2026, 10, 19, 8, 0, 59, 999)),
+                         datetime(2026, 10, 19, 8, 1))
+
+    def test_month_rollover(self):
+        self.assertEqual(self.next_after('0 0 * * *', datetime(2026, 1, 31, 23, 59)), datetime(2026, 2, 1, 0, 0))
+        self.assertEqual(self.next_after('30 6 1 * *', datetime(2026, 4, 30, 12, 0)), datetime(2026, 5, 1, 6, 30))
+        # Day 31 skips the shorter months
+        self.assertEqual(self.next_after('0 0 31 * *', datetime(2026, 1, 31, 0, 0)), datetime(2026, 3, 31, 0, 0))
+
+    def test_year_rollover(self):
+        self.assertEqual(self.next_after('0 0 * * *', datetime(2026, 12, 31, 23, 59)), datetime(2027, 1, 1, 0, 0))
+        self.assertEqual(self.next_after('15 10 * 2 *', datetime(2026, 3, 1, 0, 0)), datetime(2027, 2, 1, 10, 15))
+
+    def test_feb_29_waits_for_a_leap_year(self):
+        self.assertEqual(self.next_after('0 0 29 2 *', datetime(2026, 3, 1, 0, 0)), datetime(2028, 2, 29, 0, 0))
+        self.assertEqual(self.next_after('0 0 29 2 *', datetime(2028, 2, 28, 23, 59)), datetime(2028, 2, 29, 0, 0))
+        self.assertEqual(self.next_after('0 0 29 2 *', datetime(2028, 2, 29, 0, 0)), datetime(2032, 2, 29, 0, 0))
+
+    def test_impossible_date_has_no_next(self):
+        self.assertIsNone(self.next_after('0 0 31 2 *', MONDAY))
+        self.assertIsNone(self.next_after('0 0 31 4,6,9,11 *', MONDAY))
+
+    def test_day_of_week(self):
+        # Weekdays at 9:30, from Friday after 9:30 to Monday
+        self.assertEqual(self.next_after('30 9 * * 1-5', datetime(2026, 10, 23, 10, 0)),
+                         datetime(2026, 10, 26, 9, 30))
+        self.assertEqual(self.next_after('0 12 * * 6', MONDAY), datetime(2026, 10, 24, 12, 0))
+
+    def test_sunday_is_0_or_7(self):
+        sunday = datetime(2026, 10, 25, 12, 0)
+        self.assertEqual(self.next_after('0 12 * * 0', MONDAY), sunday)
+        self.assertEqual(self.next_after('0 12 * * 7', MONDAY), sunday)
+        self.assertEqual(self.next_after('0 12 * * 5-7', datetime(2026, 10, 23, 12, 0)), datetime(2026, 10, 24, 12, 0))
+
+    def test_both_day_fields_restricted_match_either(self):
+        # The 13th or any Friday, as in cron
+        self.assertEqual(self.next_after('0 0 13 * 5', MONDAY), datetime(2026, 10, 23, 0, 0))
+        self.assertEqual(self.next_after('0 0 13 * 5', datetime(2026, 11, 7, 0, 0)), datetime(2026, 11, 13, 0, 0))
+        self.assertEqual(self.next_after('0 0 13 * 5', datetime(2026, 11, 10, 0, 0)), datetime(2026, 11, 13, 0, 0))
+
+    def test_starred_step_day_field_counts_as_unrestricted(self):
+        # Odd days that are also Mondays, not odd days or Mondays
+        self.assertEqual(self.next_after('0 0 */2 * 1', MONDAY), datetime(2026, 11, 9, 0, 0))
+        self.assertEqual(self.next_after('0 0 1-31/2 * 1', MONDAY), datetime(2026, 10, 21, 0, 0))
+
+    def test_steps_ranges_and_lists(self):
+        self.assertEqual(self.next_after('*/15 * * * *', datetime(2026, 10, 19, 8, 50)), datetime(2026, 10, 19, 9, 0))
+        self.assertEqual(self.next_after('10-50/20 * * * *', datetime(2026, 10, 19, 8, 31)),
+                         datetime(2026, 10, 19, 8, 50))
+        self.assertEqual(self.next_after('0 7,19 * * *', datetime(2026, 10, 19, 7, 0)), datetime(2026, 10, 19, 19, 0))
+
+    def test_invalid_expressions(self):
+        for expr in ('', '* * * *', '* * * * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *',
+                     '* * * * 8', '*/0 * * * *', '5-1 * * * *', 'x * * * *'):
+            with self.subTest(expr=expr), self.assertRaises(ValueError):
+                swap.CronSchedule(expr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Pattern rule tests: pattern_key and PatternMatcher against matching every rule in turn.
+
+The index must never hide a rule that compile_pattern would match, so each case is
+checked against a plain scan of all rules (latest matching rule wins).
+Run with `python -m unittest discover tests` (or pytest).
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import swap_common  # noqa: E402
+from swap_common import PatternMatcher, compile_pattern, pattern_key  # noqa: E402
+
+
+def glob(pattern, device='Speakers', direction=None):
+    rule = {'match': 'glob', 'app_name': pattern, 'device': device}
+    if direction:
+        rule['direction'] = direction
+    return rule
+
+
+def regex(pattern, device='Speakers'):
+    return {'match': 'regex', 'app_name': pattern, 'device': device}
+
+
+def scan(rules, targets):
+    """What PatternMatcher.match should return: every rule tried on every text."""
+    found = {}
+    for rule in rules:
+        compiled = compile_pattern(rule['match'], rule['app_name'])
+        direction = rule.get('direction') or 'Render'
+        for app, texts in targets:
+            if any(compiled.fullmatch(text) for text in texts):
+                found[(app, direction)] = rule
+    return found
+
+
+class PatternKeyTest(unittest.TestCase):
+
+    def test_literal_globs(self):
+        self.assertEqual(pattern_key('glob', 'Spotify*'), 'spotify')
+        self.assertEqual(pattern_key('glob', '*.EXE'), '.exe')
+
+    def test_key_is_the_end_of_the_longest_run(self):
+        self.assertEqual(pattern_key('glob', 'D:\\Games\\*\\Launcher.exe'), 'cher.exe')
+        self.assertEqual(len(pattern_key('glob', '*averyveryverylongname*')), swap_common.PATTERN_KEY_LENGTH)
+
+    def test_wildcards_and_sets_are_not_literal(self):
+        self.assertEqual(pattern_key('glob', 'ab?cdef*'), 'cdef')
+        self.assertEqual(pattern_key('glob', 'ab[xyz]cd'), 'ab')
+        self.assertEqual(pattern_key('glob', 'a[!]]bcd'), 'bcd')
+        self.assertEqual(pattern_key('glob', '*'), '')
+        self.assertEqual(pattern_key('glob', '?[ab]*'), '')
+
+    def test_unclosed_bracket(self):
+        # fnmatch takes an unclosed '[' literally; the key only needs to be in every match
+        self.assertEqual(pattern_key('glob', 'abc[def'), 'abc')
+        self.assertEqual(pattern_key('glob', '[abcdef'), '')
+
+    def test_regex_has_no_key(self):
+        self.assertEqual(pattern_key('regex', 'spotify.*'), '')
+        self.assertEqual(pattern_key('regex', ''), '')
+
+    def test_non_ascii_literal_has_no_key(self):
+        self.assertEqual(pattern_key('glob', '*Música*'), '')
+
+
+class PatternMatcherTest(unittest.TestCase):
+
+    def assert_matches(self, rules, targets, expected):
+        found = PatternMatcher(rules).match(targets)
+        self.assertEqual(found, scan(rules, targets))
+        self.assertEqual({key: rule['app_name'] for key, rule in found.items()}, expected)
+
+    def test_empty(self):
+        self.assertFalse(PatternMatcher([{'app_name': 'chrome', 'device': 'Speakers'}]))
+        self.assertTrue(PatternMatcher([glob('*')]))
+
+    def test_case_insensitive(self):
+        rules = [glob('*\\Steam\\*'), glob('SPOTIFY*')]
+        targets = [('steam', ['steam.exe', 'C:\\PROGRAM FILES\\STEAM\\steam.exe']),
+                   ('spotify', ['spotify.exe']),
+                   ('other', ['C:\\Steamy\\other.exe'])]
+        self.assert_matches(rules, targets, {('steam', 'Render'): '*\\Steam\\*',
+                                             ('spotify', 'Render'): 'SPOTIFY*'})
+
+    def test_letters_ignorecase_folds_to_ascii(self):
+        # re.IGNORECASE matches these to 's' and 'i'; the index must still offer the rule
+        rules = [glob('*steam*'), glob('*pipe*')]
+        targets = [('long-s', ['\u017fteam.exe']), ('dotless', ['p\u0131pe.exe']), ('dotted', ['P\u0130PE.EXE'])]
+        self.assert_matches(rules, targets, {('long-s', 'Render'): '*steam*', ('dotless', 'Render'): '*pipe*',
+                                             ('dotted', 'Render'): '*pipe*'})
+
+    def test_unclosed_bracket_matches_literally(self):
+        rules = [glob('game[1*')]
+        targets = [('bracket', ['Game[12.exe']), ('set', ['game1.exe'])]
+        self.assert_matches(rules, targets, {('bracket', 'Render'): 'game[1*'})
+
+    def test_regex_without_key_is_always_tried(self):
+        rules = [glob('spotify*', 'Headphones'), regex('spot.*', 'Speakers')]
+        targets = [('spotify', ['Spotify.exe']), ('spotless', ['spotless.exe']), ('chrome', ['chrome.exe'])]
+        self.assert_matches(rules, targets, {('spotify', 'Render'): 'spot.*', ('spotless', 'Render'): 'spot.*'})
+
+    def test_latest_rule_wins(self):
+        rules = [regex('.*'), glob('*.exe'), glob('chrome*'), glob('*')]
+        self.assert_matches(rules, [('chrome', ['chrome.exe'])], {('chrome', 'Render'): '*'})
+        rules = [glob('*'), regex('.*'), glob('*.exe'), glob('chrome*')]
+        self.assert_matches(rules, [('chrome', ['chrome.exe']), ('obs', ['obs64.exe'])],
+                            {('chrome', 'Render'): 'chrome*', ('obs', 'Render'): '*.exe'})
+
+    def test_later_text_can_match_an_earlier_rule(self):
+        rules = [glob('D:\\Games\\*'), glob('game.exe')]
+        targets = [('game', ['game.exe', 'D:\\Games\\Game\\game.exe'])]
+        self.assert_matches(rules, targets, {('game', 'Render'): 'game.exe'})
+
+    def test_directions_are_separate(self):
+        rules = [glob('discord*', 'Headset', 'Capture'), glob('*.exe', 'Speakers')]
+        targets = [('discord', ['Discord.exe'])]
+        self.assert_matches(rules, targets, {('discord', 'Capture'): 'discord*', ('discord', 'Render'): '*.exe'})
+
+    def test_matches_a_scan_of_every_rule(self):
+        patterns = ['*.exe', 'chrome*', '*chrome*', 'C:\\Program Files\\*', '*\\Discord\\*', 'obs??.exe',
+                    'game[0-9].exe', 'game[!0-9].exe', 'abc[def', '*[]]*', 'steam*', '*Steam\\steam.exe']
+        rules = [glob(pattern, f"Device {i}") for i, pattern in enumerate(patterns)]
+        rules.insert(5, regex(r'(?:discord|slack)\.exe'))
+        names = ['chrome.exe', 'chromedriver.exe', 'obs64.exe', 'obs32', 'game1.exe', 'gameX.exe', 'abc[def',
+                 'x]y', 'Steam.exe', 'discord.exe', 'Slack.exe', 'notepad']
+        paths = ['C:\\Program Files\\Google\\Chrome\\chrome.exe', 'C:\\Users\\me\\Discord\\app.exe',
+                 'D:\\Steam\\steam.exe', '']
+        targets = [(f"{name}|{path}", [name, path] if path else [name]) for name in names for path in paths]
+        found = PatternMatcher(rules).match(targets)
+        self.assertEqual(found, scan(rules, targets))
+        self.assertGreater(len(found), len(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""ProfileSearchIndex tests: narrowing the previous result gives what a fresh search gives.
+
+search() reuses the last matches when the query only extends the last one; each case
+types, deletes and edits queries on one index and compares every answer with a scan
+of all profiles, and with a new index that has never searched.
+Run with `python -m unittest discover tests` (or pytest).
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import swap
+except ImportError as e:  # swap.py needs tkinter
+    swap = None
+    SWAP_IMPORT_ERROR = str(e)
+else:
+    SWAP_IMPORT_ERROR = None
+
+APPS = ['chrome.exe', 'Spotify.exe', 'Discord.exe', 'obs64.exe', 'steam.exe', 'firefox.exe', 'Teams.exe']
+DEVICES = ['Speakers', 'Headset Earphone', 'Headphones', 'Studio Monitors', 'Desk Mic', 'HDMI Display']
+NAMES = ['Gaming', 'Streaming', 'Meetings', 'Music', 'Night', 'Studio', 'Game Night', 'Discord Calls']
+
+
+def make_profiles(count, seed=1):
+    rng = random.Random(seed)
+    profiles = {}
+    for p in range(count):
+        rules = [{'app_name': rng.choice(APPS), 'device': rng.choice(DEVICES)} for _ in range(rng.randint(0, 4))]
+        profiles[f"{rng.choice(NAMES)} {p}"] = {'rules': rules}
+    return profiles
+
+
+@unittest.skipIf(swap is None, f"swap.py cannot be imported here: {SWAP_IMPORT_ERROR}")
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profiles = make_profiles(300)
+        self.index = swap.ProfileSearchIndex(self.profiles)
+
+    def scan(self, query, limit):
+        words = set(swap.PROFILE_WORD_REGEX.findall(query.lower()))
+        if not words:
+            return None
+        matches = [name for name, profile in self.profiles.items()
+                   if all(any(w.startswith(word) for w in swap.profile_words(name, profile)) for word in words)]
+        return matches[:limit], len(matches)
+
+    def assert_queries(self, queries, limit=None):
+        limit = limit or swap.PROFILE_LIST_LIMIT
+        for query in queries:
+            with self.subTest(query=query):
+                expected = self.scan(query, limit)
+                self.assertEqual(self.index.search(query, limit), expected)
+                self.assertEqual(swap.ProfileSearchIndex(self.profiles).search(query, limit), expected)
+
+    def type_and_delete(self, text):
+        typed = [text[:i] for i in range(1, len(text) + 1)]
+        return typed + typed[-2::-1]
+
+    def test_typing_then_deleting(self):
+        self.assert_queries(self.type_and_delete('spotify headset'))
+        self.assert_queries(self.type_and_delete('game night dis'))
+
+    def test_deleting_a_middle_character(self):
+        self.assert_queries(['chrome speakers', 'chome speakers', 'chrome speakers', 'chrome speaker', 'chrome sp'])
+
+    def test_replacing_the_last_word(self):
+        self.assert_queries(['dis hea', 'dis he', 'dis hex', 'dis hd', 'dis h', 'dis'])
+
+    def test_words_in_any_order_and_repeated(self):
+        self.assert_queries(['music stu', 'stu music', 'stu stu music', 'stu', 's s', 's'])
+
+    def test_no_match_then_shorter(self):
+        self.assert_queries(['gamingx', 'gamingxy', 'gaming', 'gam'])
+
+    def test_empty_and_symbol_queries(self):
+        self.assert_queries(['', '  ', '-', 'a', '', 'a-b', 'a b'])
+
+    def test_limit_keeps_profile_order(self):
+        self.assert_queries(['s', 'st', 'e', 'exe'], limit=7)
+
+    def test_add_and_remove_between_searches(self):
+        self.assert_queries(['gam', 'gami'])
+        self.profiles['Gamification'] = {'rules': [{'app_name': 'newapp.exe', 'device': 'Speakers'}]}
+        self.index.add('Gamification', self.profiles['Gamification'])
+        self.assert_queries(['gamif', 'gam', 'newapp'])
+        removed = next(name for name in self.profiles if name.startswith('Gaming'))
+        del self.profiles[removed]
+        self.index.remove(removed)
+        self.assert_queries(['gamif', 'gaming', 'gam'])
+
+    def test_editing_a_profile_keeps_its_position(self):
+        name = list(self.profiles)[10]
+        self.profiles[name] = {'rules': [{'app_name': 'zzapp.exe', 'device': 'Speakers'}]}
+        self.index.add(name, self.profiles[name])
+        self.assert_queries(['zz', 'zzapp speak', 'speak'])
+
+    def test_random_edits(self):
+        rng = random.Random(7)
+        alphabet = 'aeimnorst '
+        query = ''
+        queries = []
+        for _ in range(400):
+            action = rng.random()
+            if action < 0.5 or not query:
+                query += rng.choice(alphabet)
+            elif action < 0.8:
+                query = query[:-1]
+            else:
+                i = rng.randrange(len(query))
+                query = query[:i] + query[i + 1:]
+            queries.append(query)
+        self.assert_queries(queries, limit=20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""StreamingJsonReader tests: values cut by chunk boundaries decode as json.loads does.
+
+Each document is read with every chunk size from 1 up to its length, so every value
+is cut at every position at least once.
+Run with `python -m unittest discover tests` (or pytest).
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from swap_common import StreamingJsonReader, iter_profile_file  # noqa: E402
+
+
+def read_object(text, chunk_size):
+    """The top-level object of `text`, walked key by key with the streaming reader."""
+    reader = StreamingJsonReader(io.StringIO(text), chunk_size)
+    return {key: reader.value() for key in reader.iter_object()}
+
+
+class ChunkBoundaryTest(unittest.TestCase):
+
+    def assert_reads_like_json(self, text):
+        expected = json.loads(text)
+        for chunk_size in range(1, len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(read_object(text, chunk_size), expected)
+
+    def test_numbers(self):
+        self.assert_reads_like_json('{"a": 12345, "b": -0.5, "c": 1.25e-3, "d": 6E+2, "e": 0}')
+
+    def test_number_ends_the_document(self):
+        # Nothing but the closing brace after the number: it is cut by every buffer end
+        self.assert_reads_like_json('{"n":1234.5678e10}')
+        self.assert_reads_like_json('{"n":-98765}')
+
+    def test_strings_with_escapes(self):
+        self.assert_reads_like_json('{"path": "C:\\\\Games\\\\\\"x\\".exe", "name": "M\\u00fasica \\ud83c\\udfb5"}')
+
+    def test_literals_and_nesting(self):
+        self.assert_reads_like_json('{"t": true, "f": false, "n": null, "list": [1, [2.5, {"x": null}], ""], '
+                                    '"empty": {}}')
+
+    def test_whitespace(self):
+        self.assert_reads_like_json('\r\n{ \t"a" :\n 1 ,\r\n "b":[ ]\n}\n')
+
+    def test_empty_object(self):
+        self.assertEqual(read_object('{}', 1), {})
+        self.assertEqual(read_object('  { }  ', 1), {})
+
+    def test_truncated_document(self):
+        for text in ('{"a": 1', '{"a": 1.', '{"a": "x', '{"a": tru', '{"a"', '{'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                read_object(text, 2)
+
+    def test_invalid_separators(self):
+        for text in ('{"a" 1}', '{"a": 1 "b": 2}', '{1: 2}', '["a"]'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                read_object(text, 3)
+
+
+class ProfileFileTest(unittest.TestCase):
+
+    def test_profiles_across_default_chunks(self):
+        # Large enough to cross several 64 KiB buffers, with numbers and strings cut somewhere
+        profiles = {f"Profile {p}": {'rules': [{'app_name': f"app{r}.exe", 'device': f"Device {r}",
+                                                'volume': p * 0.37 + r * 1e-3}
+                                               for r in range(30)]}
+                    for p in range(200)}
+        text = json.dumps({'version': 2, 'profiles': profiles, 'soundvolumeview_path': ''})
+        self.assertGreater(len(text), 3 * (1 << 16))
+        self.assertEqual(dict(iter_profile_file(io.StringIO(text))), profiles)
+
+    def test_ndjson(self):
+        text = '{"name": "A", "rules": []}\n\n{"name": "B", "rules": [{"app_name": "x"}]}\n'
+        self.assertEqual(list(iter_profile_file(io.StringIO(text), ndjson=True)),
+                         [('A', {'rules': []}), ('B', {'rules': [{'app_name': 'x'}]})])
+
+    def test_not_a_profile_file(self):
+        for text in ('{"settings": {}}', '{"profiles": []}'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                list(iter_profile_file(io.StringIO(text)))
+
+
+if __name__ == '__main__':
+    unittest.main()
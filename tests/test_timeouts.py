@@ -0,0 +1,101 @@
+"""Watchdog tests: a hung EarTrumpet/SoundVolumeView is stopped, reported and reaped.
+
+The stand-in (bench/fake_backend.py with FAKE_HANG) sleeps instead of answering and
+writes its pid to FAKE_PID_FILE, so the tests can check that no child outlives the
+timeout. Run with `python -m unittest discover tests` (or pytest).
+"""
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+from sandbox import Sandbox, current_process_name  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+TIMEOUT = 1.0
+# Time allowed on top of TIMEOUT for starting the interpreter and killing the child
+SLACK = 10.0
+EXIT_TIMEOUT = 3
+
+
+@unittest.skipIf(psutil is None, "psutil is not installed")
+@unittest.skipIf(os.name == 'nt', "the stand-in runs under cmd.exe on Windows, so killing it leaves python running")
+class HungBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.box = Sandbox(timeouts={'list_devices': TIMEOUT, 'list_apps': TIMEOUT, 'set': TIMEOUT})
+        self.addCleanup(self.box.cleanup)
+        self.pid_file = self.box.path('fake_pids.txt')
+
+    def hang_env(self, argument):
+        return {'FAKE_HANG': argument, 'FAKE_PID_FILE': self.pid_file}
+
+    def assert_no_stand_in_left(self):
+        with open(self.pid_file) as f:
+            pids = [int(line) for line in f if line.strip()]
+        self.assertTrue(pids, "the stand-in was never started")
+        deadline = time.monotonic() + SLACK
+        alive = pids
+        while alive and time.monotonic() < deadline:
+            alive = [pid for pid in alive
+                     if psutil.pid_exists(pid) and psutil.Process(pid).status() != psutil.STATUS_ZOMBIE]
+            time.sleep(0.05)
+        self.assertEqual(alive, [], "hung stand-in processes were not killed")
+        self.assertEqual(psutil.Process().children(recursive=True), [])
+
+    def import_swap(self):
+        try:
+            return self.box.import_module('swap')
+        except ImportError as e:
+            self.skipTest(f"swap.py cannot be imported here: {e}")
+
+    def test_listing_is_stopped_by_the_watchdog(self):
+        with mock.patch.dict(os.environ, self.hang_env('--list-devices')):
+            swap = self.import_swap()
+            started = time.monotonic()
+            with self.assertRaises(subprocess.TimeoutExpired) as caught:
+                list(swap.iter_eartrumpet_lines(self.box.eartrumpet, '--list-devices', timeout=TIMEOUT))
+        self.assertLess(time.monotonic() - started, TIMEOUT + SLACK)
+        self.assertEqual(caught.exception.timeout, TIMEOUT)
+        self.assert_no_stand_in_left()
+
+    def test_route_command_is_stopped(self):
+        with mock.patch.dict(os.environ, self.hang_env('--set')):
+            swap = self.import_swap()
+            with mock.patch.dict(swap.COMMAND_TIMEOUTS, {'set': TIMEOUT}):
+                started = time.monotonic()
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    swap.run_backend_command([self.box.eartrumpet, '--set', 'chrome', 'Device 00000'])
+        self.assertLess(time.monotonic() - started, TIMEOUT + SLACK)
+        self.assert_no_stand_in_left()
+
+    def test_profile_activation_reports_the_timeout(self):
+        self.box.write_profiles({'Work': {'rules': [{'app_name': 'chrome', 'device': 'Device 00000'}]}})
+        proc = subprocess.run([sys.executable, self.box.path('swap.py'), 'Work'], cwd=self.box.dir,
+                              env=dict(self.box.env, **self.hang_env('--set')), capture_output=True, text=True,
+                              timeout=60)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT, proc.stdout + proc.stderr)
+        self.assertIn("timed out on 1 rule(s)", proc.stdout)
+        self.assert_no_stand_in_left()
+
+    def test_cli_activation_reports_the_timeout(self):
+        app = current_process_name()
+        self.box.write_profiles({'Work': {'rules': [{'app_name': app, 'device': 'Device 00000',
+                                                     'device_id': 'Fake\\Device\\Device 00000\\Render'}]}})
+        proc = self.box.run_cli('Work', env=self.hang_env('/SetAppDefault'), timeout=60)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT, proc.stdout + proc.stderr)
+        self.assertIn("timed out", proc.stdout)
+        self.assert_no_stand_in_left()
+
+
+if __name__ == '__main__':
+    unittest.main()